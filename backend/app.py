@@ -17,26 +17,14 @@ import argparse
 import sys
 from typing import Optional
 
-import requests
-from bs4 import BeautifulSoup
-
 from rag.classifier import classify_claim
 from rag.classifier_web import classify_claim_with_web
+from rag.web_fetch import fetch_page_text
 
 
 def extract_text_from_url(url: str, max_chars: int = 8000) -> str:
-    resp = requests.get(url, timeout=20)
-    resp.raise_for_status()
-
-    html = resp.text
-    soup = BeautifulSoup(html, "html.parser")
-    paragraphs = [p.get_text(" ", strip=True) for p in soup.find_all("p")]
-    text = "\n".join(paragraphs).strip()
-
-    if not text:
-        raise RuntimeError("Não foi possível extrair texto útil da página.")
-
-    return text[:max_chars]
+    # mesmo extrator (e cache em disco) usado para as evidências da web
+    return fetch_page_text(url, timeout=20, max_chars=max_chars)
 
 
 def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
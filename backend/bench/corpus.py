@@ -0,0 +1,73 @@
+# bench/corpus.py
+"""
+Corpora sintéticos no formato do data/seed.csv (title, text, label, source)
+para os benchmarks. A geração é determinística (mesma semente -> mesmo CSV),
+então resultados de commits diferentes são comparáveis.
+"""
+
+from __future__ import annotations
+import os
+import csv
+import random
+from typing import List, Tuple
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+_SUBJECTS = [
+    "O Banco Central", "O governo federal", "A prefeitura de São Paulo", "Cientistas brasileiros",
+    "O Ministério da Saúde", "A seleção brasileira", "O Supremo Tribunal Federal", "A Petrobras",
+    "Pesquisadores da USP", "O Congresso Nacional", "A Anvisa", "O IBGE", "A NASA", "A OMS",
+]
+_VERBS = [
+    "anunciou", "negou", "confirmou", "divulgou", "aprovou", "suspendeu", "investigou",
+    "descobriu", "adiou", "publicou", "reduziu", "ampliou",
+]
+_OBJECTS = [
+    "a taxa de juros", "uma nova vacina", "o reajuste do salário mínimo", "a reforma tributária",
+    "uma espécie de dinossauro", "o racionamento de energia", "a vacinação em massa",
+    "o preço dos combustíveis", "um novo concurso público", "a cura de uma doença rara",
+    "a privatização dos Correios", "o fim do horário de verão", "o aumento do desmatamento",
+]
+_DETAILS = [
+    "segundo relatório oficial", "de acordo com fontes anônimas", "após reunião extraordinária",
+    "em nota à imprensa", "conforme dados preliminares", "sem apresentar provas",
+    "em mensagem que circula nas redes sociais", "durante coletiva nesta segunda-feira",
+]
+_SOURCES = [
+    "https://g1.globo.com", "https://folha.uol.com.br", "https://agenciabrasil.ebc.com.br",
+    "https://boatos.exemplo", "https://whatsapp.exemplo", "https://blog-viral.exemplo",
+]
+
+
+def _sentence(rng: random.Random) -> str:
+    return f"{rng.choice(_SUBJECTS)} {rng.choice(_VERBS)} {rng.choice(_OBJECTS)} {rng.choice(_DETAILS)}."
+
+
+def make_document(rng: random.Random, i: int) -> Tuple[str, str, str, str]:
+    sentences = [_sentence(rng) for _ in range(rng.randint(2, 6))]
+    label = "FALSA" if rng.random() < 0.5 else "VERDADEIRA"
+    source = rng.choice(_SOURCES[3:] if label == "FALSA" else _SOURCES[:3])
+    title = f"{sentences[0][:60].rstrip('.')} #{i}"
+    return title, " ".join(sentences), label, f"{source}/noticia/{i}"
+
+
+def write_corpus(path: str, n_docs: int, seed: int = 42) -> str:
+    """Gera (se ainda não existir) um CSV com `n_docs` notícias sintéticas."""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    rng = random.Random(seed)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["title", "text", "label", "source"])
+        for i in range(n_docs):
+            w.writerow(make_document(rng, i))
+    os.replace(tmp, path)
+    return path
+
+
+def make_claims(n: int, seed: int = 7) -> List[str]:
+    """Enunciados de consulta (distintos entre si, para não cair no single-flight/cache)."""
+    rng = random.Random(seed)
+    return [f"{_sentence(rng)} ({i})" for i in range(n)]
@@ -0,0 +1,205 @@
+# bench/fake_ollama.py
+"""
+Servidor local que imita a API do Ollama para benchmarks offline.
+
+- /api/embed e /api/embeddings: embeddings determinísticos (soma de
+  vetores por palavra gerados a partir do hash), então textos parecidos
+  ficam próximos e a busca devolve resultados com sentido
+- /api/chat: JSON enlatado no formato dos classificadores, com ou sem
+  streaming (NDJSON), rótulo escolhido pelo hash do prompt
+- /api/generate: só responde (usado no aquecimento da API)
+- Latência configurável por chamada de embedding, por chamada de chat e
+  por token gerado
+
+Uso:
+    python -m bench.fake_ollama --port 11434 --chat-latency-ms 200
+Ou, dentro de um script:
+    server, url = start_fake_ollama(chat_latency_ms=50)
+"""
+
+from __future__ import annotations
+import re
+import json
+import math
+import time
+import socket
+import hashlib
+import argparse
+import threading
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Tuple
+
+EMBED_DIM = 64
+
+
+@lru_cache(maxsize=100_000)
+def _word_vector(word: str, dim: int) -> Tuple[float, ...]:
+    h = hashlib.sha256(word.encode("utf-8")).digest()
+    return tuple((h[i % len(h)] - 127.5) / 127.5 for i in range(dim))
+
+
+def fake_embedding(text: str, dim: int = EMBED_DIM) -> List[float]:
+    """Embedding determinístico e normalizado (bag of words com vetores por hash)."""
+    acc = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()) or [""]:
+        for i, x in enumerate(_word_vector(word, dim)):
+            acc[i] += x
+    norm = math.sqrt(sum(x * x for x in acc)) or 1.0
+    return [x / norm for x in acc]
+
+
+def canned_completion(prompt: str) -> str:
+    """Resposta no formato esperado por rag/classifier.py, estável para o mesmo prompt."""
+    h = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    return json.dumps(
+        {
+            "label": "VERDADEIRA" if h % 2 else "FALSA",
+            "confidence": round(0.5 + (h % 50) / 100, 2),
+            "rationale": "Resposta sintética do servidor de benchmark.",
+            "used_sources": [],
+        },
+        ensure_ascii=False,
+    )
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    # preenchidos por start_fake_ollama
+    embed_latency = 0.0
+    chat_latency = 0.0
+    token_latency = 0.0
+    dim = EMBED_DIM
+    calls: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        # sem Nagle: cabeçalho e corpo saem em escritas separadas e o
+        # ACK atrasado do cliente somaria ~40 ms a cada resposta
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _count(self, name: str) -> None:
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _send_json(self, obj, status: int = 200) -> None:
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/api/tags":
+            self._send_json({"models": [], "calls": dict(self.calls)})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self) -> None:
+        n = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(n) or b"{}")
+
+        if self.path == "/api/embed":
+            self._count("embed")
+            inp = body.get("input", "")
+            texts = [inp] if isinstance(inp, str) else list(inp)
+            time.sleep(self.embed_latency)
+            self._send_json({"embeddings": [fake_embedding(t, self.dim) for t in texts]})
+
+        elif self.path == "/api/embeddings":
+            self._count("embeddings")
+            time.sleep(self.embed_latency)
+            self._send_json({"embedding": fake_embedding(body.get("prompt", ""), self.dim)})
+
+        elif self.path == "/api/chat":
+            self._count("chat")
+            prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+            content = canned_completion(prompt)
+            usage = {"prompt_eval_count": len(prompt) // 4, "eval_count": len(content) // 4}
+            time.sleep(self.chat_latency)
+            if body.get("stream"):
+                self._stream_chat(content, usage)
+            else:
+                time.sleep(self.token_latency * usage["eval_count"])
+                self._send_json({"message": {"role": "assistant", "content": content}, "done": True, **usage})
+
+        elif self.path == "/api/generate":
+            self._count("generate")
+            self._send_json({"response": "", "done": True})
+
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _stream_chat(self, content: str, usage: Dict[str, int]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(obj) -> None:
+            data = (json.dumps(obj) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for i in range(0, len(content), 4):
+            time.sleep(self.token_latency)
+            chunk({"message": {"role": "assistant", "content": content[i : i + 4]}, "done": False})
+        chunk({"message": {"role": "assistant", "content": ""}, "done": True, **usage})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_fake_ollama(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    embed_latency_ms: float = 0.0,
+    chat_latency_ms: float = 0.0,
+    token_latency_ms: float = 0.0,
+    dim: int = EMBED_DIM,
+) -> Tuple[ThreadingHTTPServer, str]:
+    """Sobe o servidor numa thread daemon (port=0 escolhe uma porta livre). Retorna (servidor, url)."""
+    handler = type(
+        "ConfiguredFakeOllama",
+        (FakeOllamaHandler,),
+        {
+            "embed_latency": embed_latency_ms / 1000.0,
+            "chat_latency": chat_latency_ms / 1000.0,
+            "token_latency": token_latency_ms / 1000.0,
+            "dim": dim,
+            "calls": {},
+            "lock": threading.Lock(),
+        },
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor falso do Ollama para benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    parser.add_argument("--token-latency-ms", type=float, default=0.0)
+    parser.add_argument("--dim", type=int, default=EMBED_DIM)
+    args = parser.parse_args()
+
+    server, url = start_fake_ollama(
+        args.host, args.port, args.embed_latency_ms, args.chat_latency_ms, args.token_latency_ms, args.dim
+    )
+    print(f"🧪 Ollama falso ouvindo em {url} (Ctrl+C para sair)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+# bench/run.py
+"""
+Benchmark offline reprodutível do pipeline (sem Ollama real nem rede).
+
+Para cada tamanho de corpus sintético (1k / 10k / 100k):
+1) ingestão completa (ingest.ingest(rebuild=True)) -> documentos/s
+2) latência de build_context (p50/p95/p99) e vazão de build_context_many
+3) classify_claim (threads) e aclassify_claim (asyncio) em vários níveis
+   de concorrência -> vazão e latência p50/p95
+
+O Ollama é substituído por bench/fake_ollama.py (latências configuráveis).
+Cada tamanho roda num subprocesso com CHROMA_DIR temporário, então o
+índice real não é tocado. O resultado vai para bench/results/<data>_<commit>.json
+e é comparado com a execução anterior de mesmos parâmetros.
+
+Uso (a partir de backend/):
+    python -m bench.run                                  # 1k e 10k
+    python -m bench.run --sizes 1k,10k,100k --concurrency 1,4,16
+    python -m bench.run --compare bench/results/A.json bench/results/B.json
+"""
+
+from __future__ import annotations
+import io
+import os
+import sys
+import json
+import glob
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+
+from bench.corpus import SIZES, write_corpus, make_claims
+from bench.fake_ollama import start_fake_ollama
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCH_DIR, ".corpus")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# parâmetros que precisam ser iguais para duas execuções serem comparáveis
+_COMPARABLE = ("sizes", "concurrency", "queries", "claims", "embed_latency_ms",
+               "chat_latency_ms", "token_latency_ms", "llm_slots", "backend")
+
+
+def _pct(lat: List[float]) -> Dict[str, float]:
+    arr = np.asarray(lat, dtype=float) * 1000
+    return {f"p{q}_ms": round(float(np.percentile(arr, q)), 3) for q in (50, 95, 99)}
+
+
+# ---------------- subprocesso (um tamanho de corpus) ----------------
+
+def _bench_classify_sync(claims: List[str], concurrency: int) -> Dict[str, Any]:
+    from rag.classifier import classify_claim
+    from rag.scheduler import PRIORITY_BATCH
+
+    def one(claim: str) -> float:
+        t0 = time.perf_counter()
+        classify_claim(claim, use_cache=False, fast_paths=False, priority=PRIORITY_BATCH)
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        lat = list(pool.map(one, claims))
+    wall = time.perf_counter() - t0
+    return {"claims_per_s": round(len(claims) / wall, 2), **_pct(lat)}
+
+
+async def _bench_classify_async(claims: List[str], concurrency: int) -> Dict[str, Any]:
+    from rag.classifier import aclassify_claim
+    from rag.scheduler import PRIORITY_BATCH
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(claim: str) -> float:
+        async with sem:
+            t0 = time.perf_counter()
+            await aclassify_claim(claim, use_cache=False, fast_paths=False, priority=PRIORITY_BATCH)
+            return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    lat = await asyncio.gather(*(one(c) for c in claims))
+    wall = time.perf_counter() - t0
+    return {"claims_per_s": round(len(claims) / wall, 2), **_pct(lat)}
+
+
+def run_child(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Executado no subprocesso, com OLLAMA_HOST/CHROMA_DIR/SEED_CSV_PATH já no ambiente."""
+    import ingest
+    from rag.retriever import build_context, build_context_many
+    from rag.vectordb import get_collection
+
+    out: Dict[str, Any] = {"size": cfg["size"], "docs": cfg["docs"]}
+
+    # 1) ingestão
+    t0 = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        ingest.ingest(rebuild=True, pdf_root=None)
+    secs = time.perf_counter() - t0
+    out["ingest"] = {
+        "seconds": round(secs, 3),
+        "docs_per_s": round(cfg["docs"] / secs, 1),
+        "indexed": get_collection().count(),
+    }
+
+    # 2) recuperação
+    queries = make_claims(cfg["queries"], seed=1)
+    for q in queries[:5]:
+        build_context(q)
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        build_context(q)
+        lat.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    for i in range(0, len(queries), 32):
+        build_context_many(queries[i : i + 32])
+    many_s = time.perf_counter() - t0
+    out["build_context"] = {**_pct(lat), "many_queries_per_s": round(len(queries) / many_s, 1)}
+
+    # 3) classificação ponta a ponta
+    out["classify"] = {}
+    for c in cfg["concurrency"]:
+        claims = make_claims(cfg["claims"], seed=100 + c)
+        out["classify"][str(c)] = {
+            "sync": _bench_classify_sync(claims, c),
+            "async": asyncio.run(_bench_classify_async([f"{x} async" for x in claims], c)),
+        }
+    return out
+
+
+# ---------------- processo principal ----------------
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, cwd=BENCH_DIR).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _flatten(d: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for k, v in d.items():
+        key = f"{prefix}.{k}" if prefix else str(k)
+        if isinstance(v, dict):
+            flat.update(_flatten(v, key))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            flat[key] = float(v)
+    return flat
+
+
+def compare(prev: Dict[str, Any], cur: Dict[str, Any]) -> None:
+    """Imprime a variação de cada métrica entre duas execuções."""
+    print(f"\n📊 {prev['meta']['commit'] or '?'} -> {cur['meta']['commit'] or '?'}")
+    a = {r["size"]: _flatten(r) for r in prev["results"]}
+    b = {r["size"]: _flatten(r) for r in cur["results"]}
+    for size in b:
+        if size not in a:
+            continue
+        print(f"\n[{size}]")
+        for key, new in b[size].items():
+            old = a[size].get(key)
+            if old is None or key in ("docs", "ingest.indexed"):
+                continue
+            delta = (new - old) / old * 100 if old else 0.0
+            # vazão: maior é melhor; tempos/latências: menor é melhor
+            better = delta > 0 if key.endswith("_per_s") else delta < 0
+            flag = "  " if abs(delta) < 5 else ("✅" if better else "⚠️")
+            print(f"  {flag} {key:<40} {old:>12.3f} -> {new:>12.3f} ({delta:+.1f}%)")
+
+
+def _previous_result(params: Dict[str, Any], exclude: str) -> Dict[str, Any] | None:
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), reverse=True):
+        if os.path.abspath(path) == os.path.abspath(exclude):
+            continue
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if all(data["meta"]["params"].get(k) == params.get(k) for k in _COMPARABLE):
+            return data
+    return None
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark offline de ingestão, recuperação e classificação.")
+    p.add_argument("--sizes", default="1k,10k", help=f"tamanhos de corpus ({', '.join(SIZES)})")
+    p.add_argument("--concurrency", default="1,4,16", help="níveis de concorrência da classificação")
+    p.add_argument("--queries", type=int, default=200, help="consultas para medir build_context")
+    p.add_argument("--claims", type=int, default=64, help="enunciados por nível de concorrência")
+    p.add_argument("--embed-latency-ms", type=float, default=2.0)
+    p.add_argument("--chat-latency-ms", type=float, default=50.0)
+    p.add_argument("--token-latency-ms", type=float, default=0.0)
+    p.add_argument("--llm-slots", type=int, default=4, help="LLM_MAX_CONCURRENCY usado nos subprocessos")
+    p.add_argument("--backend", default=os.getenv("VECTOR_BACKEND", "chroma"), help="chroma | numpy | hnsw")
+    p.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"), help="só compara dois resultados salvos")
+    p.add_argument("--child", help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(json.loads(args.child))))
+        return
+
+    if args.compare:
+        docs = []
+        for path in args.compare:
+            with open(path, encoding="utf-8") as f:
+                docs.append(json.load(f))
+        compare(*docs)
+        return
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        raise SystemExit(f"Tamanhos desconhecidos: {unknown}. Use {list(SIZES)}.")
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    params = {
+        "sizes": sizes, "concurrency": levels, "queries": args.queries, "claims": args.claims,
+        "embed_latency_ms": args.embed_latency_ms, "chat_latency_ms": args.chat_latency_ms,
+        "token_latency_ms": args.token_latency_ms, "llm_slots": args.llm_slots, "backend": args.backend,
+    }
+
+    server, url = start_fake_ollama(
+        embed_latency_ms=args.embed_latency_ms,
+        chat_latency_ms=args.chat_latency_ms,
+        token_latency_ms=args.token_latency_ms,
+    )
+    print(f"🧪 Ollama falso em {url}")
+
+    results = []
+    try:
+        for size in sizes:
+            n_docs = SIZES[size]
+            csv_path = write_corpus(os.path.join(CORPUS_DIR, f"seed_{size}.csv"), n_docs)
+            with tempfile.TemporaryDirectory(prefix=f"bench_{size}_") as tmp:
+                env = dict(
+                    os.environ,
+                    OLLAMA_HOST=url,
+                    CHROMA_DIR=tmp,
+                    SEED_CSV_PATH=csv_path,
+                    COLLECTION_NAME="news",
+                    VECTOR_BACKEND=args.backend,
+                    LLM_MAX_CONCURRENCY=str(args.llm_slots),
+                    # mede o trabalho de verdade, sem caches
+                    EMBED_CACHE_ENABLED="0",
+                    VERDICT_CACHE_ENABLED="0",
+                )
+                cfg = {"size": size, "docs": n_docs, "queries": args.queries,
+                       "claims": args.claims, "concurrency": levels}
+                print(f"⏱️  Corpus {size} ({n_docs} documentos)...")
+                proc = subprocess.run(
+                    [sys.executable, "-m", "bench.run", "--child", json.dumps(cfg)],
+                    env=env, capture_output=True, text=True,
+                    cwd=os.path.dirname(BENCH_DIR),
+                )
+                if proc.returncode != 0:
+                    print(proc.stderr)
+                    raise SystemExit(f"❌ Benchmark do corpus {size} falhou.")
+                res = json.loads(proc.stdout.strip().splitlines()[-1])
+                results.append(res)
+                print(json.dumps(res, indent=2, ensure_ascii=False))
+    finally:
+        server.shutdown()
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    meta = {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}_{commit or 'nogit'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultado salvo em {path}")
+
+    prev = _previous_result(params, exclude=path)
+    if prev is not None:
+        compare(prev, {"meta": meta, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -4,24 +4,58 @@ Avaliação do classificador em lote usando o CSV de seed.
 
 Fluxo:
 1) Lê data/seed.csv (ou outro caminho configurado via SEED_CSV_PATH no .env)
-2) Para cada linha, chama classify_claim(text)
-3) Compara o rótulo previsto com o rótulo real (coluna 'label')
-4) Imprime métricas (precision, recall, f1) por classe e no geral
+2) Recupera o contexto em lotes (build_context_many) e classifica as amostras
+   num pool de workers (--workers), no modo RAG local (--no-web, padrão)
+   ou RAG + DuckDuckGo (--web)
+3) Grava cada linha (previsão, confiança, hits, tempos por etapa) num
+   checkpoint JSONL; se a execução cair, rodar de novo continua de onde parou
+4) Compara o rótulo previsto com o rótulo real (coluna 'label')
+5) Imprime métricas (precision, recall, f1) por classe e no geral,
+   latência p50/p95/p99 e vazão
+
+Uso:
+    python evaluate.py                       # RAG local, retoma o checkpoint
+    python evaluate.py --web --workers 8
+    python evaluate.py --restart             # descarta o checkpoint
+    python evaluate.py --fast-paths          # liga as respostas sem LLM
+
+O CSV avaliado é o mesmo que o ingest.py indexa: com as respostas sem LLM
+ligadas, quase toda amostra encontraria o próprio trecho (atalho pela
+base) ou seria uma amostra de treino do classificador local (pré-filtro)
+e receberia o rótulo guardado. Por isso elas ficam desligadas por
+padrão; o relatório mostra quantas amostras dispensaram o LLM (inclusive
+o plano B do classificador local quando o LLM falha).
+
+Obs.: o número de gerações simultâneas no Ollama continua limitado por
+LLM_MAX_CONCURRENCY (rag/scheduler.py); aumente junto com OLLAMA_NUM_PARALLEL.
 """
 
 import os
+import json
 import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from dotenv import load_dotenv
 from sklearn.metrics import classification_report, confusion_matrix
 
 from rag.classifier import classify_claim
+from rag.classifier_web import classify_claim_with_web
+from rag.retriever import build_context_many
+from rag.scheduler import PRIORITY_BATCH
 
 load_dotenv()
 
 CSV_PATH = os.getenv("SEED_CSV_PATH", "data/seed.csv")
+# enunciados por consulta em lote ao banco vetorial
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "32"))
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "4"))
+EVAL_CHECKPOINT_DIR = os.getenv("EVAL_CHECKPOINT_DIR", "eval_runs")
+MAX_WEB_RESULTS = int(os.getenv("MAX_WEB_RESULTS", "5"))
 
 # mapeamento opcional para normalizar labels
 # (ajuste aqui se seu CSV usa "True"/"False", "real"/"fake", etc.)
@@ -43,7 +77,115 @@ def normalize_label(x: str) -> str:
     return NORMALIZE.get(x, x)
 
 
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def load_checkpoint(path: str) -> dict:
+    """
+    Linhas já avaliadas: (linha, hash do texto) -> registro. Ignora uma
+    última linha truncada e os registros com erro (Ollama fora do ar,
+    JSON inválido...), que são classificados de novo na retomada.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" in rec:
+                continue
+            done[(rec["row"], rec["text_hash"])] = rec
+    return done
+
+
+def _llm_bypass(out: dict) -> str | None:
+    """Qual caminho respondeu sem o LLM (None se o LLM foi chamado)."""
+    debug = out.get("debug", {})
+    if "shortcut" in debug:
+        return "shortcut"
+    if "local_model" in debug:
+        return "local_model_fallback" if debug["local_model"].get("degraded") else "local_model"
+    return None
+
+
+def classify_row(
+    row: int,
+    text: str,
+    true_label: str,
+    ctx,
+    retrieval_s: float,
+    web: bool,
+    fast_paths: bool = False,
+) -> dict:
+    """Classifica uma amostra e monta o registro do checkpoint."""
+    t0 = time.perf_counter()
+    rec = {"row": row, "text_hash": _text_hash(text), "true": true_label, "mode": "web" if web else "rag"}
+    try:
+        # sem cache de veredictos: queremos medir o classificador de fato;
+        # prioridade de lote: a avaliação não passa na frente dos pedidos da API
+        if web:
+            out = classify_claim_with_web(
+                text, max_web_results=MAX_WEB_RESULTS, ctx=ctx, use_cache=False, priority=PRIORITY_BATCH
+            )
+        else:
+            out = classify_claim(text, ctx=ctx, use_cache=False, fast_paths=fast_paths, priority=PRIORITY_BATCH)
+        rec["pred"] = normalize_label(out.get("label", "FALSA"))
+        rec["llm_bypass"] = _llm_bypass(out)
+        rec["confidence"] = out.get("confidence")
+        rec["hits"] = out.get("debug", {}).get("hits")
+        # tempos por etapa do rastro (rag/tracing.py): embed, vector_query, web_search, llm...
+        rec["stages"] = out.get("debug", {}).get("trace", {}).get("stages", {})
+        if "error" in out:
+            # sem veredicto de verdade: fica fora das métricas e volta na retomada
+            rec["pred"] = None
+            rec["error"] = out["error"]
+    except Exception as e:
+        rec["pred"] = None
+        rec["error"] = str(e)
+    classify_s = time.perf_counter() - t0
+    rec["timings"] = {
+        "retrieval": round(retrieval_s, 4),
+        "classify": round(classify_s, 4),
+        "total": round(retrieval_s + classify_s, 4),
+    }
+    return rec
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {}
+    arr = np.asarray(values, dtype=float)
+    return {f"p{q}": float(np.percentile(arr, q)) for q in (50, 95, 99)}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Avalia o classificador no CSV de seed.")
+    g = p.add_mutually_exclusive_group()
+    g.add_argument("--web", dest="web", action="store_true", help="RAG local + busca na web")
+    g.add_argument("--no-web", dest="web", action="store_false", help="apenas RAG local (padrão)")
+    p.set_defaults(web=False)
+    p.add_argument("--workers", type=int, default=EVAL_WORKERS, help="classificações em paralelo")
+    p.add_argument("--checkpoint", default=None, help="arquivo JSONL de resultados (padrão: eval_runs/eval_<modo>.jsonl)")
+    p.add_argument("--restart", action="store_true", help="descarta o checkpoint e avalia tudo de novo")
+    p.add_argument("--limit", type=int, default=None, help="avalia só as N primeiras amostras")
+    p.add_argument(
+        "--fast-paths",
+        action="store_true",
+        help="liga as respostas sem LLM (atalho pela base, pré-filtro local); o CSV avaliado é o indexado e o de treino",
+    )
+    return p.parse_args()
+
+
 def main():
+    args = parse_args()
+    mode = "web" if args.web else "rag"
+    name = f"eval_{mode}_fast" if args.fast_paths else f"eval_{mode}"
+    checkpoint = args.checkpoint or os.path.join(EVAL_CHECKPOINT_DIR, f"{name}.jsonl")
+
     if not os.path.exists(CSV_PATH):
         raise FileNotFoundError(f"Arquivo CSV não encontrado: {CSV_PATH}")
 
@@ -55,42 +197,122 @@ def main():
     # limpa e normaliza
     df = df.dropna(subset=["text", "label"]).reset_index(drop=True)
     df["label"] = df["label"].apply(normalize_label)
+    if args.limit is not None:
+        df = df.head(args.limit)
 
-    print(f"Total de amostras para avaliação: {len(df)}")
-    print("Iniciando avaliação...\n")
+    if args.restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    os.makedirs(os.path.dirname(checkpoint) or ".", exist_ok=True)
+    done = load_checkpoint(checkpoint)
 
-    y_true = []
-    y_pred = []
+    texts = [str(t) for t in df["text"]]
+    labels = list(df["label"])
+    pending = [i for i in range(len(df)) if (i, _text_hash(texts[i])) not in done]
 
+    print(
+        f"Total de amostras para avaliação: {len(df)} (modo: {mode}, workers: {args.workers}, "
+        f"respostas sem LLM: {'ligadas' if args.fast_paths else 'desligadas'})"
+    )
+    if len(pending) < len(df):
+        print(f"♻️ Retomando {checkpoint}: {len(df) - len(pending)} já avaliadas, {len(pending)} restantes")
+    print("Iniciando avaliação...\n")
+
+    results = {
+        row: rec for (row, h), rec in done.items()
+        if row < len(df) and h == _text_hash(texts[row])
+    }
     start = time.time()
 
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        text = str(row["text"])
-        true_label = row["label"]
+    with open(checkpoint, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool, \
+            tqdm(total=len(pending)) as bar:
+        futures = set()
+
+        def drain(block: bool):
+            nonlocal futures
+            if not futures:
+                return
+            finished, futures = wait(futures, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                rec = fut.result()
+                results[rec["row"]] = rec
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                bar.update(1)
+            out.flush()
 
-        try:
-            out = classify_claim(text)
-            pred_label = out.get("label", "FALSA")
-            pred_label = normalize_label(pred_label)
-        except Exception as e:
-            print(f"\n⚠️ Erro ao classificar uma amostra: {e}")
-            pred_label = "FALSA"
+        for b in range(0, len(pending), EVAL_BATCH_SIZE):
+            rows = pending[b : b + EVAL_BATCH_SIZE]
 
-        y_true.append(true_label)
-        y_pred.append(pred_label)
+            # recupera o contexto do bloco inteiro de uma vez
+            t0 = time.perf_counter()
+            try:
+                ctxs = build_context_many([texts[i] for i in rows])
+            except Exception as e:
+                print(f"\n⚠️ Erro na recuperação em lote: {e}")
+                ctxs = [None] * len(rows)
+            retrieval_s = (time.perf_counter() - t0) / len(rows)
+
+            for i, ctx in zip(rows, ctxs):
+                fut = pool.submit(classify_row, i, texts[i], labels[i], ctx, retrieval_s, args.web, args.fast_paths)
+                futures.add(fut)
+
+            # não deixa a recuperação correr muito à frente dos workers
+            while len(futures) > 2 * max(1, args.workers):
+                drain(block=True)
+            drain(block=False)
+
+        while futures:
+            drain(block=True)
 
     elapsed = time.time() - start
 
+    ordered = [results[i] for i in sorted(results)]
+    # amostras com erro não têm veredicto: ficam fora das métricas
+    failed = [r for r in ordered if "error" in r]
+    scored = [r for r in ordered if "error" not in r]
+    y_true = [r["true"] for r in scored]
+    y_pred = [r["pred"] for r in scored]
+
     print("\n===== RELATÓRIO DE CLASSIFICAÇÃO =====\n")
-    print(classification_report(y_true, y_pred, digits=3))
+    if scored:
+        print(classification_report(y_true, y_pred, digits=3, zero_division=0))
+
+        print("===== MATRIZ DE CONFUSÃO =====\n")
+        print(confusion_matrix(y_true, y_pred, labels=["VERDADEIRA", "FALSA"]))
+        print("\nLinhas/colunas na ordem: ['VERDADEIRA', 'FALSA']")
+    else:
+        print("⚠️ Nenhuma amostra classificada sem erro.")
+
+    print("\n===== LATÊNCIA POR AMOSTRA (s) =====\n")
+    for stage in ("retrieval", "classify", "total"):
+        pct = _percentiles([r["timings"][stage] for r in ordered])
+        if pct:
+            print(f"{stage:>12}: " + "  ".join(f"{k}={v:.3f}" for k, v in pct.items()))
 
-    print("===== MATRIZ DE CONFUSÃO =====\n")
-    print(confusion_matrix(y_true, y_pred, labels=["VERDADEIRA", "FALSA"]))
-    print("\nLinhas/colunas na ordem: ['VERDADEIRA', 'FALSA']")
+    # detalhamento de classify pelas etapas do rastro (ms -> s)
+    names = sorted({n for r in ordered for n in r.get("stages", {})})
+    for name in names:
+        pct = _percentiles([r["stages"][name] / 1000 for r in ordered if name in r.get("stages", {})])
+        print(f"{'· ' + name:>12}: " + "  ".join(f"{k}={v:.3f}" for k, v in pct.items()))
 
-    print(f"\nTempo total: {elapsed:.1f} segundos")
-    if len(df) > 0:
-        print(f"Tempo médio por amostra: {elapsed / len(df):.2f} s")
+    bypass = {}
+    for r in scored:
+        if r.get("llm_bypass"):
+            bypass[r["llm_bypass"]] = bypass.get(r["llm_bypass"], 0) + 1
+    n_bypass = sum(bypass.values())
+    detail = ", ".join(f"{k}: {v}" for k, v in sorted(bypass.items()))
+    print(f"\nAmostras respondidas sem o LLM: {n_bypass} de {len(scored)}" + (f" ({detail})" if detail else ""))
+    print(f"Amostras com erro (fora das métricas, refeitas na próxima execução): {len(failed)}")
+    reasons = {}
+    for r in failed:
+        reason = str(r["error"]).splitlines()[0][:120]
+        reasons[reason] = reasons.get(reason, 0) + 1
+    for reason, n in sorted(reasons.items(), key=lambda kv: -kv[1])[:5]:
+        print(f"  {n} x {reason}")
+    print(f"Checkpoint: {checkpoint}")
+    print(f"\nTempo total (esta execução): {elapsed:.1f} segundos")
+    if pending and elapsed > 0:
+        print(f"Vazão: {len(pending) / elapsed:.2f} amostras/s")
 
 
 if __name__ == "__main__":
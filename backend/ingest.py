@@ -1,23 +1,75 @@
 # ingest.py
 """
 Script de ingestão:
-- Lê um CSV com notícias/itens rotulados
+- Lê um CSV com notícias/itens rotulados e os PDFs rotulados pela pasta
+  (Data/noticias_falsas, Data/noticias_verdadeiras; rag/pdf_corpus.py)
 - Gera embeddings via Ollama
-- Indexa tudo no ChromaDB (coleção 'news' por padrão)
+- Indexa tudo no ChromaDB (coleção 'news' por padrão) e no índice
+  lexical BM25 ao lado dele (rag/bm25.py)
+
+Cada notícia é dividida em passagens de algumas frases, com sobreposição
+(rag/chunking.py). Cada passagem é um vetor, com ID "<doc>#p<n>" e o ID
+da notícia em metadata["parent_id"]; a recuperação junta as passagens de
+volta por notícia. Todas as passagens de uma notícia são gravadas no
+mesmo bloco.
+
+Modos:
+- sync (padrão): compara o CSV com o que já está na coleção e só
+  insere/atualiza as linhas novas ou alteradas e remove as que sumiram.
+  Os IDs são estáveis (derivados de fonte + título), e cada bloco de
+  INGEST_CHUNK_SIZE documentos é gravado separadamente: se a execução
+  cair no meio, a próxima recomeça de onde parou, pois os blocos já
+  gravados têm o mesmo content_hash e são ignorados. Uma notícia alterada
+  tem todas as passagens regravadas, e as que sobrarem são removidas.
+  PDFs com mtime/tamanho iguais aos do manifesto nem são abertos; os
+  novos ou alterados têm o texto extraído num pool de processos.
+- rebuild: apaga a coleção e indexa tudo de novo.
+
+A ingestão é um pipeline em streaming (memória constante):
+    leitura do CSV em blocos -> lotes de embedding -> upsert por bloco
+Entre os estágios há uma fila limitada (INGEST_QUEUE_SIZE): se a escrita
+atrasar, o embedding espera, e a leitura só avança quando é consumida.
+Os primeiros blocos já ficam pesquisáveis antes do fim do arquivo.
+
+Uso:
+    python ingest.py
+    python ingest.py --rebuild
+    python ingest.py --no-csv          # só os PDFs (o que veio do CSV fica como está)
+    python ingest.py --no-pdf --pdf-workers 4
 """
 
 import os
+import queue
+import argparse
+import hashlib
+import threading
+from typing import Callable, Dict, List, Any, Iterator, Iterable, Optional
 
 import pandas as pd
 from tqdm import tqdm
 from dotenv import load_dotenv
 
-from rag.vectordb import add_documents, reset_collection
+from rag.chunking import CHUNKER_SIGNATURE, parent_of, split_document
+from rag.embeddings import embed_texts
+from rag.pdf_corpus import PDF_DATA_DIR, PDF_ID_PREFIX, PDF_WORKERS, PdfManifest, iter_pdf_documents
+from rag.vectordb import (
+    upsert_documents,
+    delete_by_ids,
+    get_indexed_hashes,
+    reset_collection,
+    sync_lexical_index,
+)
 
 load_dotenv()
 
 CSV_PATH = os.getenv("SEED_CSV_PATH", "data/seed.csv")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "news")
+# passagens por bloco gravado (cada bloco é um checkpoint)
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "256"))
+# linhas lidas do CSV por vez
+CSV_READ_CHUNK = int(os.getenv("CSV_READ_CHUNK", "2000"))
+# blocos já embutidos aguardando gravação (backpressure entre os estágios)
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "2"))
 
 
 def load_seed_csv(path: str) -> pd.DataFrame:
@@ -43,40 +95,299 @@ def load_seed_csv(path: str) -> pd.DataFrame:
     return df
 
 
-def ingest():
-    print(f"Carregando dataset de: {CSV_PATH}")
-    df = load_seed_csv(CSV_PATH)
-    print(f"Total de linhas: {len(df)}")
+def _clean(value: Any) -> str:
+    return "" if pd.isna(value) else str(value).strip()
 
-    # opcional: limpar coleção antes de reindexar
-    print(f"Limpando coleção '{COLLECTION_NAME}'...")
-    reset_collection(COLLECTION_NAME)
 
-    texts = []
-    metadatas = []
-    ids = []
+def _sha1(*parts: str) -> str:
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def make_doc_id(title: str, source: str, text: str) -> str:
+    """
+    ID estável de um documento: depende da fonte e do título, não da
+    posição da linha no CSV. Sem fonte nem título, usa o próprio texto.
+    """
+    if source or title:
+        return f"doc-{_sha1(source, title)[:16]}"
+    return f"doc-{_sha1(text)[:16]}"
 
-    print("Preparando documentos para indexação...")
-    for i, row in tqdm(df.iterrows(), total=len(df)):
-        text = str(row["text"]).strip()
-        if not text:
-            continue
 
-        texts.append(text)
-        metadatas.append(
-            {
-                "title": str(row.get("title", "")) if not pd.isna(row.get("title", "")) else "",
-                "label": str(row.get("label", "")) if not pd.isna(row.get("label", "")) else "",
-                "source": str(row.get("source", "")) if not pd.isna(row.get("source", "")) else "",
+def content_hash(text: str, meta: Dict[str, str]) -> str:
+    """
+    Hash do conteúdo indexado (texto + metadados) para detectar alterações.
+    Inclui a configuração da divisão em passagens: mudá-la reindexa tudo.
+    """
+    return _sha1(text, meta.get("title", ""), meta.get("label", ""), meta.get("source", ""), CHUNKER_SIGNATURE)
+
+
+def iter_seed_csv(path: str, chunksize: int = CSV_READ_CHUNK) -> Iterator[pd.DataFrame]:
+    """
+    Versão em streaming de load_seed_csv: lê o CSV em blocos de `chunksize`
+    linhas, com a mesma validação e normalização de colunas.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Arquivo CSV não encontrado: {path}")
+
+    for df in pd.read_csv(path, chunksize=chunksize):
+        if "text" not in df.columns:
+            raise ValueError("O CSV precisa ter pelo menos a coluna 'text'.")
+        for col in ["title", "label", "source"]:
+            if col not in df.columns:
+                df[col] = ""
+        yield df.dropna(subset=["text"])
+
+
+def iter_documents(frames: Iterable[pd.DataFrame], seen_ids: set) -> Iterator[Dict[str, Any]]:
+    """
+    Converte as linhas do CSV em {"id", "text", "meta"}, uma por vez.
+    IDs repetidos (mesma fonte e título) recebem sufixo -2, -3, ...
+    na ordem em que aparecem; `seen_ids` acumula os IDs emitidos.
+    """
+    for df in frames:
+        for row in df.to_dict("records"):
+            text = _clean(row["text"])
+            if not text:
+                continue
+
+            meta = {
+                "title": _clean(row.get("title", "")),
+                "label": _clean(row.get("label", "")),
+                "source": _clean(row.get("source", "")),
             }
-        )
-        ids.append(f"doc-{i}")
+            base_id = make_doc_id(meta["title"], meta["source"], text)
+            doc_id, n = base_id, 1
+            while doc_id in seen_ids:
+                n += 1
+                doc_id = f"{base_id}-{n}"
+            seen_ids.add(doc_id)
+
+            meta["content_hash"] = content_hash(text, meta)
+            yield {"id": doc_id, "text": text, "meta": meta}
+
+
+def _batched(
+    items: Iterable[Dict[str, Any]],
+    size: int,
+    key: Optional[Callable[[Dict[str, Any]], str]] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Lotes de `size` itens. Com `key`, itens seguidos de mesma chave nunca
+    são separados (o lote pode passar um pouco de `size`).
+    """
+    batch: List[Dict[str, Any]] = []
+    for item in items:
+        if len(batch) >= size and (key is None or key(item) != key(batch[-1])):
+            yield batch
+            batch = []
+        batch.append(item)
+    if batch:
+        yield batch
+
 
-    print(f"Indexando {len(texts)} documentos no Chroma...")
-    add_documents(texts=texts, metadatas=metadatas, ids=ids, coll_name=COLLECTION_NAME)
+def _parent_key(doc: Dict[str, Any]) -> str:
+    return doc["meta"].get("parent_id") or doc["id"]
 
+
+_DONE = object()
+
+
+def _embed_stage(batches: Iterable[List[Dict[str, Any]]], out: "queue.Queue") -> None:
+    """
+    Estágio de embedding (thread própria): puxa lotes do leitor, gera os
+    vetores e entrega à fila limitada. put() bloqueia se a escrita atrasar.
+    """
+    try:
+        for batch in batches:
+            vectors = embed_texts([d["text"] for d in batch])
+            out.put((batch, vectors))
+    except BaseException as e:  # repassa o erro para a thread de escrita
+        out.put(e)
+        return
+    out.put(_DONE)
+
+
+def run_pipeline(
+    docs: Iterable[Dict[str, Any]],
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    queue_size: int = INGEST_QUEUE_SIZE,
+) -> int:
+    """
+    Embute e grava as passagens em blocos, sobrepondo o embedding do
+    bloco seguinte com a gravação do atual. As passagens de uma mesma
+    notícia ficam no mesmo bloco. Retorna quantas foram gravadas.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    worker = threading.Thread(
+        target=_embed_stage,
+        args=(_batched(docs, max(1, chunk_size), key=_parent_key), q),
+        daemon=True,
+    )
+    worker.start()
+
+    written = 0
+    with tqdm(desc="Indexando", unit="passagem") as bar:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            batch, vectors = item
+            upsert_documents(
+                texts=[d["text"] for d in batch],
+                metadatas=[d["meta"] for d in batch],
+                ids=[d["id"] for d in batch],
+                coll_name=COLLECTION_NAME,
+                embeddings=vectors,
+            )
+            written += len(batch)
+            bar.update(len(batch))
+    worker.join()
+    return written
+
+
+def ingest(
+    rebuild: bool = False,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    csv: bool = True,
+    pdf_root: Optional[str] = PDF_DATA_DIR,
+    pdf_workers: int = PDF_WORKERS,
+):
+    """
+    Sincroniza a coleção com o CSV (csv=True) e com os PDFs em `pdf_root`
+    (None desliga). Só são removidos documentos das fontes lidas nesta execução.
+    """
+    if csv:
+        print(f"Lendo dataset em streaming de: {CSV_PATH}")
+    if pdf_root:
+        print(f"Lendo PDFs de: {pdf_root}")
+    manifest = PdfManifest() if pdf_root else None
+
+    if rebuild:
+        print(f"Limpando coleção '{COLLECTION_NAME}'...")
+        reset_collection(COLLECTION_NAME)
+        if manifest is not None:
+            manifest.clear()
+        indexed: Dict[str, str] = {}
+    else:
+        indexed = get_indexed_hashes(COLLECTION_NAME)
+        print(f"Passagens já indexadas: {len(indexed)}")
+
+    # hash de cada notícia já indexada; "" se as passagens divergem
+    # (gravação interrompida ou índice antigo, sem passagens)
+    parent_hashes: Dict[str, str] = {}
+    for item_id, h in indexed.items():
+        parent = parent_of(item_id)
+        if item_id == parent:
+            h = ""
+        parent_hashes[parent] = h if parent_hashes.get(parent, h) == h else ""
+
+    seen_ids: set = set()
+    changed: set = set()
+    fresh_ids: set = set()
+    stats = {"csv": 0, "pdf_files": 0, "pdf_skipped": 0, "pdf_extracted": 0, "pdf_errors": 0}
+
+    def is_indexed(doc_id: str, h: str) -> bool:
+        return bool(h) and parent_hashes.get(doc_id) == h
+
+    def sources() -> Iterator[Dict[str, Any]]:
+        if csv:
+            for doc in iter_documents(iter_seed_csv(CSV_PATH), seen_ids):
+                stats["csv"] += 1
+                yield doc
+        if pdf_root:
+            yield from iter_pdf_documents(
+                pdf_root, seen_ids, manifest, is_indexed, content_hash, workers=pdf_workers, stats=stats
+            )
+
+    def pending() -> Iterator[Dict[str, Any]]:
+        # só segue adiante o que é novo ou mudou, já dividido em passagens
+        for doc in sources():
+            if parent_hashes.get(doc["id"]) == doc["meta"]["content_hash"]:
+                continue
+            changed.add(doc["id"])
+            for passage in split_document(doc["id"], doc["text"], doc["meta"]):
+                fresh_ids.add(passage["id"])
+                yield passage
+
+    written = run_pipeline(pending(), chunk_size=chunk_size)
+    if manifest is not None:
+        # só depois da gravação: se cair antes, os PDFs são lidos de novo
+        manifest.save()
+
+    def scanned(parent: str) -> bool:
+        # a fonte do documento (CSV ou PDF) foi lida nesta execução?
+        return bool(pdf_root) if parent.startswith(PDF_ID_PREFIX) else csv
+
+    # remoções por último: se cair antes, a próxima execução as refaz
+    to_delete = [
+        i for i in indexed
+        if (parent_of(i) not in seen_ids and scanned(parent_of(i)))
+        or (parent_of(i) in changed and i not in fresh_ids)
+    ]
+    if to_delete:
+        print(f"Removendo {len(to_delete)} passagens antigas ou de notícias que saíram do CSV/PDFs...")
+        delete_by_ids(to_delete, coll_name=COLLECTION_NAME)
+
+    # o índice BM25 acompanha as escritas acima; aqui só completa o que faltar
+    # (ex.: coleção indexada antes de existir o índice lexical)
+    lexical = sync_lexical_index(COLLECTION_NAME)
+    if lexical["added"] or lexical["removed"]:
+        print(f"Índice lexical (BM25): +{lexical['added']} / -{lexical['removed']} passagens.")
+
+    if pdf_root:
+        print(
+            f"PDFs: {stats['pdf_files']} | "
+            f"Sem mudança (não abertos): {stats['pdf_skipped']} | "
+            f"Extraídos: {stats['pdf_extracted']} | "
+            f"Com erro: {stats['pdf_errors']}"
+        )
+    total = stats["csv"] + stats["pdf_files"]
+    print(
+        f"Total (CSV + PDFs): {total} | "
+        f"Novos/alterados: {len(changed)} ({written} passagens) | "
+        f"Inalterados: {total - len(changed) - stats['pdf_errors']} | "
+        f"Passagens removidas: {len(to_delete)}"
+    )
     print("✅ Ingestão concluída com sucesso.")
 
 
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Indexa o CSV de seed e os PDFs rotulados no ChromaDB.")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Apaga a coleção e reindexa tudo (padrão: sincronização incremental).",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=INGEST_CHUNK_SIZE,
+        help=f"Passagens por bloco gravado (padrão: {INGEST_CHUNK_SIZE}).",
+    )
+    parser.add_argument("--no-csv", action="store_true", help="Não lê o CSV de seed.")
+    parser.add_argument("--no-pdf", action="store_true", help="Não lê os PDFs.")
+    parser.add_argument(
+        "--pdf-dir",
+        default=PDF_DATA_DIR,
+        help=f"Pasta com noticias_falsas/ e noticias_verdadeiras/ (padrão: {PDF_DATA_DIR}).",
+    )
+    parser.add_argument(
+        "--pdf-workers",
+        type=int,
+        default=PDF_WORKERS,
+        help=f"Processos para extrair o texto dos PDFs (padrão: {PDF_WORKERS}).",
+    )
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    ingest()
+    args = parse_args()
+    ingest(
+        rebuild=args.rebuild,
+        chunk_size=args.chunk_size,
+        csv=not args.no_csv,
+        pdf_root=None if args.no_pdf else args.pdf_dir,
+        pdf_workers=args.pdf_workers,
+    )
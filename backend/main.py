@@ -1,16 +1,38 @@
+import json
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-import ollama  # 1. Importa a biblioteca do Ollama
-import json    # 2. Importa a biblioteca JSON para processar a resposta
 
-# --- Modelo de Dados (sem mudança) ---
+from rag import service
+
+# --- Modelo de Dados ---
 class NewsItem(BaseModel):
     text: str
+    # "llm" (direto), "rag" (RAG local) ou "web" (RAG + DuckDuckGo)
+    mode: str = service.DEFAULT_MODE
+
+# --- Ciclo de vida: recursos compartilhados criados uma vez por processo ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # abre o índice persistido (sem reingestão), as sessões HTTP e aquece os modelos
+    app.state.vectordb = await service.startup()
+    for info in app.state.vectordb:
+        print(
+            f"Coleção '{info['collection']}': {info['count']} documentos "
+            f"carregados de {info['persist_directory']} em {info['load_seconds']:.3f} s"
+        )
+        if not info["count"]:
+            print("⚠️ Coleção vazia. Rode 'python ingest.py' para indexar o dataset.")
+    yield
+    await service.shutdown()
 
-# --- App FastAPI e CORS (sem mudança) ---
-app = FastAPI()
+
+# --- App FastAPI e CORS ---
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",
@@ -24,26 +46,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- 3. PROMPT DO SISTEMA ---
-# Esta é a instrução principal para o LLM.
-# Pedir para ele responder APENAS com JSON é a parte mais importante.
-SYSTEM_PROMPT = """
-Você é um analista profissional de checagem de fatos.
-Analise cuidadosamente o texto da notícia fornecida e determine sua veracidade.
-
-Regras importantes:
-- Pense passo a passo.
-- NÃO invente fatos; baseie sua resposta apenas em lógica, coerência e conhecimento geral.
-- Responda APENAS em JSON válido.
-
-Formato obrigatório da resposta:
-{
-  "veracidade": "FATO" | "FALSO" | "INCONCLUSIVO",
-  "score": número entre 0.0 e 1.0,
-  "analise": "Explique em uma frase clara o porquê dessa conclusão."
-}
-"""
-
 
 # --- Endpoints da API ---
 
@@ -52,51 +54,82 @@ async def root():
     return {"message": "AletheIA Backend está rodando!"}
 
 
+@app.get("/api/health")
+async def health():
+    return {
+        "status": "ok",
+        "vectordb": app.state.vectordb,
+        "verdict_cache": service.cache_stats(),
+        "scheduler": service.scheduler_stats(),
+        "web_cache": service.web_stats(),
+        "llm_bypass": service.bypass_stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas no formato do Prometheus (duração por etapa do pipeline, fila do LLM, cache)."""
+    return service.metrics_text()
+
+
 @app.post("/api/verify")
 async def verify_news(item: NewsItem):
     """
-    Endpoint principal que agora chama o OLLAMA.
+    Endpoint principal: verifica a notícia no modo pedido (llm, rag ou web).
+    A resposta sempre traz veracidade/score/analise para o frontend.
     """
-    
-    try:
-        # 4. Prepara as mensagens para o LLM
-        messages = [
-            {'role': 'system', 'content': SYSTEM_PROMPT},
-            {'role': 'user', 'content': item.text}
-        ]
-        
-        # 5. Chama o Ollama
-        # Usamos o modelo que você baixou e o 'format='json'' para forçar a saída
-        response = ollama.chat(
-            model='llama3.1:8b',
-            messages=messages,
-            format='json'
-        )
+    if item.mode not in service.MODES:
+        raise HTTPException(status_code=422, detail=f"Modo inválido: {item.mode}. Use um de {service.MODES}.")
 
+    try:
+        return await service.verify(item.text, mode=item.mode)
 
-        # 6. Processa a resposta
-        # A resposta do Ollama é um dicionário, e o conteúdo que queremos é uma string JSON.
-        response_content_string = response['message']['content']
-        
-        # Imprime no terminal do backend para você ver
-        print(f"Resposta bruta do Ollama (string): {response_content_string}") 
-        
-        # Converte a string JSON em um dicionário Python
-        json_response = json.loads(response_content_string)
-        
-        # 7. Retorna o dicionário para o frontend
-        return json_response
-
-    except json.JSONDecodeError as e:
+    except service.VerificationError as e:
         # Erro se o LLM não retornar um JSON válido
-        print(f"Erro ao decodificar JSON do LLM: {e}")
+        print(f"Erro ao processar a resposta do LLM: {e}")
         raise HTTPException(status_code=500, detail="Erro ao processar a resposta do LLM.")
+    except TimeoutError as e:
+        # fila do LLM cheia por mais tempo que LLM_QUEUE_TIMEOUT
+        print(f"Fila do LLM esgotou o prazo: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         # Captura outros erros (ex: Ollama não está rodando)
         print(f"Erro ao chamar Ollama: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# --- Ponto de Entrada (sem mudança) ---
+def _sse(event: str, data) -> str:
+    """Formata um evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse_events(text: str, mode: str):
+    try:
+        async for ev in service.astream_verify(text, mode=mode):
+            name = ev.pop("event")
+            yield _sse(name, ev.get("data", ev))
+    except Exception as e:
+        # a resposta já começou: o erro vai como evento, não como status HTTP
+        print(f"Erro no streaming: {e}")
+        yield _sse("error", {"detail": str(e)})
+
+
+@app.post("/api/verify/stream")
+async def verify_news_stream(item: NewsItem):
+    """
+    Mesma verificação de /api/verify, em Server-Sent Events:
+    label/confidence chegam assim que o modelo os gera, e o evento
+    "result" traz a resposta completa no formato de /api/verify.
+    """
+    if item.mode not in service.MODES:
+        raise HTTPException(status_code=422, detail=f"Modo inválido: {item.mode}. Use um de {service.MODES}.")
+    return StreamingResponse(
+        _sse_events(item.text, item.mode),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Ponto de Entrada ---
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,605 @@
+# rag/ann.py
+"""
+Backends vetoriais locais (em processo), alternativos ao Chroma.
+Escolhidos por VECTOR_BACKEND no .env:
+- "numpy": busca EXATA por cosseno; vetores float32 num arquivo
+  memory-mapped. Ideal para coleções pequenas (até dezenas de milhares).
+- "hnsw": índice aproximado HNSW (pacote opcional `hnswlib`) para
+  coleções grandes.
+
+As coleções imitam o subconjunto da API do Chroma usado no projeto
+(add, upsert, delete, get, peek, count, query), então o resto do código
+(rag/vectordb.py, ingest.py, retriever) não precisa saber qual engine
+está por trás. As distâncias seguem o espaço "cosine" do Chroma:
+distância = 1 - similaridade.
+
+Arquivos em ANN_DIR/<coleção>/:
+- records.sqlite: ids, documentos e metadados (gravados por lote)
+- vectors.f32 (numpy) ou index.bin + pending.log (hnsw); depois de uma
+  compactação, com o número da geração no nome (vectors.2.f32...)
+"""
+
+from __future__ import annotations
+import os
+import json
+import shutil
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHROMA_DIR = os.getenv("CHROMA_DIR", "./db")
+ANN_DIR = os.getenv("ANN_DIR", os.path.join(CHROMA_DIR, "ann"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# vetores no log do HNSW antes de regravar index.bin (ou o tamanho do índice, se maior)
+HNSW_SAVE_EVERY = int(os.getenv("HNSW_SAVE_EVERY", "20000"))
+# compacta quando as lápides passam desta fração dos rótulos (e de um mínimo absoluto)
+ANN_COMPACT_RATIO = float(os.getenv("ANN_COMPACT_RATIO", "0.3"))
+ANN_COMPACT_MIN_DELETED = int(os.getenv("ANN_COMPACT_MIN_DELETED", "1000"))
+
+_ALL_FIELDS = ["documents", "metadatas", "distances"]
+
+
+def _normalize(vectors: Any) -> np.ndarray:
+    """Converte para float32 e normaliza as linhas (cosseno vira produto interno)."""
+    arr = np.asarray(vectors, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return arr / norms
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class _RecordStore:
+    """
+    ids, documentos e metadados em SQLite (records.sqlite), um registro
+    por rótulo. Cada escrita grava só o lote (uma transação); rótulo sem
+    linha é lápide. A tabela `info` guarda dim, total de rótulos e a
+    geração dos arquivos de vetores.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                label INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document TEXT,
+                metadata TEXT
+            );
+            CREATE TABLE IF NOT EXISTS info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def info(self) -> Dict[str, Any]:
+        return {k: json.loads(v) for k, v in self._conn.execute("SELECT key, value FROM info")}
+
+    def rows(self) -> Iterator[tuple]:
+        for label, doc_id, doc, meta in self._conn.execute(
+            "SELECT label, id, document, metadata FROM records ORDER BY label"
+        ):
+            yield label, doc_id, doc, json.loads(meta) if meta is not None else None
+
+    @staticmethod
+    def _encode(rows: List[tuple]) -> List[tuple]:
+        return [
+            (label, doc_id, doc, json.dumps(meta, ensure_ascii=False) if meta is not None else None)
+            for label, doc_id, doc, meta in rows
+        ]
+
+    def _set_info(self, cur: sqlite3.Cursor, info: Dict[str, Any]) -> None:
+        cur.executemany(
+            "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v)) for k, v in info.items()],
+        )
+
+    def write(self, rows: List[tuple], removed: List[int], info: Dict[str, Any]) -> None:
+        """Grava registros novos e remove os rótulos que viraram lápide."""
+        cur = self._conn.cursor()
+        try:
+            cur.executemany("DELETE FROM records WHERE label = ?", [(l,) for l in removed])
+            cur.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)", self._encode(rows))
+            self._set_info(cur, info)
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+
+    def rewrite(self, rows: List[tuple], info: Dict[str, Any]) -> None:
+        """Substitui todos os registros (compactação), numa transação só."""
+        cur = self._conn.cursor()
+        try:
+            cur.execute("DELETE FROM records")
+            cur.executemany("INSERT INTO records VALUES (?, ?, ?, ?)", self._encode(rows))
+            self._set_info(cur, info)
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class _LocalCollection:
+    """
+    Base das coleções locais: guarda ids/documentos/metadados e delega o
+    armazenamento e a busca de vetores às subclasses.
+    Cada registro ocupa um "rótulo" inteiro (posição nas listas).
+
+    Escritas são incrementais (só o lote vai para o disco). Upsert e
+    delete deixam lápides; quando elas passam de ANN_COMPACT_RATIO dos
+    rótulos, compact() regrava vetores e registros com rótulos contíguos
+    numa nova geração de arquivos, trocada na mesma transação do SQLite.
+    """
+
+    backend = ""
+
+    def __init__(self, name: str, root: str = ANN_DIR):
+        self.name = name
+        self.path = os.path.join(root, name)
+        self.dim: Optional[int] = None
+        self._gen = 0
+        self._ids: List[Optional[str]] = []
+        self._docs: List[Optional[str]] = []
+        self._metas: List[Optional[dict]] = []
+        self._pos: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+        self._records = _RecordStore(os.path.join(self.path, "records.sqlite"))
+        self._load_records()
+        self._load_vectors()
+
+    # ---- persistência dos registros ----
+    def _file(self, stem: str, ext: str, gen: Optional[int] = None) -> str:
+        """Arquivo de vetores da geração `gen` (a geração 0 mantém os nomes antigos)."""
+        gen = self._gen if gen is None else gen
+        return os.path.join(self.path, f"{stem}.{ext}" if gen == 0 else f"{stem}.{gen}.{ext}")
+
+    def _migrate_json(self) -> None:
+        """Importa o records.json do formato anterior (uma vez)."""
+        legacy = os.path.join(self.path, "records.json")
+        if not os.path.exists(legacy) or self._records.info():
+            return
+        with open(legacy, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        rows = [
+            (label, doc_id, doc, meta)
+            for label, (doc_id, doc, meta) in enumerate(zip(data["ids"], data["documents"], data["metadatas"]))
+            if doc_id is not None
+        ]
+        self._records.rewrite(rows, {"backend": self.backend, "dim": data.get("dim"), "labels": len(data["ids"]), "gen": 0})
+        os.remove(legacy)
+
+    def _load_records(self) -> None:
+        self._migrate_json()
+        info = self._records.info()
+        self.dim = info.get("dim")
+        self._gen = int(info.get("gen", 0))
+        n = int(info.get("labels", 0))
+        self._ids, self._docs, self._metas = [None] * n, [None] * n, [None] * n
+        for label, doc_id, doc, meta in self._records.rows():
+            self._ids[label], self._docs[label], self._metas[label] = doc_id, doc, meta
+        self._pos = {i: n for n, i in enumerate(self._ids) if i is not None}
+
+    def _info(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "dim": self.dim, "labels": len(self._ids), "gen": self._gen}
+
+    # ---- ganchos das subclasses ----
+    def _load_vectors(self) -> None:
+        """Abre os vetores da geração atual (e descarta o que já estiver aberto)."""
+        raise NotImplementedError
+
+    def _write_vectors(self, labels: List[int], vectors: np.ndarray) -> None:
+        """Grava os vetores de rótulos novos (sempre acrescentados ao final) no disco."""
+        raise NotImplementedError
+
+    def _remove_vectors(self, labels: List[int]) -> None:
+        raise NotImplementedError
+
+    def _read_vectors(self, labels: List[int]) -> np.ndarray:
+        raise NotImplementedError
+
+    def _search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Retorna (rótulos, similaridades), ambos com shape (n_queries, k)."""
+        raise NotImplementedError
+
+    def _build_generation(self, gen: int, vectors: np.ndarray) -> List[str]:
+        """Grava os arquivos da geração `gen` (rótulos 0..n-1) e devolve seus caminhos."""
+        raise NotImplementedError
+
+    def _generation_files(self, gen: int) -> List[str]:
+        raise NotImplementedError
+
+    def _release_vectors(self, save: bool = True) -> None:
+        """Solta arquivos abertos (memmap, índice) antes de trocar de geração ou fechar."""
+
+    # ---- API compatível com Chroma ----
+    def count(self) -> int:
+        return len(self._pos)
+
+    def _write(self, ids, embeddings, documents, metadatas, overwrite: bool) -> None:
+        if embeddings is None:
+            raise ValueError(f"O backend '{self.backend}' exige embeddings prontos.")
+        n = len(ids)
+        documents = documents if documents is not None else [None] * n
+        metadatas = metadatas if metadatas is not None else [None] * n
+        if not (len(embeddings) == len(documents) == len(metadatas) == n):
+            raise ValueError("ids, embeddings, documents e metadatas precisam ter o mesmo tamanho.")
+        if n == 0:
+            return
+        if len(set(ids)) != n:
+            raise ValueError("IDs repetidos na mesma chamada.")
+        vecs = _normalize(embeddings)
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vecs.shape[1])
+            elif vecs.shape[1] != self.dim:
+                raise ValueError(f"Dimensão {vecs.shape[1]} diferente da coleção ({self.dim}).")
+
+            dupes = [i for i in ids if i in self._pos]
+            if dupes and not overwrite:
+                raise ValueError(f"IDs já existentes na coleção: {dupes[:5]}")
+            # upsert: o registro antigo vira lápide e o novo ganha outro rótulo
+            removed = [self._pos[i] for i in dupes]
+            self._tombstone(removed)
+
+            first = len(self._ids)
+            labels = list(range(first, first + n))
+            # vetores primeiro: um rótulo só passa a existir no SQLite depois que o vetor está no disco
+            self._write_vectors(labels, vecs)
+            self._ids.extend(ids)
+            self._docs.extend(documents)
+            self._metas.extend(metadatas)
+            for doc_id, label in zip(ids, labels):
+                self._pos[doc_id] = label
+            self._records.write(list(zip(labels, ids, documents, metadatas)), removed, self._info())
+            self._maybe_compact()
+
+    def _tombstone(self, labels: List[int]) -> None:
+        if not labels:
+            return
+        for label in labels:
+            self._pos.pop(self._ids[label], None)
+            self._ids[label] = None
+            self._docs[label] = None
+            self._metas[label] = None
+        self._remove_vectors(labels)
+
+    def _maybe_compact(self) -> None:
+        deleted = len(self._ids) - len(self._pos)
+        if deleted >= ANN_COMPACT_MIN_DELETED and deleted > ANN_COMPACT_RATIO * len(self._ids):
+            self.compact()
+
+    def compact(self) -> None:
+        """Remove as lápides: regrava vetores e registros com rótulos contíguos."""
+        with self._lock:
+            keep = [l for l, doc_id in enumerate(self._ids) if doc_id is not None]
+            if len(keep) == len(self._ids):
+                return
+            dim = self.dim or 0
+            vectors = self._read_vectors(keep) if keep else np.zeros((0, dim), np.float32)
+            old, gen = self._gen, self._gen + 1
+            self._build_generation(gen, vectors)
+
+            self._ids = [self._ids[l] for l in keep]
+            self._docs = [self._docs[l] for l in keep]
+            self._metas = [self._metas[l] for l in keep]
+            self._pos = {doc_id: n for n, doc_id in enumerate(self._ids)}
+            self._gen = gen
+            # a troca de geração é atômica: vale o que o SQLite disser
+            self._records.rewrite(list(zip(range(len(keep)), self._ids, self._docs, self._metas)), self._info())
+
+            # o que estava aberto é da geração antiga: nada a salvar
+            self._release_vectors(save=False)
+            self._load_vectors()
+            for path in self._generation_files(old):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._release_vectors()
+            self._records.close()
+
+    def add(self, ids, embeddings=None, documents=None, metadatas=None, **_) -> None:
+        self._write(ids, embeddings, documents, metadatas, overwrite=False)
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None, **_) -> None:
+        self._write(ids, embeddings, documents, metadatas, overwrite=True)
+
+    def delete(self, ids=None, **_) -> None:
+        with self._lock:
+            labels = [self._pos[i] for i in ids or [] if i in self._pos]
+            if labels:
+                self._tombstone(labels)
+                self._records.write([], labels, self._info())
+                self._maybe_compact()
+
+    def get(self, ids=None, include=None, limit=None, offset=None, **_) -> Dict[str, Any]:
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            if ids is not None:
+                labels = [self._pos[i] for i in ids if i in self._pos]
+            else:
+                labels = sorted(self._pos.values())
+            start = int(offset or 0)
+            end = start + int(limit) if limit is not None else None
+            labels = labels[start:end]
+
+            out: Dict[str, Any] = {"ids": [self._ids[l] for l in labels]}
+            if "documents" in include:
+                out["documents"] = [self._docs[l] for l in labels]
+            if "metadatas" in include:
+                out["metadatas"] = [self._metas[l] for l in labels]
+            if "embeddings" in include:
+                out["embeddings"] = self._read_vectors(labels) if labels else np.zeros((0, self.dim or 0), np.float32)
+        return out
+
+    def peek(self, limit: int = 10) -> Dict[str, Any]:
+        return self.get(limit=limit, include=["documents", "metadatas", "embeddings"])
+
+    def query(self, query_embeddings, n_results: int = 10, include=None, **_) -> Dict[str, Any]:
+        include = _ALL_FIELDS if include is None else include
+        queries = _normalize(query_embeddings)
+        out: Dict[str, Any] = {"ids": []}
+        for field in _ALL_FIELDS:
+            if field in include:
+                out[field] = []
+
+        with self._lock:
+            k = min(int(n_results), self.count())
+            if k > 0:
+                labels, sims = self._search(queries, k)
+            for qi in range(len(queries)):
+                row_labels = [int(l) for l in labels[qi]] if k > 0 else []
+                row_sims = [float(s) for s in sims[qi]] if k > 0 else []
+                out["ids"].append([self._ids[l] for l in row_labels])
+                if "documents" in out:
+                    out["documents"].append([self._docs[l] for l in row_labels])
+                if "metadatas" in out:
+                    out["metadatas"].append([self._metas[l] for l in row_labels])
+                if "distances" in out:
+                    out["distances"].append([1.0 - s for s in row_sims])
+        return out
+
+
+class NumpyCollection(_LocalCollection):
+    """
+    Busca exata: similaridade = V @ q sobre todos os vetores.
+    Os vetores ficam em vectors.f32 (float32, linha a linha), aberto com
+    np.memmap em modo r+ com capacidade de sobra: lotes novos são escritos
+    no lugar, e o arquivo só cresce (dobrando) quando a capacidade acaba.
+    Lápides ficam mascaradas na busca até a compactação.
+    """
+
+    backend = "numpy"
+
+    @property
+    def _vectors_file(self) -> str:
+        return self._file("vectors", "f32")
+
+    def _generation_files(self, gen: int) -> List[str]:
+        return [self._file("vectors", "f32", gen)]
+
+    def _load_vectors(self) -> None:
+        self._vecs: Optional[np.memmap] = None
+        capacity = 0
+        if self.dim and os.path.exists(self._vectors_file):
+            capacity = os.path.getsize(self._vectors_file) // (4 * self.dim)
+            if capacity < len(self._ids):
+                raise RuntimeError(f"{self._vectors_file} tem {capacity} vetores; os registros pedem {len(self._ids)}.")
+            if capacity:
+                self._vecs = np.memmap(self._vectors_file, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[list(self._pos.values())] = True
+
+    def _release_vectors(self, save: bool = True) -> None:
+        if self._vecs is not None:
+            self._vecs.flush()
+            # solta o memmap antes de mexer no arquivo (necessário no Windows)
+            self._vecs = None
+
+    def _ensure_capacity(self, needed: int) -> None:
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity, 1024)
+        self._release_vectors()
+        with open(self._vectors_file, "ab") as f:
+            f.truncate(capacity * 4 * self.dim)
+        self._vecs = np.memmap(self._vectors_file, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+
+    def _write_vectors(self, labels: List[int], vectors: np.ndarray) -> None:
+        # rótulos novos são sempre acrescentados ao final
+        start, end = labels[0], labels[-1] + 1
+        self._ensure_capacity(end)
+        self._vecs[start:end] = vectors
+        self._vecs.flush()
+        self._alive[start:end] = True
+
+    def _remove_vectors(self, labels: List[int]) -> None:
+        self._alive[labels] = False
+
+    def _read_vectors(self, labels: List[int]) -> np.ndarray:
+        return np.asarray(self._vecs[labels])
+
+    def _search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        n = len(self._ids)
+        sims = queries @ np.asarray(self._vecs[:n]).T
+        sims[:, ~self._alive[:n]] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
+
+    def _build_generation(self, gen: int, vectors: np.ndarray) -> List[str]:
+        path = self._file("vectors", "f32", gen)
+        _atomic_write(path, np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        return [path]
+
+
+class HnswCollection(_LocalCollection):
+    """
+    Busca aproximada com hnswlib (grafo HNSW, espaço "ip" sobre vetores
+    normalizados). Remoções usam mark_deleted; o índice cresce sob demanda.
+
+    Regravar index.bin a cada lote custaria O(N) por escrita, então os
+    vetores novos vão para um log só de acréscimo (pending.log) e o índice
+    só é salvo quando o log passa de max(HNSW_SAVE_EVERY, itens no índice)
+    ou no close(). Ao abrir, o log é reaplicado e as lápides registradas
+    no SQLite são marcadas de novo.
+    """
+
+    backend = "hnsw"
+
+    @property
+    def _index_file(self) -> str:
+        return self._file("index", "bin")
+
+    @property
+    def _log_file(self) -> str:
+        return self._file("pending", "log")
+
+    def _generation_files(self, gen: int) -> List[str]:
+        return [self._file("index", "bin", gen), self._file("pending", "log", gen)]
+
+    def _log_dtype(self) -> np.dtype:
+        return np.dtype([("label", "<i8"), ("vector", "<f4", (self.dim,))])
+
+    def _empty_index(self):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("VECTOR_BACKEND=hnsw requer o pacote 'hnswlib' (pip install hnswlib).") from e
+        return hnswlib.Index(space="ip", dim=self.dim)
+
+    def _new_index(self, capacity: int):
+        index = self._empty_index()
+        index.init_index(max_elements=max(capacity, 1024), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        index.set_ef(HNSW_EF_SEARCH)
+        return index
+
+    def _add_to_index(self, labels: np.ndarray, vectors: np.ndarray) -> None:
+        if self._index is None:
+            self._index = self._new_index(len(labels) * 2)
+        needed = int(labels.max()) + 1
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, self._index.get_max_elements() * 2))
+        self._index.add_items(vectors, labels)
+
+    def _load_vectors(self) -> None:
+        self._index = None
+        self._pending = 0
+        if not self.dim:
+            return
+        if os.path.exists(self._index_file):
+            index = self._empty_index()
+            index.load_index(self._index_file, max_elements=max(len(self._ids), 1024))
+            index.set_ef(HNSW_EF_SEARCH)
+            self._index = index
+        if os.path.exists(self._log_file):
+            dtype = self._log_dtype()
+            # ignora um registro final truncado (queda no meio da escrita)
+            count = os.path.getsize(self._log_file) // dtype.itemsize
+            log = np.fromfile(self._log_file, dtype=dtype, count=count)
+            if len(log):
+                self._add_to_index(log["label"], log["vector"])
+            self._pending = len(log)
+        if self._index is not None:
+            # lápides (e rótulos que não chegaram ao SQLite) não podem aparecer na busca
+            for label in self._index.get_ids_list():
+                if label >= len(self._ids) or self._ids[label] is None:
+                    try:
+                        self._index.mark_deleted(label)
+                    except RuntimeError:
+                        pass  # já marcado
+
+    def _save_index(self) -> None:
+        tmp = self._index_file + ".tmp"
+        self._index.save_index(tmp)
+        os.replace(tmp, self._index_file)
+        # o log pode ser reaplicado sem problema, então só é zerado depois do índice salvo
+        open(self._log_file, "wb").close()
+        self._pending = 0
+
+    def _release_vectors(self, save: bool = True) -> None:
+        if save and self._index is not None and self._pending:
+            self._save_index()
+        self._index = None
+
+    def _write_vectors(self, labels: List[int], vectors: np.ndarray) -> None:
+        log = np.empty(len(labels), dtype=self._log_dtype())
+        log["label"] = labels
+        log["vector"] = vectors
+        with open(self._log_file, "ab") as f:
+            f.write(log.tobytes())
+        self._add_to_index(np.asarray(labels), vectors)
+        self._pending += len(labels)
+        if self._pending >= max(HNSW_SAVE_EVERY, self._index.get_current_count() - self._pending):
+            self._save_index()
+
+    def _remove_vectors(self, labels: List[int]) -> None:
+        for label in labels:
+            self._index.mark_deleted(label)
+
+    def _read_vectors(self, labels: List[int]) -> np.ndarray:
+        return np.asarray(self._index.get_items(labels), dtype=np.float32)
+
+    def _search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        self._index.set_ef(max(HNSW_EF_SEARCH, k))
+        labels, dists = self._index.knn_query(queries, k=k)
+        # no espaço "ip" o hnswlib devolve 1 - produto interno
+        return labels, 1.0 - dists
+
+    def _build_generation(self, gen: int, vectors: np.ndarray) -> List[str]:
+        # índice novo só com os vivos: o grafo fica sem os nós apagados
+        index = self._new_index(len(vectors) * 2)
+        if len(vectors):
+            index.add_items(vectors, np.arange(len(vectors)))
+        path = self._file("index", "bin", gen)
+        index.save_index(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return [path]
+
+
+BACKENDS = {
+    "numpy": NumpyCollection,
+    "hnsw": HnswCollection,
+}
+
+
+def open_collection(name: str, backend: str, root: str = ANN_DIR) -> _LocalCollection:
+    """Abre (ou cria) a coleção local `name` no backend indicado."""
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"VECTOR_BACKEND desconhecido: {backend!r} (use chroma, numpy ou hnsw).")
+    return cls(name, root=root)
+
+
+def drop_collection(name: str, root: str = ANN_DIR) -> None:
+    """Apaga os arquivos de uma coleção local (se existirem)."""
+    shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -0,0 +1,302 @@
+# rag/bm25.py
+"""
+Índice lexical BM25 (índice invertido) ao lado do índice vetorial.
+
+Serve para enunciados ancorados em nomes, siglas, números e datas
+("Selic 0,25 ponto percentual", "COPOM"), que a busca por cosseno
+encontra mal. Não precisa de embedding: a consulta é só SQL.
+
+- Tokenização para português: minúsculas, sem acentos (ç -> c),
+  números com vírgula/ponto preservados ("0,25" == "0.25"), sem stopwords
+- Armazenamento em SQLite em CHROMA_DIR/bm25_<coleção>.sqlite:
+  vocabulário (termo -> id, df), postings (termo, doc, tf) e, por
+  documento, o comprimento e a lista de termos (para remoção)
+- Atualização incremental: add/remove por documento, numa transação por lote
+- search() pontua com BM25 (k1, b) dentro do próprio SQLite; search_many()
+  faz o mesmo para várias consultas num comando só
+"""
+
+from __future__ import annotations
+import os
+import re
+import math
+import array
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHROMA_DIR = os.getenv("CHROMA_DIR", "./db")
+BM25_DIR = os.getenv("BM25_DIR", CHROMA_DIR)
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_TOKEN = re.compile(r"\d+(?:[.,]\d+)*|[a-z]+")
+
+# stopwords do português, já sem acento
+STOPWORDS = frozenset(
+    """
+    a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles
+    depois do dos e ela elas ele eles em entre era eram essa essas esse esses esta estas este estes
+    eu foi foram ha isso isto ja la lhe lhes mais mas me mesmo meu meus minha minhas muito na nas
+    nem no nos nossa nossas nosso nossos num numa o os ou para pela pelas pelo pelos por qual quando
+    que quem se seja sem ser seu seus so sua suas tambem te tem tinha tu tua tuas um uma umas uns
+    voce voces vos nao sao esta estao foi sobre apos ainda
+    """.split()
+)
+
+
+def fold(text: str) -> str:
+    """Minúsculas e sem acentos ("Eleição" -> "eleicao")."""
+    decomposed = unicodedata.normalize("NFKD", (text or "").casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """Termos indexáveis de `text` (sem acento, sem stopwords)."""
+    out = []
+    for tok in _TOKEN.findall(fold(text)):
+        if tok[0].isdigit():
+            out.append(tok.replace(",", "."))
+        elif len(tok) > 1 and tok not in STOPWORDS:
+            out.append(tok)
+    return out
+
+
+class BM25Index:
+    """Índice invertido persistente (SQLite), seguro entre threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS terms (
+                id INTEGER PRIMARY KEY,
+                term TEXT NOT NULL UNIQUE,
+                df INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL UNIQUE,
+                length INTEGER NOT NULL,
+                terms BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term INTEGER NOT NULL,
+                doc INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats (key, value) VALUES ('docs', 0), ('total_length', 0);
+            """
+        )
+        self._conn.commit()
+
+    # ---- escrita ----
+    def _remove(self, cur: sqlite3.Cursor, doc_id: str) -> None:
+        row = cur.execute("SELECT id, length, terms FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return
+        rowid, length, blob = row
+        term_ids = array.array("I", blob).tolist()
+        cur.executemany("DELETE FROM postings WHERE term = ? AND doc = ?", [(t, rowid) for t in term_ids])
+        cur.executemany("UPDATE terms SET df = df - 1 WHERE id = ?", [(t,) for t in term_ids])
+        cur.execute("DELETE FROM docs WHERE id = ?", (rowid,))
+        cur.execute("UPDATE stats SET value = value - 1 WHERE key = 'docs'")
+        cur.execute("UPDATE stats SET value = value - ? WHERE key = 'total_length'", (length,))
+
+    def _term_ids(self, cur: sqlite3.Cursor, terms: Iterable[str]) -> Dict[str, int]:
+        terms = list(terms)
+        cur.executemany("INSERT OR IGNORE INTO terms (term, df) VALUES (?, 0)", [(t,) for t in terms])
+        out: Dict[str, int] = {}
+        for i in range(0, len(terms), 500):
+            chunk = terms[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            out.update(cur.execute(f"SELECT term, id FROM terms WHERE term IN ({marks})", chunk).fetchall())
+        return out
+
+    def upsert(self, ids: List[str], texts: List[str]) -> None:
+        """Indexa (ou reindexa) os documentos; uma transação para o lote todo."""
+        with self._lock:
+            cur = self._conn.cursor()
+            try:
+                for doc_id, text in zip(ids, texts):
+                    self._remove(cur, doc_id)
+                    tokens = tokenize(text)
+                    counts = Counter(tokens)
+                    term_ids = self._term_ids(cur, counts)
+                    ids_arr = array.array("I", (term_ids[t] for t in counts))
+                    cur.execute(
+                        "INSERT INTO docs (doc_id, length, terms) VALUES (?, ?, ?)",
+                        (doc_id, len(tokens), ids_arr.tobytes()),
+                    )
+                    rowid = cur.lastrowid
+                    cur.executemany(
+                        "INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)",
+                        [(term_ids[t], rowid, tf) for t, tf in counts.items()],
+                    )
+                    cur.executemany("UPDATE terms SET df = df + 1 WHERE id = ?", [(t,) for t in ids_arr])
+                    cur.execute("UPDATE stats SET value = value + 1 WHERE key = 'docs'")
+                    cur.execute("UPDATE stats SET value = value + ? WHERE key = 'total_length'", (len(tokens),))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            cur = self._conn.cursor()
+            try:
+                for doc_id in ids:
+                    self._remove(cur, doc_id)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def reset(self) -> None:
+        with self._lock:
+            self._conn.executescript(
+                """
+                DELETE FROM postings;
+                DELETE FROM docs;
+                DELETE FROM terms;
+                UPDATE stats SET value = 0;
+                """
+            )
+            self._conn.commit()
+
+    # ---- leitura ----
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT value FROM stats WHERE key = 'docs'").fetchone()[0])
+
+    def doc_ids(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT doc_id FROM docs")]
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """[(doc_id, score)] dos `top_k` documentos de maior BM25, em ordem decrescente."""
+        return self.search_many([query], top_k)[0]
+
+    def search_many(self, queries: List[str], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        """
+        search() de várias consultas num único comando SQL: os termos de
+        todas são buscados juntos (uma vez cada) e a pontuação sai agrupada
+        por consulta, com os `top_k` melhores de cada uma.
+        """
+        out: List[List[Tuple[str, float]]] = [[] for _ in queries]
+        per_query = [list(dict.fromkeys(tokenize(q))) for q in queries]
+        vocab = list(dict.fromkeys(t for terms in per_query for t in terms))
+        if not vocab or top_k <= 0:
+            return out
+        with self._lock:
+            n_docs, total = (
+                v for _, v in self._conn.execute(
+                    "SELECT key, value FROM stats WHERE key IN ('docs', 'total_length') ORDER BY key"
+                )
+            )
+            if n_docs <= 0:
+                return out
+            found: Dict[str, Tuple[int, int]] = {}
+            for i in range(0, len(vocab), 500):
+                chunk = vocab[i : i + 500]
+                marks = ",".join("?" * len(chunk))
+                for term, tid, df in self._conn.execute(
+                    f"SELECT term, id, df FROM terms WHERE term IN ({marks}) AND df > 0", chunk
+                ):
+                    found[term] = (tid, df)
+            # idf do BM25 (sempre positivo), por (consulta, termo)
+            weights = [
+                (qid, found[t][0], math.log(1.0 + (n_docs - found[t][1] + 0.5) / (found[t][1] + 0.5)))
+                for qid, terms in enumerate(per_query)
+                for t in terms
+                if t in found
+            ]
+            if not weights:
+                return out
+            avgdl = (total / n_docs) or 1.0
+            values = ",".join("(?, ?, ?)" for _ in weights)
+            params = [x for row in weights for x in row]
+            sql = f"""
+                WITH q(qid, term, idf) AS (VALUES {values}),
+                scored AS (
+                    SELECT q.qid, p.doc,
+                           SUM(q.idf * p.tf * (? + 1.0) / (p.tf + ? * (1.0 - ? + ? * d.length / ?))) AS score
+                    FROM q
+                    JOIN postings p ON p.term = q.term
+                    JOIN docs d ON d.id = p.doc
+                    GROUP BY q.qid, p.doc
+                ),
+                ranked AS (
+                    SELECT qid, doc, score,
+                           ROW_NUMBER() OVER (PARTITION BY qid ORDER BY score DESC) AS pos
+                    FROM scored
+                )
+                SELECT r.qid, d.doc_id, r.score
+                FROM ranked r
+                JOIN docs d ON d.id = r.doc
+                WHERE r.pos <= ?
+                ORDER BY r.qid, r.pos
+            """
+            params += [BM25_K1, BM25_K1, BM25_B, BM25_B, avgdl, int(top_k)]
+            for qid, doc_id, score in self._conn.execute(sql, params):
+                out[qid].append((doc_id, float(score)))
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_indexes: Dict[str, BM25Index] = {}
+_registry_lock = threading.Lock()
+
+
+def index_path(coll_name: str) -> str:
+    return os.path.join(BM25_DIR, f"bm25_{coll_name}.sqlite")
+
+
+def get_bm25_index(coll_name: str) -> BM25Index:
+    """Índice lexical da coleção (aberto uma vez por processo)."""
+    index = _indexes.get(coll_name)
+    if index is None:
+        with _registry_lock:
+            index = _indexes.get(coll_name)
+            if index is None:
+                index = _indexes[coll_name] = BM25Index(index_path(coll_name))
+    return index
+
+
+def close_bm25() -> None:
+    with _registry_lock:
+        for index in _indexes.values():
+            index.close()
+        _indexes.clear()
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = 60, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+    """
+    Reciprocal Rank Fusion: score(d) = soma de 1 / (k + posição de d em
+    cada lista). Empates mantêm a ordem da primeira lista em que d aparece.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda kv: -kv[1])
+    return fused[:limit] if limit is not None else fused
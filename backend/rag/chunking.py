@@ -0,0 +1,135 @@
+# rag/chunking.py
+"""
+Divisão de documentos longos em passagens para indexação.
+
+Cada notícia vira janelas de frases consecutivas (respeitando parágrafos)
+de até PASSAGE_MAX_TOKENS tokens, com PASSAGE_OVERLAP_SENTENCES frases
+repetidas entre janelas vizinhas para não cortar uma evidência ao meio.
+Cada passagem é indexada com o ID do documento de origem (parent_id), e a
+recuperação junta de volta as passagens de um mesmo documento.
+"""
+
+from __future__ import annotations
+import os
+import re
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+from rag.tokens import count_tokens
+
+load_dotenv()
+
+# tamanho máximo de cada passagem (0 = não divide: uma passagem por documento)
+PASSAGE_MAX_TOKENS = int(os.getenv("PASSAGE_MAX_TOKENS", "160"))
+# frases repetidas no início da passagem seguinte
+PASSAGE_OVERLAP_SENTENCES = int(os.getenv("PASSAGE_OVERLAP_SENTENCES", "1"))
+
+# entra no content_hash: mudar a divisão força reindexar as passagens
+CHUNKER_SIGNATURE = f"passages-v2:{PASSAGE_MAX_TOKENS}:{PASSAGE_OVERLAP_SENTENCES}"
+
+# fim de frase: . ! ? (ou reticências) seguido de espaço e início de nova frase
+_SENTENCE_END = re.compile(r"(?<=[.!?…])[\"'”»)]*\s+(?=[\"'“«(]?[A-ZÀ-Ý0-9])")
+# abreviações comuns que não encerram frase (comparadas com a última palavra
+# inteira, sem caixa). "etc." fica de fora: no fim de frase ele encerra a frase
+_ABBREVIATIONS = frozenset(
+    a.casefold() for a in ("Sr.", "Sra.", "Dr.", "Dra.", "Prof.", "Profa.", "Exmo.", "Av.", "nº.", "p.", "pp.", "S.A.", "Ltda.")
+)
+
+
+def _ends_with_abbreviation(sentence: str) -> bool:
+    last = sentence.rsplit(None, 1)[-1].lstrip("\"'“«(")
+    return last.casefold() in _ABBREVIATIONS
+
+
+def split_sentences(text: str) -> List[str]:
+    """Divide um parágrafo em frases (heurística simples para português)."""
+    parts = _SENTENCE_END.split(text.strip())
+    sentences: List[str] = []
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+        # junta de volta cortes feitos logo após uma abreviação
+        if sentences and _ends_with_abbreviation(sentences[-1]):
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def _split_long(sentence: str, max_tokens: int) -> List[str]:
+    """Frase maior que o limite: corta em pedaços de palavras."""
+    words, out, cur = sentence.split(), [], []
+    for w in words:
+        if cur and count_tokens(" ".join(cur + [w])) > max_tokens:
+            out.append(" ".join(cur))
+            cur = []
+        cur.append(w)
+    if cur:
+        out.append(" ".join(cur))
+    return out
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = PASSAGE_MAX_TOKENS,
+    overlap: int = PASSAGE_OVERLAP_SENTENCES,
+) -> List[str]:
+    """
+    Janelas de frases de até `max_tokens`, com `overlap` frases de
+    sobreposição. Textos curtos voltam inteiros (uma passagem).
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+    if max_tokens <= 0 or count_tokens(text) <= max_tokens:
+        return [text]
+
+    sentences: List[str] = []
+    for para in re.split(r"\n\s*\n", text):
+        for s in split_sentences(" ".join(para.split())):
+            sentences.extend(_split_long(s, max_tokens) if count_tokens(s) > max_tokens else [s])
+
+    passages: List[str] = []
+    window: List[str] = []
+    fresh = 0  # frases da janela que ainda não saíram em nenhuma passagem
+    for s in sentences:
+        if window and count_tokens(" ".join(window + [s])) > max_tokens:
+            passages.append(" ".join(window))
+            keep = window[-overlap:] if overlap > 0 else []
+            # a sobreposição não pode, sozinha, estourar o limite com a próxima frase
+            while keep and count_tokens(" ".join(keep + [s])) > max_tokens:
+                keep = keep[1:]
+            window, fresh = keep, 0
+        window.append(s)
+        fresh += 1
+    if window and fresh:
+        passages.append(" ".join(window))
+    return passages
+
+
+def passage_id(doc_id: str, index: int) -> str:
+    """ID da passagem `index` do documento `doc_id`."""
+    return f"{doc_id}#p{index}"
+
+
+def parent_of(item_id: str) -> str:
+    """Documento de origem de um ID de passagem (IDs antigos, sem '#p', são o próprio documento)."""
+    return item_id.split("#p", 1)[0]
+
+
+def split_document(doc_id: str, text: str, meta: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Divide um documento {"id", "text", "meta"} em passagens no mesmo
+    formato, com parent_id, passage (posição) e passages (total) na meta.
+    """
+    parts = chunk_text(text)
+    return [
+        {
+            "id": passage_id(doc_id, i),
+            "text": part,
+            "meta": {**meta, "parent_id": doc_id, "passage": i, "passages": len(parts)},
+        }
+        for i, part in enumerate(parts)
+    ]
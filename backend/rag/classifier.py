@@ -15,23 +15,52 @@ Fluxo:
      "rationale": "texto explicando",
      "used_sources": ["titulo | url | label", ...]
    }
+
+Atalho: se o trecho mais próximo for praticamente o próprio enunciado
+(similaridade >= RAG_SHORTCUT_MIN_SIMILARITY) e todos os trechos acima
+do limiar tiverem o mesmo rótulo, a resposta sai direto da base, sem
+chamar o LLM (ex.: boato repetido que já está no seed.csv).
+
+Classificador local (rag/local_model.py), se houver um treinado: responde
+sem LLM quando tem confiança alta e, se o Ollama falhar (fila cheia,
+timeout, erro de rede), dá uma resposta degradada em vez de erro.
 """
 
 from __future__ import annotations
 
 import os
+import copy
 import json
-from typing import Dict, Any
+import math
+import threading
+from typing import Dict, Any, List, Optional, AsyncIterator
 
-import requests
 from dotenv import load_dotenv
 
-from rag.retriever import build_context, build_prompt_for_llm
+from rag.embeddings import embed_one, aembed_one, normalize_text
+from rag.llm import LLM_ERRORS, call_ollama_chat, acall_ollama_chat, astream_chat_events
+from rag.local_model import LOCAL_MODEL_FALLBACK, LOCAL_MODEL_MIN_CONFIDENCE, count_use, get_local_model
+from rag.retriever import build_context, abuild_context, build_prompt_for_llm
+from rag.scheduler import PRIORITY_INTERACTIVE, get_single_flight, get_sync_single_flight
+from rag.tokens import count_tokens
+from rag.tracing import span, traced
+from rag.vectordb import collection_version
+from rag.verdict_cache import get_verdict_cache
 
 load_dotenv()
 
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
-LLM_MODEL = os.getenv("LLM_MODEL", "llama3.1:8b")
+# espaço do cache de veredictos usado por este classificador
+CACHE_NAMESPACE = "rag"
+
+# atalho sem LLM quando a evidência é decisiva
+SHORTCUT_ENABLED = os.getenv("RAG_SHORTCUT_ENABLED", "1") not in ("0", "false", "False")
+# similaridade (1 - distância de cosseno) mínima do trecho mais próximo
+SHORTCUT_MIN_SIMILARITY = float(os.getenv("RAG_SHORTCUT_MIN_SIMILARITY", "0.97"))
+SHORTCUT_MAX_CONFIDENCE = float(os.getenv("RAG_SHORTCUT_MAX_CONFIDENCE", "0.99"))
+
+_LABELS = ("VERDADEIRA", "FALSA")
+_shortcut_lock = threading.Lock()
+_shortcut_stats = {"checked": 0, "bypassed": 0}
 
 SYSTEM_PROMPT = """Você é um verificador de fatos especializado.
 Você deve analisar o enunciado usando APENAS o contexto fornecido.
@@ -50,29 +79,17 @@ Regras:
 """
 
 
-def _call_ollama_chat(prompt: str) -> str:
+def _call_ollama_chat(prompt: str, priority: int = PRIORITY_INTERACTIVE) -> str:
     """
     Faz uma chamada ao endpoint /api/chat do Ollama
     e retorna o conteúdo textual da resposta do modelo.
     """
-    url = f"{OLLAMA_HOST}/api/chat"
-    body = {
-        "model": LLM_MODEL,
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt},
-        ],
-        "stream": False,
-        "options": {
-            "temperature": 0.2,
-        },
-    }
-    resp = requests.post(url, json=body, timeout=120)
-    resp.raise_for_status()
-    data = resp.json()
-    msg = data.get("message", {}) or {}
-    content = msg.get("content", "")
-    return content
+    return call_ollama_chat(SYSTEM_PROMPT, prompt, temperature=0.2, priority=priority)
+
+
+async def _acall_ollama_chat(prompt: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+    """Versão assíncrona de _call_ollama_chat."""
+    return await acall_ollama_chat(SYSTEM_PROMPT, prompt, temperature=0.2, priority=priority)
 
 
 def _parse_json_safely(text: str) -> Dict[str, Any]:
@@ -101,9 +118,120 @@ def _parse_json_safely(text: str) -> Dict[str, Any]:
     }
 
 
-def classify_claim(claim: str) -> Dict[str, Any]:
+def shortcut_stats() -> Dict[str, Any]:
+    """Quantas verificações passaram pelo atalho e quantas dispensaram o LLM."""
+    with _shortcut_lock:
+        s = dict(_shortcut_stats)
+    s["bypass_rate"] = round(s["bypassed"] / s["checked"], 4) if s["checked"] else 0.0
+    s["enabled"] = SHORTCUT_ENABLED
+    return s
+
+
+def _shortcut(ctx: Dict[str, Any], fast_paths: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Resposta direta da base quando a evidência é decisiva; None se o
+    caso precisa do LLM (ou se fast_paths=False). Usa os trechos brutos
+    da busca vetorial (os que vieram só da busca lexical não têm
+    distância e não contam).
+    """
+    if not SHORTCUT_ENABLED or not fast_paths:
+        return None
+    raw = ctx.get("raw") or {}
+    close: List[tuple] = []
+    for dist, meta in zip(raw.get("distances") or [], raw.get("metadatas") or []):
+        if dist is None or math.isnan(dist):
+            continue
+        similarity = 1.0 - float(dist)
+        if similarity >= SHORTCUT_MIN_SIMILARITY:
+            close.append((similarity, meta or {}))
+
+    with span("shortcut") as s:
+        labels = {str(m.get("label", "")).strip().upper() for _, m in close}
+        decisive = bool(close) and len(labels) == 1 and labels <= set(_LABELS)
+        s.set(matches=len(close), bypassed=decisive)
+    with _shortcut_lock:
+        _shortcut_stats["checked"] += 1
+        _shortcut_stats["bypassed"] += int(decisive)
+    if not decisive:
+        return None
+
+    similarity, meta = max(close, key=lambda x: x[0])
+    label = labels.pop()
+    source = f"{meta.get('title', '').strip()} | {meta.get('source', '').strip()} | {label}"
+    return {
+        "label": label,
+        "confidence": round(min(SHORTCUT_MAX_CONFIDENCE, similarity), 2),
+        "rationale": (
+            f"O enunciado é praticamente idêntico a um documento da base já rotulado como {label} "
+            f"(similaridade {similarity:.3f}); resposta dada sem consultar o modelo."
+        ),
+        "used_sources": [source],
+        "debug": {
+            "hits": ctx["hits"],
+            "raw_sources": ctx["sources"],
+            "tokens": {**ctx.get("tokens", {}), "prompt": 0},
+            "shortcut": {"similarity": round(similarity, 4), "matches": len(close)},
+        },
+    }
+
+
+def _local_answer(
+    claim: str,
+    ctx: Dict[str, Any],
+    qvec: List[float],
+    error: Optional[BaseException] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Resposta do classificador local. Sem `error` é o pré-filtro (None se
+    a probabilidade não alcança LOCAL_MODEL_MIN_CONFIDENCE); com `error`
+    é o plano B para uma falha do LLM (None se desligado).
+    """
+    model = get_local_model()
+    if model is None or (error is not None and not LOCAL_MODEL_FALLBACK):
+        return None
+    label, p = model.predict(claim, qvec)
+    if error is None and p < LOCAL_MODEL_MIN_CONFIDENCE:
+        return None
+    count_use("prefilter" if error is None else "fallback")
+    if error is None:
+        rationale = f"Classificação do modelo local (probabilidade {p:.2f}), sem consultar o LLM."
+    else:
+        rationale = (
+            f"O LLM não respondeu ({type(error).__name__}); resultado do classificador local, "
+            "menos confiável que a análise completa."
+        )
+    return {
+        "label": label,
+        "confidence": round(min(p, SHORTCUT_MAX_CONFIDENCE), 2),
+        "rationale": rationale,
+        "used_sources": [],
+        "debug": {
+            "hits": ctx["hits"],
+            "raw_sources": ctx["sources"],
+            "tokens": {**ctx.get("tokens", {}), "prompt": 0},
+            "local_model": {"probability": round(p, 4), "degraded": error is not None},
+        },
+    }
+
+
+def classify_claim(
+    claim: str,
+    ctx: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    fast_paths: bool = True,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Any]:
     """
     Classifica um enunciado (notícia) como VERDADEIRA ou FALSA usando RAG + LLM.
+    Se `ctx` vier pronto (ex.: build_context_many em lote), pula a recuperação.
+    Enunciados repetidos ou quase idênticos são respondidos pelo cache de
+    veredictos (rag/verdict_cache.py), a menos que use_cache=False.
+    fast_paths=False desliga as respostas sem LLM (atalho pela base e
+    pré-filtro do classificador local), para medir o modelo de fato
+    (ex.: evaluate.py sobre os dados indexados e de treino). O plano B
+    do classificador local continua valendo se o LLM falhar.
+    `priority` ordena a fila do LLM (rag/scheduler.py): lotes de avaliação
+    e benchmark usam PRIORITY_BATCH para não atrasar a API.
 
     Retorno esperado (ideal):
     {
@@ -111,17 +239,176 @@ def classify_claim(claim: str) -> Dict[str, Any]:
       "confidence": 0.85,
       "rationale": "explicação curta...",
       "used_sources": ["titulo | url | label", ...],
-      "debug": { ... }
+      "debug": { ..., "trace": tempos por etapa (rag/tracing.py) }
     }
+    Pedidos idênticos simultâneos (mesmo texto normalizado) compartilham
+    uma única execução (single-flight).
     """
-    ctx = build_context(claim)
-    context_text = ctx["context"]
-    sources = ctx["sources"]
+    if ctx is not None:
+        return _classify_claim(claim, ctx, use_cache, fast_paths, priority)
+    result, shared = get_sync_single_flight().do(
+        _flight_key(claim, fast_paths), lambda: _classify_claim(claim, None, use_cache, fast_paths, priority)
+    )
+    return copy.deepcopy(result) if shared else result
+
 
-    user_prompt = build_prompt_for_llm(claim, context_text)
-    raw_response = _call_ollama_chat(user_prompt)
-    parsed = _parse_json_safely(raw_response)
+def _flight_key(claim: str, fast_paths: bool = True) -> tuple:
+    return (CACHE_NAMESPACE, normalize_text(claim).casefold(), fast_paths)
 
+
+@traced
+def _classify_claim(
+    claim: str,
+    ctx: Optional[Dict[str, Any]],
+    use_cache: bool,
+    fast_paths: bool = True,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Any]:
+    cache = get_verdict_cache() if use_cache else None
+    if cache is not None:
+        # o embedding do enunciado é reaproveitado (cache de embeddings) pela busca
+        qvec, version = embed_one(claim), collection_version()
+        hit = cache.get(CACHE_NAMESPACE, claim, version, qvec)
+        if hit is not None:
+            return hit
+
+    if ctx is None:
+        ctx = build_context(claim)
+
+    result = _shortcut(ctx, fast_paths)
+    if result is None and fast_paths and get_local_model() is not None:
+        result = _local_answer(claim, ctx, embed_one(claim))
+    if result is None:
+        user_prompt = build_prompt_for_llm(claim, ctx["context"])
+        try:
+            raw_response = _call_ollama_chat(user_prompt, priority)
+        except LLM_ERRORS as e:
+            # resposta degradada não vai para o cache
+            fallback = _local_answer(claim, ctx, embed_one(claim), error=e)
+            if fallback is None:
+                raise
+            return fallback
+        result = _finalize(_parse_json_safely(raw_response), ctx, user_prompt)
+
+    if cache is not None:
+        cache.put(CACHE_NAMESPACE, claim, version, result, qvec)
+    return result
+
+
+async def aclassify_claim(
+    claim: str,
+    ctx: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    fast_paths: bool = True,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Any]:
+    """
+    Versão assíncrona de classify_claim: embedding, busca e LLM são
+    aguardados sem travar o event loop (várias verificações em paralelo).
+    """
+    if ctx is not None:
+        return await _aclassify_claim(claim, ctx, use_cache, fast_paths, priority)
+    result, shared = await get_single_flight().do(
+        _flight_key(claim, fast_paths), lambda: _aclassify_claim(claim, None, use_cache, fast_paths, priority)
+    )
+    return copy.deepcopy(result) if shared else result
+
+
+@traced
+async def _aclassify_claim(
+    claim: str,
+    ctx: Optional[Dict[str, Any]],
+    use_cache: bool,
+    fast_paths: bool = True,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Any]:
+    cache = get_verdict_cache() if use_cache else None
+    if cache is not None:
+        qvec, version = await aembed_one(claim), collection_version()
+        hit = cache.get(CACHE_NAMESPACE, claim, version, qvec)
+        if hit is not None:
+            return hit
+
+    if ctx is None:
+        ctx = await abuild_context(claim)
+
+    result = _shortcut(ctx, fast_paths)
+    if result is None and fast_paths and get_local_model() is not None:
+        result = _local_answer(claim, ctx, await aembed_one(claim))
+    if result is None:
+        user_prompt = build_prompt_for_llm(claim, ctx["context"])
+        try:
+            raw_response = await _acall_ollama_chat(user_prompt, priority)
+        except LLM_ERRORS as e:
+            fallback = _local_answer(claim, ctx, await aembed_one(claim), error=e)
+            if fallback is None:
+                raise
+            return fallback
+        result = _finalize(_parse_json_safely(raw_response), ctx, user_prompt)
+
+    if cache is not None:
+        cache.put(CACHE_NAMESPACE, claim, version, result, qvec)
+    return result
+
+
+async def astream_classify_claim(claim: str, use_cache: bool = True) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Versão em streaming de aclassify_claim. Gera eventos:
+    - {"event": "context", "hits", "sources"}  após a recuperação
+    - {"event": "token", "text"}               pedaços gerados pelo LLM
+    - {"event": "label" | "confidence", "value"} assim que aparecem no JSON
+    - {"event": "result", "data"}              resposta final (mesmo formato de classify_claim)
+    """
+    cache = get_verdict_cache() if use_cache else None
+    if cache is not None:
+        qvec, version = await aembed_one(claim), collection_version()
+        hit = cache.get(CACHE_NAMESPACE, claim, version, qvec)
+        if hit is not None:
+            yield {"event": "result", "data": hit}
+            return
+
+    ctx = await abuild_context(claim)
+    yield {"event": "context", "hits": ctx["hits"], "sources": ctx["sources"]}
+
+    result = _shortcut(ctx)
+    if result is None and get_local_model() is not None:
+        result = _local_answer(claim, ctx, await aembed_one(claim))
+    if result is not None:
+        if cache is not None:
+            cache.put(CACHE_NAMESPACE, claim, version, result, qvec)
+        yield {"event": "result", "data": result}
+        return
+
+    user_prompt = build_prompt_for_llm(claim, ctx["context"])
+    events = astream_chat_events(SYSTEM_PROMPT, user_prompt)
+    while True:
+        try:
+            ev = await events.__anext__()
+        except StopAsyncIteration:
+            return
+        except LLM_ERRORS as e:
+            fallback = _local_answer(claim, ctx, await aembed_one(claim), error=e)
+            if fallback is None:
+                raise
+            yield {"event": "result", "data": fallback}
+            return
+        if ev["event"] != "done":
+            yield ev
+            continue
+        result = _finalize(_parse_json_safely(ev["content"]), ctx, user_prompt)
+        if cache is not None:
+            cache.put(CACHE_NAMESPACE, claim, version, result, qvec)
+        yield {"event": "result", "data": result}
+
+
+def _prompt_tokens(ctx: Dict[str, Any], user_prompt: str) -> Dict[str, Any]:
+    """Tokens do contexto (orçamento, duplicatas) + estimativa do prompt enviado ao Ollama."""
+    return {**ctx.get("tokens", {}), "prompt": count_tokens(SYSTEM_PROMPT) + count_tokens(user_prompt)}
+
+
+def _finalize(parsed: Dict[str, Any], ctx: Dict[str, Any], user_prompt: str = "") -> Dict[str, Any]:
+    """Completa a resposta do modelo com as fontes e dados de depuração."""
+    sources = ctx["sources"]
     if isinstance(parsed, dict):
         parsed.setdefault("used_sources", sources)
         parsed.setdefault("debug", {})
@@ -129,6 +416,7 @@ def classify_claim(claim: str) -> Dict[str, Any]:
             {
                 "hits": ctx["hits"],
                 "raw_sources": sources,
+                "tokens": _prompt_tokens(ctx, user_prompt),
             }
         )
     return parsed
@@ -1,16 +1,24 @@
 # rag/classifier_web.py
 from __future__ import annotations
-import os, json, requests
-from typing import Dict, Any
+import copy
+import json
+from typing import Dict, Any, Optional, AsyncIterator
 
 from dotenv import load_dotenv
-from rag.retriever import build_context, build_prompt_for_llm
-from rag.web_search import duckduckgo_search, format_web_results
+from rag.embeddings import embed_one, aembed_one, normalize_text
+from rag.llm import call_ollama_chat, acall_ollama_chat, astream_chat_events
+from rag.retriever import build_context, abuild_context, build_prompt_for_llm
+from rag.scheduler import PRIORITY_INTERACTIVE, get_single_flight, get_sync_single_flight
+from rag.tokens import count_tokens
+from rag.tracing import traced
+from rag.vectordb import collection_version
+from rag.verdict_cache import get_verdict_cache
+from rag.web_fetch import enrich_web_results, aenrich_web_results
+from rag.web_search import start_search, format_web_results
 
 load_dotenv()
 
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
-LLM_MODEL = os.getenv("LLM_MODEL", "llama3.1:8b")
+CACHE_NAMESPACE = "web"
 
 SYSTEM_PROMPT = """Você é um verificador de fatos. Use APENAS as evidências fornecidas acima.
 Responda SOMENTE em JSON com:
@@ -20,20 +28,11 @@ Responda SOMENTE em JSON com:
 - used_sources
 """
 
-def _call_ollama_chat(prompt: str) -> str:
-    url = f"{OLLAMA_HOST}/api/chat"
-    body = {
-        "model": LLM_MODEL,
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt},
-        ],
-        "stream": False,
-        "options": {"temperature": 0.2},
-    }
-    resp = requests.post(url, json=body, timeout=120)
-    resp.raise_for_status()
-    return resp.json()["message"]["content"]
+def _call_ollama_chat(prompt: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+    return call_ollama_chat(SYSTEM_PROMPT, prompt, temperature=0.2, priority=priority)
+
+async def _acall_ollama_chat(prompt: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+    return await acall_ollama_chat(SYSTEM_PROMPT, prompt, temperature=0.2, priority=priority)
 
 def _parse_json(text: str) -> Dict[str, Any]:
     text = text.strip()
@@ -48,20 +47,140 @@ def _parse_json(text: str) -> Dict[str, Any]:
                 pass
     return {"error": "JSON inválido", "raw": text}
 
-def classify_claim_with_web(claim: str, max_web_results: int = 5) -> Dict[str, Any]:
-    ctx = build_context(claim)
-    local_context = ctx["context"]
-    web_results = duckduckgo_search(claim, max_results=max_web_results)
-    web_block = format_web_results(web_results)
+def classify_claim_with_web(
+    claim: str,
+    max_web_results: int = 5,
+    ctx: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Any]:
+    if ctx is not None:
+        return _classify_claim_with_web(claim, max_web_results, ctx, use_cache, priority)
+    # pedidos idênticos simultâneos compartilham uma única execução
+    result, shared = get_sync_single_flight().do(
+        _flight_key(claim, max_web_results),
+        lambda: _classify_claim_with_web(claim, max_web_results, None, use_cache, priority),
+    )
+    return copy.deepcopy(result) if shared else result
+
+def _flight_key(claim: str, max_web_results: int) -> tuple:
+    return (CACHE_NAMESPACE, normalize_text(claim).casefold(), max_web_results)
+
+@traced
+def _classify_claim_with_web(
+    claim: str,
+    max_web_results: int,
+    ctx: Optional[Dict[str, Any]],
+    use_cache: bool,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Any]:
+    cache = get_verdict_cache() if use_cache else None
+    if cache is not None:
+        qvec, version = embed_one(claim), collection_version()
+        hit = cache.get(CACHE_NAMESPACE, claim, version, qvec)
+        if hit is not None:
+            return hit
+
+    # a busca na web corre em segundo plano enquanto a recuperação local roda aqui
+    search = start_search(claim, max_results=max_web_results)
+    if ctx is None:
+        ctx = build_context(claim)
+    web_results = enrich_web_results(search.result())
+
+    prompt = _build_web_prompt(claim, ctx, web_results)
+    raw = _call_ollama_chat(prompt, priority)
+    result = _finalize(_parse_json(raw), ctx, web_results, prompt)
+
+    if cache is not None:
+        cache.put(CACHE_NAMESPACE, claim, version, result, qvec)
+    return result
+
+async def aclassify_claim_with_web(
+    claim: str,
+    max_web_results: int = 5,
+    ctx: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Any]:
+    """Versão assíncrona de classify_claim_with_web."""
+    if ctx is not None:
+        return await _aclassify_claim_with_web(claim, max_web_results, ctx, use_cache, priority)
+    result, shared = await get_single_flight().do(
+        _flight_key(claim, max_web_results),
+        lambda: _aclassify_claim_with_web(claim, max_web_results, None, use_cache, priority),
+    )
+    return copy.deepcopy(result) if shared else result
 
-    full_context = local_context + "\n\n" + web_block
-    prompt = build_prompt_for_llm(claim, full_context)
+@traced
+async def _aclassify_claim_with_web(
+    claim: str,
+    max_web_results: int,
+    ctx: Optional[Dict[str, Any]],
+    use_cache: bool,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Any]:
+    cache = get_verdict_cache() if use_cache else None
+    if cache is not None:
+        qvec, version = await aembed_one(claim), collection_version()
+        hit = cache.get(CACHE_NAMESPACE, claim, version, qvec)
+        if hit is not None:
+            return hit
 
-    raw = _call_ollama_chat(prompt)
-    parsed = _parse_json(raw)
+    search = start_search(claim, max_results=max_web_results)
+    if ctx is None:
+        ctx = await abuild_context(claim)
+    web_results = await aenrich_web_results(await search.aresult())
 
+    prompt = _build_web_prompt(claim, ctx, web_results)
+    raw = await _acall_ollama_chat(prompt, priority)
+    result = _finalize(_parse_json(raw), ctx, web_results, prompt)
+
+    if cache is not None:
+        cache.put(CACHE_NAMESPACE, claim, version, result, qvec)
+    return result
+
+async def astream_classify_claim_with_web(
+    claim: str,
+    max_web_results: int = 5,
+    use_cache: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Versão em streaming (mesmos eventos de astream_classify_claim + "web")."""
+    cache = get_verdict_cache() if use_cache else None
+    if cache is not None:
+        qvec, version = await aembed_one(claim), collection_version()
+        hit = cache.get(CACHE_NAMESPACE, claim, version, qvec)
+        if hit is not None:
+            yield {"event": "result", "data": hit}
+            return
+
+    search = start_search(claim, max_results=max_web_results)
+    ctx = await abuild_context(claim)
+    yield {"event": "context", "hits": ctx["hits"], "sources": ctx["sources"]}
+    web_results = await search.aresult()
+    yield {"event": "web", "results": web_results}
+    web_results = await aenrich_web_results(web_results)
+
+    prompt = _build_web_prompt(claim, ctx, web_results)
+    async for ev in astream_chat_events(SYSTEM_PROMPT, prompt):
+        if ev["event"] != "done":
+            yield ev
+            continue
+        result = _finalize(_parse_json(ev["content"]), ctx, web_results, prompt)
+        if cache is not None:
+            cache.put(CACHE_NAMESPACE, claim, version, result, qvec)
+        yield {"event": "result", "data": result}
+
+def _build_web_prompt(claim: str, ctx: Dict[str, Any], web_results) -> str:
+    full_context = ctx["context"] + "\n\n" + format_web_results(web_results)
+    return build_prompt_for_llm(claim, full_context)
+
+def _finalize(parsed: Dict[str, Any], ctx: Dict[str, Any], web_results, prompt: str = "") -> Dict[str, Any]:
     parsed.setdefault("used_sources", ctx["sources"])
     parsed.setdefault("web_results", web_results)
     parsed.setdefault("debug", {"hits": ctx["hits"]})
-
+    # tokens do contexto local + estimativa do prompt inteiro (com as evidências da web)
+    parsed["debug"]["tokens"] = {
+        **ctx.get("tokens", {}),
+        "prompt": count_tokens(SYSTEM_PROMPT) + count_tokens(prompt),
+    }
     return parsed
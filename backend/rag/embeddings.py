@@ -1,29 +1,515 @@
 # rag/embeddings.py
 import os
+import time
+import array
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
 import requests
 from dotenv import load_dotenv
 
+from rag.http_client import get_session, get_async_client
+from rag.scheduler import get_embed_batcher
+from rag.tracing import span
+
 #Carrega o env
 
 load_dotenv()
 
 #Variaveis de ambiente ENV
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+# quantos textos vão em cada chamada ao /api/embed
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# quantos lotes são enviados em paralelo ao Ollama
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# tentativas por lote em caso de falha transitória (rede, 5xx, 429)
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "120"))
+
+# cache persistente de embeddings (SQLite), chaveado por (modelo, hash do texto)
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") not in ("0", "false", "False")
+EMBED_CACHE_PATH = os.getenv(
+    "EMBED_CACHE_PATH",
+    os.path.join(os.getenv("CHROMA_DIR", "./db"), "embed_cache.sqlite"),
+)
+# limite de entradas no disco; acima disso as menos usadas recentemente são removidas
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+# LRU em memória na frente do SQLite (0 desativa)
+EMBED_CACHE_LRU_SIZE = int(os.getenv("EMBED_CACHE_LRU_SIZE", "2048"))
+# acessos (last_used) acumulados em memória antes de ir para o disco
+EMBED_CACHE_TOUCH_BUFFER = int(os.getenv("EMBED_CACHE_TOUCH_BUFFER", "4096"))
+EMBED_CACHE_TOUCH_FLUSH_S = float(os.getenv("EMBED_CACHE_TOUCH_FLUSH_S", "60"))
+
+# versões antigas do Ollama não têm /api/embed; detectamos na primeira chamada
+_batch_endpoint_available = True
+
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
+def normalize_text(text: str) -> str:
+    """Normalização usada na chave do cache: Unicode NFC + espaços colapsados."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def cache_key(text: str, model: str = EMBED_MODEL) -> str:
+    """Chave endereçada por conteúdo: sha256(modelo + texto normalizado)."""
+    payload = f"{model}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class EmbeddingCache:
     """
-    Gera embeddings chamando o endpoint /api/embeddings do Ollama.
-    Retorna uma lista de vetores (um por texto).
+    Cache de embeddings em SQLite (vetores float32 em BLOB), com um LRU
+    opcional em memória na frente.
+    - get_many/put_many trabalham em lote (uma transação por chamada)
+    - a leitura não escreve no disco: os acessos (last_used) ficam num
+      buffer em memória e vão para o SQLite junto com a próxima gravação,
+      antes de um despejo, a cada EMBED_CACHE_TOUCH_FLUSH_S segundos ou
+      quando o buffer enche
+    - quando o disco passa de max_entries (contagem mantida em memória),
+      remove as entradas usadas há mais tempo
     """
+
+    def __init__(
+        self,
+        path: str = EMBED_CACHE_PATH,
+        max_entries: int = EMBED_CACHE_MAX_ENTRIES,
+        lru_size: int = EMBED_CACHE_LRU_SIZE,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.lru_size = lru_size
+        self._lru: OrderedDict[str, list[float]] = OrderedDict()
+        # chave -> último acesso ainda não gravado
+        self._touched: dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        # _mem_lock: LRU e buffer (nunca espera I/O); _lock: conexão SQLite e contagem
+        self._mem_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vec BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def _lru_put_locked(self, key: str, vec: list[float]) -> None:
+        if self.lru_size <= 0:
+            return
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_memory(self, keys: list[str]) -> dict[str, list[float]]:
+        """Só o LRU em memória, sem I/O (seguro no event loop). Retorna {chave: vetor} dos encontrados."""
+        found: dict[str, list[float]] = {}
+        now = time.time()
+        with self._mem_lock:
+            for k in keys:
+                vec = self._lru.get(k)
+                if vec is not None:
+                    self._lru.move_to_end(k)
+                    self._touched[k] = now
+                    found[k] = vec
+        return found
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        """Retorna {chave: vetor} apenas para as chaves encontradas."""
+        found = self.get_memory(keys)
+        missing = [k for k in keys if k not in found]
+        rows = []
+        if missing:
+            with self._lock:
+                # consulta em blocos (limite de parâmetros do SQLite)
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i : i + 500]
+                    marks = ",".join("?" * len(chunk))
+                    rows.extend(
+                        self._conn.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", chunk)
+                    )
+        now = time.time()
+        with self._mem_lock:
+            for k, blob in rows:
+                vec = array.array("f", blob).tolist()
+                found[k] = vec
+                self._lru_put_locked(k, vec)
+                self._touched[k] = now
+            due = (
+                len(self._touched) >= EMBED_CACHE_TOUCH_BUFFER
+                or (self._touched and time.monotonic() - self._last_flush >= EMBED_CACHE_TOUCH_FLUSH_S)
+            )
+        if due:
+            with self._lock:
+                self._flush_touches_locked()
+                self._conn.commit()
+        return found
+
+    def _flush_touches_locked(self) -> None:
+        """Grava os acessos pendentes (chamado com _lock, dentro da transação de quem chama)."""
+        with self._mem_lock:
+            touched, self._touched = self._touched, {}
+            self._last_flush = time.monotonic()
+        if touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(t, k) for k, t in touched.items()],
+            )
+
+    def put_many(self, items: dict[str, list[float]], model: str = EMBED_MODEL) -> None:
+        """Grava vários vetores de uma vez e aplica a política de tamanho."""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (k, model, len(v), array.array("f", v).tobytes(), now)
+            for k, v in items.items()
+        ]
+        with self._lock:
+            # a chave é endereçada por conteúdo: se já existe, o vetor é o mesmo
+            cur = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, dim, vec, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._count += max(cur.rowcount, 0)
+            with self._mem_lock:
+                for k in items:
+                    self._touched[k] = now
+            self._flush_touches_locked()
+            self._evict_locked()
+            self._conn.commit()
+        with self._mem_lock:
+            for k, v in items.items():
+                self._lru_put_locked(k, v)
+
+    def _evict_locked(self) -> None:
+        if self.max_entries <= 0 or self._count <= self.max_entries:
+            return
+        # remove até 90% do limite para não despejar a cada inserção
+        excess = self._count - int(self.max_entries * 0.9)
+        cur = self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        self._count -= max(cur.rowcount, 0)
+
+    def flush(self) -> None:
+        """Grava os acessos pendentes agora."""
+        with self._lock:
+            self._flush_touches_locked()
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._count)
+
+    def clear(self) -> None:
+        with self._lock:
+            with self._mem_lock:
+                self._lru.clear()
+                self._touched.clear()
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touches_locked()
+            self._conn.commit()
+            self._conn.close()
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Cache do processo (None se EMBED_CACHE_ENABLED=0)."""
+    global _cache
+    if not EMBED_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+
+def close_embedding_cache() -> None:
+    """Grava os acessos pendentes e fecha o cache (no desligamento do servidor)."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+
+def _is_transient(exc: Exception) -> bool:
+    """Erros que valem uma nova tentativa: conexão, timeout, 429 e 5xx."""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, httpx.TransportError)):
+        return True
+    if isinstance(exc, (requests.HTTPError, httpx.HTTPStatusError)) and exc.response is not None:
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return False
+
+
+def _embed_batch_legacy(texts: list[str]) -> list[list[float]]:
+    """Fallback: uma chamada ao /api/embeddings por texto (Ollama antigo)."""
+    session = get_session()
     url = f"{OLLAMA_HOST}/api/embeddings"
     out: list[list[float]] = []
     for t in texts:
-        resp = requests.post(url, json={"model": EMBED_MODEL, "prompt": t})
+        resp = session.post(url, json={"model": EMBED_MODEL, "prompt": t}, timeout=EMBED_TIMEOUT)
         resp.raise_for_status()
-        data = resp.json()
-        out.append(data["embedding"])
+        out.append(resp.json()["embedding"])
+    return out
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    """
+    Gera embeddings de um lote inteiro em UMA chamada ao /api/embed.
+    Refaz o lote com backoff exponencial se a falha for transitória.
+    """
+    global _batch_endpoint_available
+    session = get_session()
+    url = f"{OLLAMA_HOST}/api/embed"
+
+    attempt = 0
+    while True:
+        try:
+            if not _batch_endpoint_available:
+                return _embed_batch_legacy(texts)
+            resp = session.post(url, json={"model": EMBED_MODEL, "input": texts}, timeout=EMBED_TIMEOUT)
+            if resp.status_code == 404:
+                # endpoint em lote inexistente nesta versão do Ollama
+                _batch_endpoint_available = False
+                return _embed_batch_legacy(texts)
+            resp.raise_for_status()
+            vectors = resp.json()["embeddings"]
+            if len(vectors) != len(texts):
+                raise ValueError(
+                    f"Ollama retornou {len(vectors)} embeddings para {len(texts)} textos."
+                )
+            return vectors
+        except Exception as e:
+            attempt += 1
+            if attempt > EMBED_MAX_RETRIES or not _is_transient(e):
+                raise
+            time.sleep(min(0.5 * 2 ** (attempt - 1), 8.0))
+
+
+def _embed_uncached(
+    texts: list[str],
+    batch_size: int | None = None,
+    concurrency: int | None = None,
+) -> list[list[float]]:
+    """Gera embeddings no Ollama, em lotes paralelos, sem passar pelo cache."""
+    if not texts:
+        return []
+    size = max(1, int(batch_size or EMBED_BATCH_SIZE))
+    workers = max(1, int(concurrency or EMBED_CONCURRENCY))
+    batches = [texts[i : i + size] for i in range(0, len(texts), size)]
+
+    if len(batches) == 1 or workers == 1:
+        results = [_embed_batch(b) for b in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            # map preserva a ordem dos lotes
+            results = list(pool.map(_embed_batch, batches))
+
+    out: list[list[float]] = []
+    for vectors in results:
+        out.extend(vectors)
     return out
 
+
+def _lookup_cache(
+    cache: EmbeddingCache, texts: list[str]
+) -> tuple[list[str], dict[str, list[float]], dict[str, str]]:
+    """
+    Separa os textos em encontrados no cache e pendentes.
+    Retorna (chaves na ordem da entrada, {chave: vetor}, {chave: texto a embutir}).
+    Textos repetidos na mesma chamada são embutidos uma única vez.
+    """
+    keys = [cache_key(t) for t in texts]
+    found = cache.get_many(list(dict.fromkeys(keys)))
+    return keys, found, _pending(keys, texts, found)
+
+
+async def _alookup_cache(
+    cache: EmbeddingCache, texts: list[str]
+) -> tuple[list[str], dict[str, list[float]], dict[str, str]]:
+    """
+    _lookup_cache para o event loop: o LRU é consultado direto (sem I/O) e
+    só as chaves ausentes vão ao SQLite, numa thread.
+    """
+    keys = [cache_key(t) for t in texts]
+    unique = list(dict.fromkeys(keys))
+    found = cache.get_memory(unique)
+    missing = [k for k in unique if k not in found]
+    if missing:
+        found.update(await asyncio.to_thread(cache.get_many, missing))
+    return keys, found, _pending(keys, texts, found)
+
+
+def _pending(keys: list[str], texts: list[str], found: dict[str, list[float]]) -> dict[str, str]:
+    pending: dict[str, str] = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in pending:
+            pending[k] = t
+    return pending
+
+
+def embed_texts(
+    texts: list[str],
+    batch_size: int | None = None,
+    concurrency: int | None = None,
+) -> list[list[float]]:
+    """
+    Gera embeddings chamando o endpoint /api/embed do Ollama.
+    - Consulta antes o cache (modelo + hash do texto) e só envia os ausentes
+    - Divide os textos em lotes de `batch_size`
+    - Envia até `concurrency` lotes em paralelo (sessão HTTP compartilhada)
+    Retorna uma lista de vetores (um por texto), na mesma ordem da entrada.
+    """
+    if not texts:
+        return []
+    with span("embed", texts=len(texts), chars=sum(len(t) for t in texts)) as s:
+        cache = get_embedding_cache()
+        if cache is None:
+            return _embed_uncached(texts, batch_size, concurrency)
+
+        keys, found, pending = _lookup_cache(cache, texts)
+        s.set(cache_hits=len(found))
+        if pending:
+            vectors = _embed_uncached(list(pending.values()), batch_size, concurrency)
+            fresh = dict(zip(pending.keys(), vectors))
+            cache.put_many(fresh)
+            found.update(fresh)
+
+        return [found[k] for k in keys]
+
 def embed_one(text: str) -> list[float]:
     return embed_texts([text])[0]
+
+
+# ---------------- versões assíncronas (httpx) ----------------
+
+async def _aembed_batch(texts: list[str]) -> list[list[float]]:
+    """Versão assíncrona de _embed_batch (mesmas regras de retry e fallback)."""
+    global _batch_endpoint_available
+    client = get_async_client()
+
+    attempt = 0
+    while True:
+        try:
+            if not _batch_endpoint_available:
+                out: list[list[float]] = []
+                for t in texts:
+                    resp = await client.post(
+                        f"{OLLAMA_HOST}/api/embeddings",
+                        json={"model": EMBED_MODEL, "prompt": t},
+                        timeout=EMBED_TIMEOUT,
+                    )
+                    resp.raise_for_status()
+                    out.append(resp.json()["embedding"])
+                return out
+            resp = await client.post(
+                f"{OLLAMA_HOST}/api/embed",
+                json={"model": EMBED_MODEL, "input": texts},
+                timeout=EMBED_TIMEOUT,
+            )
+            if resp.status_code == 404:
+                _batch_endpoint_available = False
+                continue
+            resp.raise_for_status()
+            vectors = resp.json()["embeddings"]
+            if len(vectors) != len(texts):
+                raise ValueError(
+                    f"Ollama retornou {len(vectors)} embeddings para {len(texts)} textos."
+                )
+            return vectors
+        except Exception as e:
+            attempt += 1
+            if attempt > EMBED_MAX_RETRIES or not _is_transient(e):
+                raise
+            await asyncio.sleep(min(0.5 * 2 ** (attempt - 1), 8.0))
+
+
+async def _aembed_uncached(
+    texts: list[str],
+    batch_size: int | None = None,
+    concurrency: int | None = None,
+) -> list[list[float]]:
+    if not texts:
+        return []
+    size = max(1, int(batch_size or EMBED_BATCH_SIZE))
+    sem = asyncio.Semaphore(max(1, int(concurrency or EMBED_CONCURRENCY)))
+    batches = [texts[i : i + size] for i in range(0, len(texts), size)]
+
+    async def run(batch: list[str]) -> list[list[float]]:
+        async with sem:
+            return await _aembed_batch(batch)
+
+    results = await asyncio.gather(*(run(b) for b in batches))
+    out: list[list[float]] = []
+    for vectors in results:
+        out.extend(vectors)
+    return out
+
+
+async def aembed_texts(
+    texts: list[str],
+    batch_size: int | None = None,
+    concurrency: int | None = None,
+) -> list[list[float]]:
+    """
+    Versão assíncrona de embed_texts: mesmo cache, lotes e paralelismo,
+    mas sem bloquear o event loop enquanto espera o Ollama.
+    """
+    if not texts:
+        return []
+    with span("embed", texts=len(texts), chars=sum(len(t) for t in texts)) as s:
+        cache = get_embedding_cache()
+        if cache is None:
+            return await _aembed_uncached(texts, batch_size, concurrency)
+
+        keys, found, pending = await _alookup_cache(cache, texts)
+        s.set(cache_hits=len(found))
+        if pending:
+            vectors = await _aembed_uncached(list(pending.values()), batch_size, concurrency)
+            fresh = dict(zip(pending.keys(), vectors))
+            # gravação no SQLite fora do event loop
+            await asyncio.to_thread(cache.put_many, fresh)
+            found.update(fresh)
+
+        return [found[k] for k in keys]
+
+
+async def aembed_one(text: str) -> list[float]:
+    """
+    Embedding de um único texto. Pedidos simultâneos de vários chamadores
+    são juntados pelo EmbedBatcher numa única chamada ao /api/embed.
+    """
+    with span("embed", texts=1, chars=len(text), batched=True):
+        return await get_embed_batcher(aembed_texts).embed(text)
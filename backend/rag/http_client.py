@@ -0,0 +1,78 @@
+# rag/http_client.py
+"""
+Sessões HTTP compartilhadas do processo.
+- Uma única requests.Session com pool de conexões (keep-alive) para o Ollama
+- Um httpx.AsyncClient para o caminho assíncrono (API FastAPI)
+- Evita pagar handshake TCP a cada chamada de embedding/LLM
+"""
+
+from __future__ import annotations
+import os
+import asyncio
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# tamanho do pool de conexões por host (>= número de requisições paralelas)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+_session: requests.Session | None = None
+_lock = threading.Lock()
+
+# o AsyncClient fica preso ao event loop em que foi criado
+_async_client: httpx.AsyncClient | None = None
+_async_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_session() -> requests.Session:
+    """
+    Retorna a sessão HTTP compartilhada (criada na primeira chamada).
+    requests.Session é segura para uso concorrente de leitura com HTTPAdapter.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+
+def close_session() -> None:
+    """Fecha a sessão compartilhada (ex.: no shutdown da API)."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Retorna o httpx.AsyncClient compartilhado do event loop atual.
+    Se o loop mudou (ex.: vários asyncio.run em scripts), cria outro.
+    """
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop or _async_client.is_closed:
+        limits = httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+        _async_client = httpx.AsyncClient(limits=limits, timeout=None)
+        _async_loop = loop
+    return _async_client
+
+
+async def aclose_async_client() -> None:
+    """Fecha o cliente assíncrono (ex.: no shutdown da API)."""
+    global _async_client, _async_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+        _async_loop = None
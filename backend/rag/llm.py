@@ -0,0 +1,220 @@
+# rag/llm.py
+"""
+Chamadas ao endpoint /api/chat do Ollama, compartilhadas pelos classificadores.
+- call_ollama_chat: versão síncrona (requests, sessão com pool)
+- acall_ollama_chat: versão assíncrona (httpx), para a API FastAPI
+Ambas retornam apenas o conteúdo textual da resposta do modelo.
+- astream_chat_events: modo streaming; repassa os pedaços gerados e emite
+  campos do JSON (ex.: label, confidence) assim que ficam completos.
+Toda geração ocupa uma vaga do agendador (rag/scheduler.py), que limita
+quantas rodam ao mesmo tempo no host do Ollama (a mesma fila para as
+versões síncrona e assíncrona).
+"""
+
+from __future__ import annotations
+import os
+import re
+import json
+from typing import Dict, Any, List, AsyncIterator, Iterable
+
+import httpx
+import requests
+from dotenv import load_dotenv
+
+from rag.http_client import get_session, get_async_client
+from rag.scheduler import PRIORITY_INTERACTIVE, SchedulerTimeout, get_llm_scheduler, llm_slot_sync
+from rag.tracing import span
+
+load_dotenv()
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3.1:8b")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+
+class OllamaError(RuntimeError):
+    """O Ollama não respondeu ou respondeu fora do protocolo (rede, HTTP, erro no streaming)."""
+
+
+# falhas de disponibilidade do Ollama: fila cheia, erros do caminho síncrono
+# (requests, convertidos em OllamaError), do streaming e do httpx. Erros de
+# programação não entram aqui e não viram resposta degradada.
+LLM_ERRORS = (OllamaError, SchedulerTimeout, httpx.HTTPError)
+
+
+def _chat_body(
+    system_prompt: str,
+    prompt: str,
+    temperature: float,
+    json_format: bool = False,
+    stream: bool = False,
+) -> Dict[str, Any]:
+    messages: List[Dict[str, str]] = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt},
+    ]
+    body: Dict[str, Any] = {
+        "model": LLM_MODEL,
+        "messages": messages,
+        "stream": stream,
+        "options": {
+            "temperature": temperature,
+        },
+    }
+    if json_format:
+        # força o Ollama a gerar JSON válido
+        body["format"] = "json"
+    return body
+
+
+def _content(data: Dict[str, Any]) -> str:
+    msg = data.get("message", {}) or {}
+    return msg.get("content", "")
+
+
+def _usage(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Contagem de tokens que o Ollama informa na resposta final (para o rastro)."""
+    return {
+        "prompt_tokens": data.get("prompt_eval_count"),
+        "output_tokens": data.get("eval_count"),
+    }
+
+
+def call_ollama_chat(
+    system_prompt: str,
+    prompt: str,
+    temperature: float = 0.2,
+    json_format: bool = False,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> str:
+    """
+    Faz uma chamada ao endpoint /api/chat do Ollama
+    e retorna o conteúdo textual da resposta do modelo.
+    `priority` ordena a fila do LLM (PRIORITY_BATCH para avaliação/benchmark).
+    """
+    with span("llm", prompt_chars=len(system_prompt) + len(prompt)) as s:
+        try:
+            with llm_slot_sync(priority=priority):
+                resp = get_session().post(
+                    f"{OLLAMA_HOST}/api/chat",
+                    json=_chat_body(system_prompt, prompt, temperature, json_format),
+                    timeout=LLM_TIMEOUT,
+                )
+            resp.raise_for_status()
+            data = resp.json()
+        except (requests.RequestException, ValueError) as e:
+            raise OllamaError(f"Falha ao chamar o Ollama: {e}") from e
+        s.set(**_usage(data))
+    return _content(data)
+
+
+async def acall_ollama_chat(
+    system_prompt: str,
+    prompt: str,
+    temperature: float = 0.2,
+    json_format: bool = False,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> str:
+    """Versão assíncrona de call_ollama_chat (não bloqueia o event loop)."""
+    with span("llm", prompt_chars=len(system_prompt) + len(prompt)) as s:
+        async with get_llm_scheduler().slot(priority=priority):
+            resp = await get_async_client().post(
+                f"{OLLAMA_HOST}/api/chat",
+                json=_chat_body(system_prompt, prompt, temperature, json_format),
+                timeout=LLM_TIMEOUT,
+            )
+        resp.raise_for_status()
+        try:
+            data = resp.json()
+        except ValueError as e:
+            raise OllamaError(f"Resposta do Ollama não é JSON: {e}") from e
+        s.set(**_usage(data))
+    return _content(data)
+
+
+class IncrementalJsonFields:
+    """
+    Lê o JSON do modelo enquanto ele é gerado e detecta quando campos
+    escalares de nível superior ficam completos, sem esperar o objeto fechar.
+    Strings valem quando a aspa final chega; números, quando aparece o
+    separador seguinte ("," ou "}").
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.buffer = ""
+        self.pending = list(fields)
+        self._patterns = {
+            f: re.compile(
+                rf'"{re.escape(f)}"\s*:\s*(?:"((?:[^"\\]|\\.)*)"|(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)\s*[,}}\n])'
+            )
+            for f in self.pending
+        }
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Acrescenta um pedaço e retorna os campos que acabaram de ficar completos."""
+        self.buffer += chunk
+        found: Dict[str, Any] = {}
+        for f in list(self.pending):
+            m = self._patterns[f].search(self.buffer)
+            if not m:
+                continue
+            if m.group(1) is not None:
+                found[f] = json.loads(f'"{m.group(1)}"')
+            else:
+                found[f] = float(m.group(2))
+            self.pending.remove(f)
+        return found
+
+
+async def astream_ollama_chat(
+    system_prompt: str,
+    prompt: str,
+    temperature: float = 0.2,
+    json_format: bool = False,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> AsyncIterator[str]:
+    """Gera os pedaços de texto da resposta à medida que o Ollama os produz."""
+    body = _chat_body(system_prompt, prompt, temperature, json_format, stream=True)
+    # a vaga fica ocupada enquanto a geração estiver em andamento
+    with span("llm", prompt_chars=len(system_prompt) + len(prompt), stream=True) as s:
+        async with get_llm_scheduler().slot(priority=priority):
+            async with get_async_client().stream(
+                "POST", f"{OLLAMA_HOST}/api/chat", json=body, timeout=LLM_TIMEOUT
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except ValueError as e:
+                        raise OllamaError(f"Linha inválida no streaming do Ollama: {e}") from e
+                    if data.get("error"):
+                        raise OllamaError(data["error"])
+                    piece = _content(data)
+                    if piece:
+                        yield piece
+                    if data.get("done"):
+                        s.set(**_usage(data))
+                        break
+
+
+async def astream_chat_events(
+    system_prompt: str,
+    prompt: str,
+    fields: Iterable[str] = ("label", "confidence"),
+    temperature: float = 0.2,
+    json_format: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Eventos do streaming:
+    - {"event": "token", "text": ...}    a cada pedaço gerado
+    - {"event": <campo>, "value": ...}   assim que cada campo de `fields` fica completo
+    - {"event": "done", "content": ...}  texto completo no final
+    """
+    parser = IncrementalJsonFields(fields)
+    async for piece in astream_ollama_chat(system_prompt, prompt, temperature, json_format):
+        yield {"event": "token", "text": piece}
+        for name, value in parser.feed(piece).items():
+            yield {"event": name, "value": value}
+    yield {"event": "done", "content": parser.buffer}
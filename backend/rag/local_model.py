@@ -0,0 +1,216 @@
+# rag/local_model.py
+"""
+Classificador local leve (sem LLM): regressão logística sobre
+TF-IDF do texto + embedding do Ollama (o mesmo da busca, já em cache).
+
+Usos em rag/classifier.py:
+- pré-filtro: se a probabilidade passar de LOCAL_MODEL_MIN_CONFIDENCE,
+  a resposta sai em milissegundos, sem gerar texto no LLM
+- plano B: se o Ollama estiver sobrecarregado ou cair (timeout, erro de
+  rede), devolve uma resposta degradada em vez de erro
+
+O modelo é treinado por train_local_model.py com os mesmos dados que o
+ingest.py lê e salvo num arquivo joblib (LOCAL_MODEL_PATH), carregado uma
+vez por processo. scikit-learn e joblib estão no requeriments.txt (o
+treino depende deles); sem o arquivo treinado, ou se ele não carregar, o
+classificador local fica desligado e tudo segue pelo LLM.
+"""
+
+from __future__ import annotations
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from rag.embeddings import EMBED_MODEL, embed_texts
+from rag.tracing import span
+
+load_dotenv()
+
+LOCAL_MODEL_ENABLED = os.getenv("LOCAL_MODEL_ENABLED", "1") not in ("0", "false", "False")
+LOCAL_MODEL_PATH = os.getenv(
+    "LOCAL_MODEL_PATH",
+    os.path.join(os.getenv("CHROMA_DIR", "./db"), "local_classifier.joblib"),
+)
+# probabilidade mínima para responder sem o LLM (1.0 desliga o pré-filtro)
+LOCAL_MODEL_MIN_CONFIDENCE = float(os.getenv("LOCAL_MODEL_MIN_CONFIDENCE", "0.9"))
+# usa o modelo local quando o LLM falha
+LOCAL_MODEL_FALLBACK = os.getenv("LOCAL_MODEL_FALLBACK", "1") not in ("0", "false", "False")
+# peso do bloco de embedding em relação ao TF-IDF
+LOCAL_MODEL_EMBED_WEIGHT = float(os.getenv("LOCAL_MODEL_EMBED_WEIGHT", "1.0"))
+
+LABELS = ("FALSA", "VERDADEIRA")
+_NORMALIZE = {
+    "V": "VERDADEIRA",
+    "TRUE": "VERDADEIRA",
+    "T": "VERDADEIRA",
+    "F": "FALSA",
+    "FALSE": "FALSA",
+}
+
+
+def normalize_label(value: Any) -> str:
+    """Rótulo no padrão do projeto (VERDADEIRA / FALSA); "" se não reconhecido."""
+    x = str(value or "").strip().upper()
+    x = _NORMALIZE.get(x, x)
+    return x if x in LABELS else ""
+
+
+def _features(vectorizer, texts: List[str], vectors: List[List[float]], weight: float):
+    from scipy.sparse import csr_matrix, hstack
+
+    emb = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(emb, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return hstack([vectorizer.transform(texts), csr_matrix(emb / norms * weight)]).tocsr()
+
+
+def train_local_model(
+    texts: List[str],
+    labels: List[str],
+    embed: Callable[[List[str]], List[List[float]]] = embed_texts,
+    holdout: float = 0.2,
+    embed_weight: float = LOCAL_MODEL_EMBED_WEIGHT,
+) -> Dict[str, Any]:
+    """
+    Treina o classificador e devolve o artefato (dicionário pronto para
+    save_local_model). Com dados suficientes, mede a acurácia numa parte
+    separada (`holdout`) antes de treinar com tudo.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+
+    pairs = [(t, normalize_label(l)) for t, l in zip(texts, labels) if t and normalize_label(l)]
+    if len({l for _, l in pairs}) < 2:
+        raise ValueError("São necessários exemplos das duas classes (VERDADEIRA e FALSA).")
+    texts = [t for t, _ in pairs]
+    y = np.array([l for _, l in pairs])
+    vectors = embed(texts)
+
+    def fit(idx: np.ndarray):
+        vectorizer = TfidfVectorizer(
+            strip_accents="unicode", lowercase=True, ngram_range=(1, 2),
+            min_df=1, max_features=50000, sublinear_tf=True,
+        )
+        vectorizer.fit([texts[i] for i in idx])
+        X = _features(vectorizer, [texts[i] for i in idx], [vectors[i] for i in idx], embed_weight)
+        model = LogisticRegression(max_iter=2000, class_weight="balanced")
+        model.fit(X, y[idx])
+        return vectorizer, model
+
+    metrics: Dict[str, Any] = {}
+    all_idx = np.arange(len(texts))
+    if holdout > 0 and min(np.sum(y == l) for l in LABELS) >= 5:
+        tr, te = train_test_split(all_idx, test_size=holdout, stratify=y, random_state=42)
+        vectorizer, model = fit(tr)
+        X_te = _features(vectorizer, [texts[i] for i in te], [vectors[i] for i in te], embed_weight)
+        proba = model.predict_proba(X_te).max(axis=1)
+        pred = model.predict(X_te)
+        confident = proba >= LOCAL_MODEL_MIN_CONFIDENCE
+        metrics = {
+            "holdout": int(len(te)),
+            "accuracy": round(float(np.mean(pred == y[te])), 4),
+            # o que importa para o pré-filtro: quantos casos ele assume e quanto acerta neles
+            "coverage_at_min_confidence": round(float(np.mean(confident)), 4),
+            "accuracy_at_min_confidence": (
+                round(float(np.mean(pred[confident] == y[te][confident])), 4) if confident.any() else None
+            ),
+        }
+
+    vectorizer, model = fit(all_idx)
+    return {
+        "vectorizer": vectorizer,
+        "model": model,
+        "embed_model": EMBED_MODEL,
+        "embed_dim": len(vectors[0]) if vectors else 0,
+        "embed_weight": embed_weight,
+        "n_train": len(texts),
+        "metrics": metrics,
+        "trained_at": time.time(),
+    }
+
+
+def save_local_model(artifact: Dict[str, Any], path: str = LOCAL_MODEL_PATH) -> str:
+    import joblib
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    joblib.dump(artifact, tmp, compress=3)
+    os.replace(tmp, path)
+    return path
+
+
+class LocalClassifier:
+    """Artefato carregado; predict() recebe o texto e o embedding já calculado."""
+
+    def __init__(self, artifact: Dict[str, Any]):
+        self.vectorizer = artifact["vectorizer"]
+        self.model = artifact["model"]
+        self.embed_weight = float(artifact.get("embed_weight", 1.0))
+        self.info = {
+            k: artifact.get(k) for k in ("embed_model", "embed_dim", "n_train", "metrics", "trained_at")
+        }
+
+    def predict(self, text: str, vector: List[float]) -> Tuple[str, float]:
+        """(rótulo, probabilidade do rótulo)."""
+        with span("local_model") as s:
+            proba = self.model.predict_proba(_features(self.vectorizer, [text], [vector], self.embed_weight))[0]
+            best = int(np.argmax(proba))
+            label, p = str(self.model.classes_[best]), float(proba[best])
+            s.set(label=label, probability=round(p, 4))
+        return label, p
+
+
+_model: Optional[LocalClassifier] = None
+_loaded = False
+_lock = threading.Lock()
+_stats = {"prefilter": 0, "fallback": 0}
+
+
+def load_local_model(path: str = LOCAL_MODEL_PATH) -> Optional[LocalClassifier]:
+    """Carrega o artefato (uma vez). None se desligado, ausente ou incompatível."""
+    global _model, _loaded
+    with _lock:
+        if _loaded:
+            return _model
+        _loaded = True
+        if not LOCAL_MODEL_ENABLED or not os.path.exists(path):
+            return None
+        try:
+            import joblib
+            artifact = joblib.load(path)
+        except Exception as e:
+            print(f"⚠️ Classificador local indisponível ({e}); seguindo só com o LLM.")
+            return None
+        if artifact.get("embed_model") != EMBED_MODEL:
+            print(
+                f"⚠️ Classificador local treinado com '{artifact.get('embed_model')}', "
+                f"mas EMBED_MODEL é '{EMBED_MODEL}'; retreine com train_local_model.py."
+            )
+            return None
+        _model = LocalClassifier(artifact)
+        return _model
+
+
+def get_local_model() -> Optional[LocalClassifier]:
+    return _model if _loaded else load_local_model()
+
+
+def count_use(kind: str) -> None:
+    with _lock:
+        _stats[kind] += 1
+
+
+def local_model_stats() -> Dict[str, Any]:
+    """Respostas dadas pelo modelo local (pré-filtro e plano B) e dados do treino."""
+    model = _model
+    with _lock:
+        out: Dict[str, Any] = dict(_stats)
+    out["loaded"] = model is not None
+    if model is not None:
+        out.update({k: model.info[k] for k in ("n_train", "metrics")})
+    return out
@@ -0,0 +1,208 @@
+# rag/pdf_corpus.py
+"""
+Corpus de notícias em PDF (gerado por scripts_aux/pdfmaker.py):
+    <PDF_DATA_DIR>/noticias_falsas/*.pdf       -> label FALSA
+    <PDF_DATA_DIR>/noticias_verdadeiras/*.pdf  -> label VERDADEIRA
+
+- A extração de texto (pypdf) roda num pool de processos iniciados com
+  "spawn" (PDF_MP_START): o ingest já tem threads rodando (embedding,
+  escrita no índice) quando o pool sobe, e fork com threads vivas pode
+  herdar locks presos
+- Um manifesto (PDF_MANIFEST_PATH, JSON) guarda mtime, tamanho e sha1 de
+  cada arquivo: arquivo com mtime/tamanho iguais nem é aberto; se só o
+  mtime mudou, o sha1 confirma que o conteúdo é o mesmo
+- Os documentos saem no mesmo formato de ingest.iter_documents
+  ({"id", "text", "meta"}), então seguem pelo mesmo pipeline de
+  embedding e indexação
+"""
+
+from __future__ import annotations
+import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PDF_DATA_DIR = os.getenv("PDF_DATA_DIR", "Data")
+# pasta -> rótulo
+PDF_LABEL_DIRS = {
+    "noticias_falsas": "FALSA",
+    "noticias_verdadeiras": "VERDADEIRA",
+}
+PDF_WORKERS = int(os.getenv("INGEST_PDF_WORKERS", str(os.cpu_count() or 2)))
+# abaixo disso a extração roda no próprio processo (o pool não compensa)
+PDF_POOL_MIN_FILES = int(os.getenv("INGEST_PDF_POOL_MIN_FILES", "8"))
+# método de início dos processos do pool ("spawn" ou "forkserver"; nunca fork)
+PDF_MP_START = os.getenv("INGEST_PDF_MP_START", "spawn")
+PDF_MANIFEST_PATH = os.getenv(
+    "PDF_MANIFEST_PATH",
+    os.path.join(os.getenv("CHROMA_DIR", "./db"), "pdf_manifest.json"),
+)
+TITLE_MAX_CHARS = 100
+PDF_ID_PREFIX = "pdf-"
+
+
+def _file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def extract_pdf_text(path: str) -> str:
+    """Texto de todas as páginas; as quebras de linha do layout viram espaços."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    lines = []
+    for page in reader.pages:
+        lines.extend((page.extract_text() or "").splitlines())
+    return " ".join(" ".join(lines).split())
+
+
+def pdf_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool de processos para extrair PDFs, sem fork (seguro com threads vivas)."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(PDF_MP_START))
+
+
+def _extract_worker(path: str) -> Tuple[str, Optional[str], Optional[str], Optional[str]]:
+    """(caminho, sha1, texto, erro). Roda nos processos do pool."""
+    try:
+        return path, _file_sha1(path), extract_pdf_text(path), None
+    except Exception as e:
+        return path, None, None, f"{type(e).__name__}: {e}"
+
+
+def scan_pdfs(root: str = PDF_DATA_DIR) -> List[Tuple[str, str]]:
+    """[(caminho relativo a root, rótulo)] de todos os PDFs das pastas rotuladas, em ordem estável."""
+    out: List[Tuple[str, str]] = []
+    for folder, label in PDF_LABEL_DIRS.items():
+        base = os.path.join(root, folder)
+        if not os.path.isdir(base):
+            continue
+        for dirpath, _, files in os.walk(base):
+            for name in files:
+                if name.lower().endswith(".pdf"):
+                    rel = os.path.relpath(os.path.join(dirpath, name), root)
+                    out.append((rel.replace(os.sep, "/"), label))
+    return sorted(out)
+
+
+def pdf_doc_id(relpath: str) -> str:
+    """ID estável do documento: depende só do caminho relativo do arquivo."""
+    return f"{PDF_ID_PREFIX}{hashlib.sha1(relpath.encode('utf-8')).hexdigest()[:16]}"
+
+
+def make_title(text: str) -> str:
+    """Primeira frase (cortada), já que os PDFs não têm título próprio."""
+    first = text.split(". ", 1)[0].strip()
+    if len(first) <= TITLE_MAX_CHARS:
+        return first
+    return first[:TITLE_MAX_CHARS].rsplit(" ", 1)[0] + "..."
+
+
+class PdfManifest:
+    """Estado dos PDFs já processados: {caminho relativo: {mtime, size, sha1, doc_id, content_hash}}."""
+
+    def __init__(self, path: str = PDF_MANIFEST_PATH):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=0, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        self.entries = {}
+
+
+def iter_pdf_documents(
+    root: str,
+    seen_ids: set,
+    manifest: PdfManifest,
+    is_indexed: Callable[[str, str], bool],
+    content_hash: Callable[[str, Dict[str, str]], str],
+    workers: int = PDF_WORKERS,
+    stats: Optional[Dict[str, int]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Documentos dos PDFs novos ou alterados. Os que não mudaram desde o
+    manifesto (e continuam indexados, segundo `is_indexed(doc_id, hash)`)
+    não são abertos nem emitidos, mas entram em `seen_ids` para não
+    serem removidos. O manifesto é atualizado em memória; quem chama
+    grava com manifest.save() depois da indexação.
+    """
+    stats = stats if stats is not None else {}
+    files = scan_pdfs(root)
+    present = {rel for rel, _ in files}
+    for rel in list(manifest.entries):
+        if rel not in present:
+            del manifest.entries[rel]
+
+    todo: List[Tuple[str, str]] = []
+    for rel, label in files:
+        doc_id = pdf_doc_id(rel)
+        seen_ids.add(doc_id)
+        st = os.stat(os.path.join(root, rel))
+        entry = manifest.entries.get(rel)
+        if (
+            entry is not None
+            and entry.get("size") == st.st_size
+            and is_indexed(doc_id, entry.get("content_hash", ""))
+        ):
+            unchanged = entry.get("mtime") == st.st_mtime
+            if not unchanged and entry.get("sha1") == _file_sha1(os.path.join(root, rel)):
+                # arquivo regravado/copiado com o mesmo conteúdo
+                entry["mtime"] = st.st_mtime
+                unchanged = True
+            if unchanged:
+                stats["pdf_skipped"] = stats.get("pdf_skipped", 0) + 1
+                continue
+        todo.append((rel, label))
+    stats["pdf_files"] = len(files)
+
+    if not todo:
+        return
+    labels = dict(todo)
+    paths = [os.path.join(root, rel) for rel, _ in todo]
+    if len(paths) >= PDF_POOL_MIN_FILES and workers > 1:
+        pool = pdf_process_pool(min(workers, len(paths)))
+        results = pool.map(_extract_worker, paths, chunksize=max(1, len(paths) // (workers * 4)))
+    else:
+        pool, results = None, map(_extract_worker, paths)
+
+    try:
+        for path, sha1, text, error in results:
+            rel = os.path.relpath(path, root).replace(os.sep, "/")
+            if error is not None or not text:
+                print(f"⚠️ PDF ignorado ({rel}): {error or 'sem texto extraível'}")
+                stats["pdf_errors"] = stats.get("pdf_errors", 0) + 1
+                continue
+            st = os.stat(path)
+            meta = {"title": make_title(text), "label": labels[rel], "source": rel}
+            meta["content_hash"] = content_hash(text, meta)
+            doc_id = pdf_doc_id(rel)
+            manifest.entries[rel] = {
+                "mtime": st.st_mtime,
+                "size": st.st_size,
+                "sha1": sha1,
+                "doc_id": doc_id,
+                "content_hash": meta["content_hash"],
+            }
+            stats["pdf_extracted"] = stats.get("pdf_extracted", 0) + 1
+            yield {"id": doc_id, "text": text, "meta": meta}
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
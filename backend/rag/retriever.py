@@ -2,25 +2,59 @@
 """
 Retriever do RAG:
 - Consulta o banco vetorial (Chroma) pelos documentos mais similares ao texto de entrada
-- Organiza os resultados em um 'contexto' legível para ser usado pelo LLM
+- Organiza os resultados em um 'contexto' legível para ser usado pelo LLM,
+  dentro de um orçamento de tokens (RAG_CONTEXT_TOKENS): trechos quase
+  idênticos são descartados e o orçamento é dividido entre os trechos mais
+  relevantes, proporcionalmente à similaridade
+- Com a coleção dividida em passagens (rag/chunking.py), busca mais
+  passagens que o top_k e as agrupa de volta por documento (parent_id):
+  cada documento entra uma vez, só com as passagens que casaram
+- Busca híbrida (RAG_RETRIEVAL_MODE=hybrid, padrão): a busca vetorial e a
+  lexical (BM25, rag/bm25.py) rodam juntas e as listas são combinadas por
+  Reciprocal Rank Fusion. mode="lexical" (ou enunciado entre aspas) pula o
+  embedding: é o caminho rápido para achar uma citação exata
 - Retorna também uma lista de fontes e um payload bruto para depuração
 """
 
 from __future__ import annotations
 import os
+import re
 import math
-from typing import Dict, Any, List, Tuple
+import asyncio
+from typing import Dict, Any, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 
-from rag.vectordb import query_similar
+from rag.bm25 import fold, rrf_fuse
+from rag.chunking import split_sentences
+from rag.tokens import count_tokens, truncate_to_tokens
+from rag.tracing import span
+from rag.vectordb import query_similar, query_similar_many, aquery_similar, query_lexical, query_lexical_many
 
 load_dotenv()
 
 DEFAULT_TOP_K = int(os.getenv("TOP_K", "6"))
 # limite de caracteres por trecho (evita contexto enorme)
 SNIPPET_MAX_CHARS = int(os.getenv("RAG_SNIPPET_MAX", "800"))
-# limite total de caracteres do contexto concatenado
-CONTEXT_MAX_CHARS = int(os.getenv("RAG_CONTEXT_MAX", "6000"))
+# orçamento de tokens do contexto inteiro (cabeçalhos + trechos)
+CONTEXT_MAX_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1200"))
+# trecho que receberia menos que isso não entra (melhor menos trechos, mais completos)
+SNIPPET_MIN_TOKENS = int(os.getenv("RAG_SNIPPET_MIN_TOKENS", "60"))
+# similaridade de Jaccard (trigramas de palavras) a partir da qual dois trechos são "iguais"
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.8"))
+# passagens buscadas por documento pedido (várias podem vir do mesmo documento)
+PASSAGE_OVERSAMPLE = int(os.getenv("RAG_PASSAGE_OVERSAMPLE", "3"))
+# máximo de passagens de um mesmo documento no contexto
+PASSAGES_PER_DOC = int(os.getenv("RAG_PASSAGES_PER_DOC", "2"))
+# hybrid (vetorial + BM25) | vector | lexical
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid").strip().lower()
+# constante k da Reciprocal Rank Fusion (maior = posições pesam menos)
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+_MODES = ("hybrid", "vector", "lexical")
+_QUOTED = re.compile(r'^\s*["“](.+)["”]\s*$', re.S)
+
+_SEPARATOR = "\n\n---\n\n"
+_WORD = re.compile(r"\w+")
 
 
 def _truncate_txt(txt: str, max_chars: int) -> str:
@@ -62,14 +96,248 @@ def _format_block(doc: str, meta: dict, rank: int, distance: float | None) -> st
         head += f"\nFonte: {source}"
     if distance is not None and not math.isnan(distance):
         head += f"\nSimilaridade: {1 - float(distance):.3f}"
-    body = _truncate_txt(doc or "", SNIPPET_MAX_CHARS)
-    return f"{head}\nTrecho: {body}"
+    return f"{head}\nTrecho: {doc or ''}"
+
+
+def _shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall(text.casefold())
+    if len(words) < 3:
+        return {tuple(words)}
+    return {tuple(words[i : i + 3]) for i in range(len(words) - 2)}
+
+
+def _jaccard(a: Set, b: Set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _allocate(needs: List[int], weights: List[float], budget: int) -> List[int]:
+    """
+    Divide `budget` tokens entre os trechos proporcionalmente a `weights`,
+    sem dar a nenhum mais do que ele precisa (`needs`); a sobra de quem
+    coube inteiro é redistribuída entre os demais.
+    """
+    alloc = [0] * len(needs)
+    active = set(range(len(needs)))
+    remaining = max(0, budget)
+    while active and remaining > 0:
+        total = sum(weights[i] for i in active)
+        share = {i: remaining * weights[i] / total for i in active}
+        full = [i for i in active if alloc[i] + share[i] >= needs[i]]
+        if not full:
+            for i in active:
+                alloc[i] += int(share[i])
+            break
+        for i in full:
+            remaining -= needs[i] - alloc[i]
+            alloc[i] = needs[i]
+            active.discard(i)
+    return alloc
+
+
+def _weight(distance: Optional[float], rank: int) -> float:
+    if distance is None or math.isnan(distance):
+        return 1.0 / rank
+    return max(0.05, 1.0 - float(distance))
+
+
+def _join_passages(passages: List[Tuple[int, str]]) -> str:
+    """
+    Junta as passagens de um documento na ordem do texto. Vizinhas
+    perdem as frases repetidas pela sobreposição; entre passagens
+    distantes entra " [...] ".
+    """
+    out = ""
+    prev_idx: Optional[int] = None
+    prev_sents: List[str] = []
+    for idx, text in sorted(passages):
+        sents = split_sentences(text)
+        if prev_idx is None:
+            out = text
+        elif idx == prev_idx + 1:
+            # maior prefixo da passagem que repete o fim da anterior
+            k = min(len(sents), len(prev_sents))
+            while k and sents[:k] != prev_sents[-k:]:
+                k -= 1
+            rest = " ".join(sents[k:])
+            out = f"{out} {rest}" if rest else out
+        else:
+            out = f"{out} [...] {text}"
+        prev_idx, prev_sents = idx, sents
+    return out
+
+
+def _group_by_parent(
+    docs: List[str],
+    metas: List[dict],
+    dists: List[Optional[float]],
+    ids: List[str],
+    limit: int,
+) -> List[Tuple[str, dict, Optional[float]]]:
+    """
+    Agrupa as passagens pelo documento de origem, na ordem do melhor
+    acerto de cada um. Coleções antigas (sem parent_id) passam como estão.
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    for n, (d, m, dist) in enumerate(zip(docs, metas, dists)):
+        m = m or {}
+        parent = m.get("parent_id") or (ids[n] if n < len(ids) else f"#{n}")
+        g = groups.get(parent)
+        if g is None:
+            if len(groups) >= limit:
+                continue
+            g = groups[parent] = {"meta": m, "dist": dist, "passages": []}
+        if len(g["passages"]) < max(1, PASSAGES_PER_DOC):
+            g["passages"].append((int(m.get("passage", 0)), _truncate_txt(d or "", SNIPPET_MAX_CHARS)))
+    return [(_join_passages(g["passages"]), g["meta"], g["dist"]) for g in groups.values()]
+
+
+def _context_from_result(
+    res: Dict[str, Any],
+    include_distances: bool = True,
+    token_budget: int | None = None,
+    top_k: int | None = None,
+) -> Dict[str, Any]:
+    """
+    Monta o payload de contexto a partir de um resultado de query_similar.
+    `top_k` limita quantos documentos distintos entram (padrão: todos).
+    """
+    with span("build_context") as s:
+        ctx = _format_context(res, include_distances, int(token_budget or CONTEXT_MAX_TOKENS), top_k)
+        s.set(hits=ctx["hits"], chars=len(ctx["context"]), tokens=ctx["tokens"]["context"])
+    return ctx
+
+
+def _format_context(
+    res: Dict[str, Any],
+    include_distances: bool,
+    budget: int,
+    top_k: int | None = None,
+) -> Dict[str, Any]:
+    docs: List[str] = (res.get("documents") or [[]])[0]
+    metas: List[dict] = (res.get("metadatas") or [[]])[0]
+    dists: List[float] = (res.get("distances") or [[]])[0] if include_distances else [None] * len(docs)
+    ids: List[str] = (res.get("ids") or [[]])[0]
+
+    # 1) passagens do mesmo documento viram um trecho só
+    grouped = _group_by_parent(docs, metas, dists, ids, int(top_k or len(docs) or 1))
+
+    # 2) descarta trechos quase idênticos a um mais bem ranqueado
+    cands: List[Tuple[str, dict, Optional[float]]] = []
+    seen: List[Set] = []
+    duplicates = 0
+    for body, m, dist in grouped:
+        sh = _shingles(body)
+        if any(_jaccard(sh, other) >= DEDUP_THRESHOLD for other in seen):
+            duplicates += 1
+            continue
+        seen.append(sh)
+        cands.append((body, m, dist if include_distances else None))
+
+    # 3) escolhe quantos trechos cabem e divide o orçamento entre eles
+    sep_tokens = count_tokens(_SEPARATOR)
+    alloc: List[int] = []
+    while cands:
+        heads = [
+            count_tokens(_format_block("", m, rank=i, distance=dist)) + sep_tokens
+            for i, (_, m, dist) in enumerate(cands, start=1)
+        ]
+        if sum(heads) > budget:
+            # nem os cabeçalhos cabem: o menos relevante sai antes de dividir
+            cands.pop()
+            alloc = []
+            continue
+        needs = [count_tokens(body) for body, _, _ in cands]
+        weights = [_weight(dist, i) for i, (_, _, dist) in enumerate(cands, start=1)]
+        alloc = _allocate(needs, weights, budget - sum(heads))
+        starved = any(a < min(n, SNIPPET_MIN_TOKENS) for a, n in zip(alloc, needs))
+        if starved and (len(cands) > 1 or alloc[0] == 0):
+            # o menos relevante sai e o orçamento é redividido
+            cands.pop()
+            alloc = []
+            continue
+        break
+
+    blocks: List[str] = []
+    for i, ((body, m, dist), n_tokens) in enumerate(zip(cands, alloc), start=1):
+        blocks.append(_format_block(truncate_to_tokens(body, n_tokens), m, rank=i, distance=dist))
+
+    context = _SEPARATOR.join(blocks)
+    sources = _unique_sources([m for _, m, _ in grouped])
+
+    return {
+        "context": context,
+        "hits": len(blocks),
+        "sources": sources,
+        "tokens": {
+            "context": count_tokens(context),
+            "budget": budget,
+            "candidates": len(docs),
+            "documents": len(grouped),
+            "duplicates": duplicates,
+        },
+        "raw": {
+            "documents": docs,
+            "metadatas": metas,
+            "distances": dists if include_distances else [],
+        },
+    }
+
+
+def _resolve_mode(query: str, mode: str | None) -> Tuple[str, Optional[str]]:
+    """(modo efetivo, frase exata ou None). Enunciado todo entre aspas vai para o modo lexical."""
+    quoted = _QUOTED.match(query or "")
+    if mode is None and quoted:
+        return "lexical", quoted.group(1)
+    mode = (mode or RETRIEVAL_MODE).strip().lower()
+    if mode not in _MODES:
+        raise ValueError(f"Modo de recuperação desconhecido: {mode!r} (use {', '.join(_MODES)}).")
+    return mode, quoted.group(1) if quoted and mode == "lexical" else None
+
+
+def _rows(res: Dict[str, Any]) -> Dict[str, Tuple[str, dict, Optional[float]]]:
+    ids = (res.get("ids") or [[]])[0]
+    docs = (res.get("documents") or [[]])[0]
+    metas = (res.get("metadatas") or [[]])[0]
+    dists = (res.get("distances") or [[None] * len(ids)])[0]
+    return {i: (d, m, dist) for i, d, m, dist in zip(ids, docs, metas, dists)}
+
+
+def _as_result(items: List[Tuple[str, Tuple[str, dict, Optional[float]]]]) -> Dict[str, Any]:
+    """Volta ao formato de query_similar (listas aninhadas)."""
+    return {
+        "ids": [[i for i, _ in items]],
+        "documents": [[r[0] for _, r in items]],
+        "metadatas": [[r[1] for _, r in items]],
+        "distances": [[r[2] for _, r in items]],
+    }
+
+
+def _fuse(vector_res: Dict[str, Any], lexical_res: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    """
+    Combina as duas listas por RRF, no formato de query_similar. Itens só
+    da busca lexical ficam sem distância (None).
+    """
+    vec, lex = _rows(vector_res), _rows(lexical_res)
+    fused = rrf_fuse([list(vec), list(lex)], k=RRF_K, limit=limit)
+    return _as_result([(i, vec.get(i) or lex[i]) for i, _ in fused])
+
+
+def _exact_first(res: Dict[str, Any], phrase: Optional[str]) -> Dict[str, Any]:
+    """Com uma citação exata, os trechos que a contêm (sem acento/caixa) sobem para o topo."""
+    if not phrase:
+        return res
+    needle = " ".join(fold(phrase).split())
+    return _as_result(sorted(_rows(res).items(), key=lambda kv: needle not in " ".join(fold(kv[1][0] or "").split())))
 
 
 def build_context(
     query: str,
     top_k: int | None = None,
     include_distances: bool = True,
+    token_budget: int | None = None,
+    mode: str | None = None,
 ) -> Dict[str, Any]:
     """
     Executa a busca semântica e monta o contexto RAG.
@@ -79,46 +347,94 @@ def build_context(
       "context": "<texto pronto para o LLM>",
       "hits": <int>,
       "sources": ["Titulo | url | label", ...],
+      "tokens": {"context", "budget", "candidates", "documents", "duplicates"},
       "raw": {  # resposta bruta do Chroma para debug
          "documents": [...],
          "metadatas": [...],
          "distances": [...]
       }
     }
+    `token_budget` (padrão RAG_CONTEXT_TOKENS) troca tamanho do prompt por latência.
+    `mode` (padrão RAG_RETRIEVAL_MODE): "hybrid", "vector" ou "lexical".
     """
     k = int(top_k or DEFAULT_TOP_K)
-    res = query_similar(
-        query_text=query,
-        top_k=k,
-        include_distances=include_distances,
-    )
+    n = k * max(1, PASSAGE_OVERSAMPLE)
+    mode, phrase = _resolve_mode(query, mode)
+    if mode == "lexical":
+        res = _exact_first(query_lexical(query_text=phrase or query, top_k=n), phrase)
+    else:
+        res = query_similar(query_text=query, top_k=n, include_distances=include_distances)
+        if mode == "hybrid":
+            res = _fuse(res, query_lexical(query_text=query, top_k=n), n)
+    return _context_from_result(res, include_distances, token_budget, top_k=k)
 
-    docs: List[str] = (res.get("documents") or [[]])[0]
-    metas: List[dict] = (res.get("metadatas") or [[]])[0]
-    dists: List[float] = (res.get("distances") or [[]])[0] if include_distances else [None] * len(docs)
 
-    blocks: List[str] = []
-    used_chars = 0
-    for i, (d, m, dist) in enumerate(zip(docs, metas, dists), start=1):
-        block = _format_block(d, m, rank=i, distance=dist if include_distances else None)
-        if used_chars + len(block) > CONTEXT_MAX_CHARS and blocks:
-            break
-        blocks.append(block)
-        used_chars += len(block)
+async def abuild_context(
+    query: str,
+    top_k: int | None = None,
+    include_distances: bool = True,
+    token_budget: int | None = None,
+    mode: str | None = None,
+) -> Dict[str, Any]:
+    """Versão assíncrona de build_context (mesmo formato de retorno)."""
+    k = int(top_k or DEFAULT_TOP_K)
+    n = k * max(1, PASSAGE_OVERSAMPLE)
+    mode, phrase = _resolve_mode(query, mode)
+    if mode == "lexical":
+        res = _exact_first(await asyncio.to_thread(query_lexical, phrase or query, n), phrase)
+    elif mode == "hybrid":
+        # BM25 numa thread enquanto o embedding da consulta vai ao Ollama
+        vec, lex = await asyncio.gather(
+            aquery_similar(query_text=query, top_k=n, include_distances=include_distances),
+            asyncio.to_thread(query_lexical, query, n),
+        )
+        res = _fuse(vec, lex, n)
+    else:
+        res = await aquery_similar(query_text=query, top_k=n, include_distances=include_distances)
+    return _context_from_result(res, include_distances, token_budget, top_k=k)
 
-    context = "\n\n---\n\n".join(blocks)
-    sources = _unique_sources(metas)
 
-    return {
-        "context": context,
-        "hits": len(blocks),
-        "sources": sources,
-        "raw": {
-            "documents": docs,
-            "metadatas": metas,
-            "distances": dists if include_distances else [],
-        },
-    }
+def build_context_many(
+    queries: List[str],
+    top_k: int | None = None,
+    include_distances: bool = True,
+    token_budget: int | None = None,
+    mode: str | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Versão em lote de build_context: um embedding em lote e uma única
+    consulta multi-vetor para todos os enunciados (no modo híbrido, também
+    uma única pontuação BM25 para todos).
+    Retorna uma lista de payloads (mesmo formato de build_context), na ordem da entrada.
+    O modo é resolvido por enunciado como em build_context (enunciado entre
+    aspas vai para o lexical; modo inválido lança ValueError).
+    """
+    k = int(top_k or DEFAULT_TOP_K)
+    n = k * max(1, PASSAGE_OVERSAMPLE)
+    resolved = [_resolve_mode(q, mode) for q in queries]
+    results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+
+    lexical = [i for i, (m, _) in enumerate(resolved) if m == "lexical"]
+    if lexical:
+        phrases = [resolved[i][1] for i in lexical]
+        found = query_lexical_many(query_texts=[p or queries[i] for i, p in zip(lexical, phrases)], top_k=n)
+        for i, phrase, res in zip(lexical, phrases, found):
+            results[i] = _exact_first(res, phrase)
+
+    vector = [i for i, (m, _) in enumerate(resolved) if m != "lexical"]
+    if vector:
+        found = query_similar_many(
+            query_texts=[queries[i] for i in vector], top_k=n, include_distances=include_distances
+        )
+        for i, res in zip(vector, found):
+            results[i] = res
+        hybrid = [i for i in vector if resolved[i][0] == "hybrid"]
+        if hybrid:
+            found = query_lexical_many(query_texts=[queries[i] for i in hybrid], top_k=n)
+            for i, lex in zip(hybrid, found):
+                results[i] = _fuse(results[i], lex, n)
+
+    return [_context_from_result(res, include_distances, token_budget, top_k=k) for res in results]
 
 
 def build_prompt_for_llm(claim: str, ctx: str) -> str:
@@ -0,0 +1,419 @@
+# rag/scheduler.py
+"""
+Agendador na frente do Ollama.
+
+Numa máquina sem GPU, gerações concorrentes só disputam CPU entre si e
+pedidos idênticos em andamento são calculados duas vezes. Este módulo:
+- SingleFlight / AsyncSingleFlight: pedidos idênticos em andamento
+  compartilham um único cálculo
+- LLMScheduler: limita quantas gerações rodam ao mesmo tempo
+  (LLM_MAX_CONCURRENCY), somando threads e event loops; o resto espera
+  numa fila com prioridade (pedidos da API antes de avaliação e
+  benchmark, PRIORITY_BATCH) e prazo (LLM_QUEUE_TIMEOUT)
+- EmbedBatcher: junta embeddings pedidos por vários chamadores num
+  intervalo curto (EMBED_BATCH_WINDOW_MS) numa única chamada ao /api/embed
+- stats(): profundidade da fila e tempo de espera
+
+O single-flight e o micro-lote assíncronos pertencem ao event loop em
+que foram criados (get_single_flight / get_embed_batcher); a fila do LLM
+é uma só por processo (get_llm_scheduler).
+"""
+
+from __future__ import annotations
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import contextvars
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# gerações simultâneas que o host do Ollama aguenta
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "1"))
+# tempo máximo (s) esperando na fila por uma vaga
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "120"))
+# janela (ms) para juntar pedidos de embedding num único lote
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "64"))
+
+# prioridades (menor = atendido antes)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class SchedulerTimeout(TimeoutError):
+    """O pedido esperou mais que o prazo na fila do LLM."""
+
+
+class _WaitStats:
+    """Janela deslizante dos tempos de espera (para média e p95)."""
+
+    def __init__(self, size: int = 1000):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.total = 0
+        self.timeouts = 0
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.total += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        s = sorted(self.samples)
+        return {
+            "served": self.total,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(1000 * sum(s) / len(s), 2) if s else 0.0,
+            "wait_p95_ms": round(1000 * s[int(0.95 * (len(s) - 1))], 2) if s else 0.0,
+            "wait_max_ms": round(1000 * s[-1], 2) if s else 0.0,
+        }
+
+
+# ---------------- single-flight ----------------
+
+class SingleFlight:
+    """Versão com threads: chamadas com a mesma chave em andamento esperam a primeira."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Dict[str, Any]] = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """Executa fn() uma vez por chave em andamento. Retorna (resultado, compartilhado)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+
+        try:
+            call["result"] = fn()
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["event"].set()
+        return call["result"], False
+
+
+class AsyncSingleFlight:
+    """
+    Versão assíncrona: o cálculo roda numa Task própria e todos os
+    chamadores (inclusive o primeiro) a aguardam com shield, então o
+    cancelamento de um deles (ex.: cliente que desconectou) não cancela
+    o cálculo dos outros.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), False
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # evita "exception was never retrieved" quando ninguém mais espera
+            task.exception()
+
+
+# ---------------- fila do LLM ----------------
+
+class _Waiter:
+    """Pedido na fila do LLM; `wake` entrega a vaga e devolve False se o dono já não existe."""
+
+    __slots__ = ("wake", "granted", "cancelled")
+
+    def __init__(self, wake: Callable[[], bool]):
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """
+    Semáforo com fila de prioridade, um por processo e compartilhado pelos
+    caminhos síncrono (threads) e assíncrono (event loops): no máximo
+    `max_concurrency` gerações ao mesmo tempo; os demais esperam em ordem
+    (prioridade, chegada).
+    Uso:
+        async with scheduler.slot(priority=PRIORITY_INTERACTIVE):
+            ... chamada ao Ollama ...
+        with scheduler.slot_sync(priority=PRIORITY_BATCH):
+            ... chamada ao Ollama ...
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self.in_flight = 0
+        self.queue_depth = 0
+        self._waiters: List[tuple] = []  # heap de (prioridade, seq, _Waiter)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = _WaitStats()
+
+    def _enqueue(self, priority: int, wake: Callable[[], bool]) -> Optional[_Waiter]:
+        """Vaga imediata (None) ou o pedido colocado na fila."""
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self.queue_depth:
+                self.in_flight += 1
+                return None
+            waiter = _Waiter(wake)
+            heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+            self.queue_depth += 1
+            return waiter
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """Tira o pedido da fila. True se a vaga já tinha sido entregue (quem chama fica com ela)."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self.queue_depth -= 1
+            return False
+
+    def release(self) -> None:
+        # a vaga passa direto para o próximo da fila que ainda espera
+        while True:
+            with self._lock:
+                waiter = None
+                while self._waiters:
+                    _, _, w = heapq.heappop(self._waiters)
+                    if not w.cancelled:
+                        waiter = w
+                        waiter.granted = True
+                        self.queue_depth -= 1
+                        break
+                if waiter is None:
+                    self.in_flight -= 1
+                    return
+            if waiter.wake():
+                return
+            # o dono sumiu (event loop encerrado): a vaga segue para o próximo
+
+    def acquire_sync(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = LLM_QUEUE_TIMEOUT) -> None:
+        t0 = time.perf_counter()
+        event = threading.Event()
+
+        def wake() -> bool:
+            event.set()
+            return True
+
+        waiter = self._enqueue(priority, wake)
+        if waiter is not None and not event.wait(timeout) and not self._give_up(waiter):
+            self.stats.timeouts += 1
+            raise SchedulerTimeout(f"Sem vaga no LLM após {timeout:.0f} s de espera.")
+        self.stats.add(time.perf_counter() - t0)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = LLM_QUEUE_TIMEOUT) -> None:
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def grant() -> None:
+            if not fut.done():
+                fut.set_result(None)
+
+        def wake() -> bool:
+            try:
+                loop.call_soon_threadsafe(grant)
+            except RuntimeError:
+                return False
+            return True
+
+        waiter = self._enqueue(priority, wake)
+        if waiter is None:
+            self.stats.add(0.0)
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            if not self._give_up(waiter):
+                self.stats.timeouts += 1
+                raise SchedulerTimeout(f"Sem vaga no LLM após {timeout:.0f} s de espera.")
+            # a vaga chegou junto com o prazo: fica com ela
+        except asyncio.CancelledError:
+            if self._give_up(waiter):
+                self.release()
+            raise
+        self.stats.add(time.perf_counter() - t0)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = LLM_QUEUE_TIMEOUT):
+        await self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def slot_sync(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = LLM_QUEUE_TIMEOUT):
+        self.acquire_sync(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        s = self.stats.snapshot()
+        s.update({"in_flight": self.in_flight, "queue_depth": self.queue_depth, "max_concurrency": self.max_concurrency})
+        return s
+
+
+_llm_scheduler = LLMScheduler()
+
+
+def llm_slot_sync(priority: int = PRIORITY_INTERACTIVE, timeout: float = LLM_QUEUE_TIMEOUT):
+    """Vaga de geração para o caminho síncrono (threads); mesma fila do caminho assíncrono."""
+    return _llm_scheduler.slot_sync(priority, timeout)
+
+
+# ---------------- micro-lotes de embedding ----------------
+
+class EmbedBatcher:
+    """
+    Junta pedidos de embedding de vários chamadores: o primeiro pedido abre
+    uma janela de EMBED_BATCH_WINDOW_MS; tudo que chegar nela (até
+    EMBED_BATCH_MAX textos) vai numa única chamada a `embed_many`.
+    """
+
+    def __init__(
+        self,
+        embed_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_ms: float = EMBED_BATCH_WINDOW_MS,
+        max_batch: int = EMBED_BATCH_MAX,
+    ):
+        self.embed_many = embed_many
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: List[tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # referências fortes: o event loop só guarda referências fracas das tasks
+        self._tasks: set = set()
+        self.batches = 0
+        self.items = 0
+
+    async def embed(self, text: str) -> List[float]:
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # contexto vazio: o lote não pertence ao rastro (rag/tracing.py) de nenhum chamador
+            task = contextvars.Context().run(asyncio.ensure_future, self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[tuple[str, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            vectors = await self.embed_many([t for t, _ in batch])
+        except BaseException as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), vec in zip(batch, vectors):
+            if not fut.done():
+                fut.set_result(vec)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": len(self._pending),
+        }
+
+
+# ---------------- instâncias por event loop ----------------
+
+_per_loop: Dict[int, Dict[str, Any]] = {}
+_sync_flight = SingleFlight()
+
+
+def _loop_state() -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    state = _per_loop.get(id(loop))
+    if state is None or state["loop"] is not loop:
+        # loops antigos (ex.: asyncio.run em scripts) são descartados
+        _per_loop.clear()
+        state = {"loop": loop}
+        _per_loop[id(loop)] = state
+    return state
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Fila do LLM do processo (a mesma para threads e event loops)."""
+    return _llm_scheduler
+
+
+def get_single_flight() -> AsyncSingleFlight:
+    state = _loop_state()
+    if "flight" not in state:
+        state["flight"] = AsyncSingleFlight()
+    return state["flight"]
+
+
+def get_sync_single_flight() -> SingleFlight:
+    return _sync_flight
+
+
+def get_embed_batcher(embed_many: Callable[[List[str]], Awaitable[List[List[float]]]]) -> EmbedBatcher:
+    state = _loop_state()
+    if "embed" not in state:
+        state["embed"] = EmbedBatcher(embed_many)
+    return state["embed"]
+
+
+def stats() -> Dict[str, Any]:
+    """Profundidade das filas, tempos de espera e pedidos coalescidos."""
+    out: Dict[str, Any] = {
+        "llm": _llm_scheduler.snapshot(),
+        "single_flight_sync": {"coalesced": _sync_flight.coalesced},
+    }
+    for state in _per_loop.values():
+        if "flight" in state:
+            out["single_flight"] = {"coalesced": state["flight"].coalesced}
+        if "embed" in state:
+            out["embed_batcher"] = state["embed"].snapshot()
+    return out
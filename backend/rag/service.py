@@ -0,0 +1,227 @@
+# rag/service.py
+"""
+Camada de serviço da API: liga o FastAPI aos classificadores.
+
+Modos de verificação:
+- "llm": chamada direta ao LLM, sem contexto (comportamento original do main.py)
+- "rag": RAG local (Chroma) + LLM  -> rag.classifier
+- "web": RAG local + DuckDuckGo + LLM -> rag.classifier_web
+
+Tudo que é caro de criar (coleção, sessões HTTP, modelos carregados no
+Ollama) é inicializado UMA vez em startup(); cada requisição paga só
+o trabalho da própria consulta.
+"""
+
+from __future__ import annotations
+import os
+import json
+from typing import Dict, Any, List, AsyncIterator
+
+from dotenv import load_dotenv
+
+from rag.classifier import aclassify_claim, astream_classify_claim, shortcut_stats
+from rag.classifier_web import aclassify_claim_with_web, astream_classify_claim_with_web
+from rag.embeddings import EMBED_MODEL, close_embedding_cache
+from rag.http_client import get_session, get_async_client, close_session, aclose_async_client
+from rag import scheduler
+from rag.llm import OLLAMA_HOST, LLM_MODEL, acall_ollama_chat, astream_chat_events
+from rag.local_model import load_local_model, local_model_stats
+from rag.tracing import render_prometheus
+from rag.vectordb import init_vectordb, close_vectordb
+from rag.verdict_cache import get_verdict_cache
+from rag.web_search import web_cache_stats
+
+load_dotenv()
+
+MODES = ("llm", "rag", "web")
+# modo usado quando o pedido não informa "mode"; "llm" volta ao caminho antigo (só o LLM, sem RAG)
+DEFAULT_MODE = os.getenv("VERIFY_DEFAULT_MODE", "rag")
+MAX_WEB_RESULTS = int(os.getenv("MAX_WEB_RESULTS", "5"))
+# por quanto tempo o Ollama mantém os modelos carregados após o aquecimento
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Esta é a instrução principal para o LLM no modo direto.
+# Pedir para ele responder APENAS com JSON é a parte mais importante.
+DIRECT_SYSTEM_PROMPT = """
+Você é um analista profissional de checagem de fatos.
+Analise cuidadosamente o texto da notícia fornecida e determine sua veracidade.
+
+Regras importantes:
+- Pense passo a passo.
+- NÃO invente fatos; baseie sua resposta apenas em lógica, coerência e conhecimento geral.
+- Responda APENAS em JSON válido.
+
+Formato obrigatório da resposta:
+{
+  "veracidade": "FATO" | "FALSO" | "INCONCLUSIVO",
+  "score": número entre 0.0 e 1.0,
+  "analise": "Explique em uma frase clara o porquê dessa conclusão."
+}
+"""
+
+# rótulos dos classificadores RAG -> rótulos que o frontend exibe
+_VERACIDADE = {
+    "VERDADEIRA": "FATO",
+    "FALSA": "FALSO",
+}
+
+
+class VerificationError(Exception):
+    """O modelo não devolveu uma resposta utilizável."""
+
+
+async def warm_up_models() -> None:
+    """
+    Pede ao Ollama para carregar o LLM e o modelo de embedding agora,
+    em vez de na primeira requisição. Falhas só geram aviso.
+    """
+    client = get_async_client()
+    try:
+        # /api/generate sem prompt apenas carrega o modelo na memória
+        await client.post(
+            f"{OLLAMA_HOST}/api/generate",
+            json={"model": LLM_MODEL, "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=300,
+        )
+        await client.post(
+            f"{OLLAMA_HOST}/api/embed",
+            json={"model": EMBED_MODEL, "input": "aquecimento", "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=300,
+        )
+    except Exception as e:
+        print(f"⚠️ Não foi possível aquecer os modelos no Ollama: {e}")
+
+
+async def startup() -> List[Dict[str, Any]]:
+    """Inicializa coleção, sessões HTTP e modelos. Retorna o resumo do índice."""
+    info = init_vectordb()
+    get_session()
+    get_async_client()
+    load_local_model()
+    await warm_up_models()
+    return info
+
+
+async def shutdown() -> None:
+    close_vectordb()
+    close_embedding_cache()
+    close_session()
+    await aclose_async_client()
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Estatísticas do cache de veredictos (taxa de acerto, entradas...)."""
+    cache = get_verdict_cache()
+    return cache.snapshot() if cache is not None else {"enabled": False}
+
+
+def web_stats() -> Dict[str, Any]:
+    """Acertos e entradas do cache de resultados da web."""
+    return web_cache_stats()
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    """Fila do LLM (profundidade, espera), micro-lotes de embedding e pedidos coalescidos."""
+    return scheduler.stats()
+
+
+def bypass_stats() -> Dict[str, Any]:
+    """Verificações RAG respondidas sem o LLM: atalho pela base e classificador local."""
+    return {**shortcut_stats(), "local_model": local_model_stats()}
+
+
+def metrics_text() -> str:
+    """Métricas em formato Prometheus: duração por etapa, fila do LLM, atalhos sem LLM e cache de veredictos."""
+    gauges: Dict[str, float] = {}
+    sched = scheduler.stats()
+    if "llm" in sched:
+        gauges["aletheia_llm_queue_depth"] = sched["llm"]["queue_depth"]
+        gauges["aletheia_llm_in_flight"] = sched["llm"]["in_flight"]
+    if "single_flight" in sched:
+        gauges["aletheia_single_flight_coalesced"] = sched["single_flight"]["coalesced"]
+    bypass = shortcut_stats()
+    gauges["aletheia_llm_bypassed"] = bypass["bypassed"]
+    gauges["aletheia_llm_bypass_rate"] = bypass["bypass_rate"]
+    local = local_model_stats()
+    gauges["aletheia_local_model_prefilter"] = local["prefilter"]
+    gauges["aletheia_local_model_fallback"] = local["fallback"]
+    cache = cache_stats()
+    if "hit_rate" in cache:
+        gauges["aletheia_verdict_cache_hit_rate"] = cache["hit_rate"]
+        gauges["aletheia_verdict_cache_entries"] = cache["entries"]
+    return render_prometheus(gauges)
+
+
+def to_frontend(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converte a saída dos classificadores RAG ({label, confidence, rationale, ...})
+    para o formato que o frontend exibe ({veracidade, score, analise}),
+    mantendo os campos originais para quem quiser os detalhes.
+    """
+    label = str(result.get("label", "")).strip().upper()
+    out = dict(result)
+    out["veracidade"] = _VERACIDADE.get(label, "INCONCLUSIVO")
+    try:
+        out["score"] = float(result.get("confidence", 0.0))
+    except (TypeError, ValueError):
+        out["score"] = 0.0
+    out["analise"] = result.get("rationale", "")
+    return out
+
+
+async def verify(text: str, mode: str = DEFAULT_MODE) -> Dict[str, Any]:
+    """Verifica uma notícia no modo pedido e devolve a resposta no formato do frontend."""
+    if mode not in MODES:
+        raise ValueError(f"Modo inválido: {mode!r}. Use um de {MODES}.")
+
+    if mode == "llm":
+        raw = await acall_ollama_chat(DIRECT_SYSTEM_PROMPT, text, json_format=True)
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise VerificationError(f"Erro ao decodificar JSON do LLM: {e}") from e
+
+    if mode == "rag":
+        result = await aclassify_claim(text)
+    else:
+        result = await aclassify_claim_with_web(text, max_web_results=MAX_WEB_RESULTS)
+
+    if "error" in result:
+        raise VerificationError(result["error"])
+    return to_frontend(result)
+
+
+async def astream_verify(text: str, mode: str = DEFAULT_MODE) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Versão em streaming de verify. Repassa os eventos do classificador
+    ("context", "web", "token", campos parciais) e termina com
+    {"event": "result", "data": <formato do frontend>} ou {"event": "error", ...}.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Modo inválido: {mode!r}. Use um de {MODES}.")
+
+    if mode == "llm":
+        fields = ("veracidade", "score")
+        async for ev in astream_chat_events(DIRECT_SYSTEM_PROMPT, text, fields=fields, json_format=True):
+            if ev["event"] != "done":
+                yield ev
+                continue
+            try:
+                yield {"event": "result", "data": json.loads(ev["content"])}
+            except json.JSONDecodeError:
+                yield {"event": "error", "detail": "Erro ao processar a resposta do LLM."}
+        return
+
+    if mode == "rag":
+        events = astream_classify_claim(text)
+    else:
+        events = astream_classify_claim_with_web(text, max_web_results=MAX_WEB_RESULTS)
+
+    async for ev in events:
+        if ev["event"] == "result":
+            if "error" in ev["data"]:
+                yield {"event": "error", "detail": ev["data"]["error"]}
+            else:
+                yield {"event": "result", "data": to_frontend(ev["data"])}
+        else:
+            yield ev
@@ -0,0 +1,81 @@
+# rag/tokens.py
+"""
+Contagem de tokens para montar o prompt dentro de um orçamento.
+
+- Se RAG_TOKENIZER apontar para um tokenizer do Hugging Face (ex.:
+  "meta-llama/Llama-3.1-8B-Instruct") e o pacote transformers estiver
+  instalado, usa o tokenizer do próprio modelo
+- Senão, usa uma aproximação: palavras x TOKENS_PER_WORD + pontuação
+  (calibrada para o llama3 em português; ajuste pelo .env)
+Os resultados ficam em cache (LRU), já que os mesmos trechos se repetem.
+"""
+
+from __future__ import annotations
+import os
+import re
+import math
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RAG_TOKENIZER = os.getenv("RAG_TOKENIZER", "")
+TOKENS_PER_WORD = float(os.getenv("TOKENS_PER_WORD", "1.4"))
+
+_WORD = re.compile(r"\w+")
+_PUNCT = re.compile(r"[^\w\s]")
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+def _get_tokenizer():
+    """Tokenizer do modelo (None se não configurado ou indisponível)."""
+    global _tokenizer, _tokenizer_loaded
+    if _tokenizer_loaded:
+        return _tokenizer
+    _tokenizer_loaded = True
+    if not RAG_TOKENIZER:
+        return None
+    try:
+        from transformers import AutoTokenizer
+        _tokenizer = AutoTokenizer.from_pretrained(RAG_TOKENIZER)
+    except Exception as e:
+        print(f"⚠️ Tokenizer '{RAG_TOKENIZER}' indisponível ({e}); usando aproximação.")
+        _tokenizer = None
+    return _tokenizer
+
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    """Quantidade de tokens de `text` (exata com o tokenizer do modelo, senão aproximada)."""
+    if not text:
+        return 0
+    tok = _get_tokenizer()
+    if tok is not None:
+        return len(tok.encode(text, add_special_tokens=False))
+    words = len(_WORD.findall(text))
+    return math.ceil(words * TOKENS_PER_WORD) + len(_PUNCT.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """Corta `text` em fronteira de palavra para caber em `max_tokens` (sufixo incluído)."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    # busca binária no número de palavras que cabe junto com o sufixo
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]).rstrip() + suffix) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]).rstrip() + suffix if lo else ""
+
+
+def tokenizer_name() -> Optional[str]:
+    """Nome do tokenizer em uso (None = aproximação)."""
+    return RAG_TOKENIZER if _get_tokenizer() is not None else None
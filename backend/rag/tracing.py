@@ -0,0 +1,227 @@
+# rag/tracing.py
+"""
+Rastreamento leve por etapa do pipeline (embedding, busca, contexto,
+web, LLM).
+
+- span(nome, **atributos): mede a duração de uma etapa e guarda
+  tamanhos (textos, caracteres, hits, tokens) e o erro, se houver
+- start_trace() / @traced: abre um rastro para a verificação atual
+  (contextvar, vale também dentro de asyncio.gather e asyncio.to_thread);
+  os spans abertos dentro dele aparecem em result["debug"]["trace"]
+- Todo span também alimenta métricas do processo (histograma por etapa),
+  exportadas no formato Prometheus por render_prometheus()
+
+Com TRACING_ENABLED=0, span() devolve um objeto nulo compartilhado e
+não mede nada.
+"""
+
+from __future__ import annotations
+import os
+import time
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") not in ("0", "false", "False")
+
+# limites (s) dos baldes do histograma de duração
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Trace:
+    """Spans de uma verificação (uma chamada a classify_claim)."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+    def to_dict(self) -> Dict[str, Any]:
+        stages: Dict[str, float] = {}
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        for s in spans:
+            stages[s["name"]] = round(stages.get(s["name"], 0.0) + s["ms"], 3)
+        return {
+            "total_ms": round(1000 * (time.perf_counter() - self.t0), 3),
+            "stages": stages,
+            "spans": spans,
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("aletheia_trace", default=None)
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "t0")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self.t0 = 0.0
+
+    def set(self, **attrs: Any) -> None:
+        """Acrescenta atributos conhecidos só depois da etapa (ex.: hits)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "_Span":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        t1 = time.perf_counter()
+        seconds = t1 - self.t0
+        error = None if exc is None else f"{exc_type.__name__}: {exc}"
+        _metrics.observe(self.name, seconds, error is not None)
+
+        trace = _current.get()
+        if trace is not None:
+            record = {
+                "name": self.name,
+                "start_ms": round(1000 * (self.t0 - trace.t0), 3),
+                "ms": round(1000 * seconds, 3),
+            }
+            record.update(self.attrs)
+            if error is not None:
+                record["error"] = error
+            trace.add(record)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **attrs: Any):
+    """
+    Mede uma etapa:
+        with span("vector_query", top_k=6) as s:
+            res = col.query(...)
+            s.set(hits=len(res["ids"][0]))
+    """
+    if not TRACING_ENABLED:
+        return _NULL_SPAN
+    return _Span(name, attrs)
+
+
+@contextmanager
+def start_trace() -> Iterator[Optional[Trace]]:
+    """Abre um rastro para a verificação atual (None se o rastreamento estiver desligado)."""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    trace = Trace()
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def attach(result: Any, trace: Optional[Trace]) -> Any:
+    """Coloca o rastro em result["debug"]["trace"] (se houver rastro e o resultado for um dict)."""
+    if trace is not None and isinstance(result, dict):
+        result.setdefault("debug", {})
+        result["debug"]["trace"] = trace.to_dict()
+    return result
+
+
+def traced(fn: Callable) -> Callable:
+    """Decorador (funções síncronas ou async): roda `fn` num rastro novo e anexa o rastro ao resultado."""
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with start_trace() as trace:
+                return attach(await fn(*args, **kwargs), trace)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with start_trace() as trace:
+            return attach(fn(*args, **kwargs), trace)
+    return wrapper
+
+
+# ---------------- métricas do processo ----------------
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, name: str, seconds: float, error: bool) -> None:
+        with self._lock:
+            st = self._stages.get(name)
+            if st is None:
+                st = {"count": 0, "sum": 0.0, "errors": 0, "buckets": [0] * len(_BUCKETS)}
+                self._stages[name] = st
+            st["count"] += 1
+            st["sum"] += seconds
+            if error:
+                st["errors"] += 1
+            for i, le in enumerate(_BUCKETS):
+                if seconds <= le:
+                    st["buckets"][i] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {k: {**v, "buckets": list(v["buckets"])} for k, v in self._stages.items()}
+
+
+_metrics = _Metrics()
+
+
+def render_prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    """
+    Métricas no formato de texto do Prometheus:
+    - aletheia_stage_duration_seconds (histograma por etapa)
+    - aletheia_stage_errors_total
+    - `gauges` extras (nome -> valor), ex.: profundidade da fila do LLM
+    """
+    stages = _metrics.snapshot()
+    lines = [
+        "# HELP aletheia_stage_duration_seconds Duração das etapas do pipeline RAG.",
+        "# TYPE aletheia_stage_duration_seconds histogram",
+    ]
+    for name in sorted(stages):
+        st = stages[name]
+        for le, n in zip(_BUCKETS, st["buckets"]):
+            lines.append(f'aletheia_stage_duration_seconds_bucket{{stage="{name}",le="{le}"}} {n}')
+        lines.append(f'aletheia_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {st["count"]}')
+        lines.append(f'aletheia_stage_duration_seconds_sum{{stage="{name}"}} {st["sum"]:.6f}')
+        lines.append(f'aletheia_stage_duration_seconds_count{{stage="{name}"}} {st["count"]}')
+
+    lines += [
+        "# HELP aletheia_stage_errors_total Etapas que terminaram com exceção.",
+        "# TYPE aletheia_stage_errors_total counter",
+    ]
+    for name in sorted(stages):
+        lines.append(f'aletheia_stage_errors_total{{stage="{name}"}} {stages[name]["errors"]}')
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {float(value)}")
+    return "\n".join(lines) + "\n"
@@ -1,20 +1,35 @@
 # rag/vectordb.py
 """
 Camada de persistência vetorial usando ChromaDB.
-- Cria/recupera a coleção persistida em disco
+- Cria/recupera a coleção persistida em disco (PersistentClient em CHROMA_DIR)
 - Indexa documentos com embeddings vindos do Ollama (rag/embeddings.py)
 - Faz busca por similaridade e retorna textos + metadados + distâncias
+
+A engine é escolhida por VECTOR_BACKEND:
+- "chroma" (padrão): ChromaDB persistente
+- "numpy" / "hnsw": engines locais em processo (rag/ann.py), com a mesma
+  interface de coleção; úteis para comparar latência e memória com o Chroma.
+
+Toda escrita/remoção também atualiza o índice lexical BM25 da coleção
+(rag/bm25.py), usado pela busca híbrida do retriever.
 """
 
 from __future__ import annotations
 import os
+import time
+import asyncio
+import itertools
+import threading
 from typing import List, Dict, Any, Optional
 
 from dotenv import load_dotenv
 import chromadb
 from chromadb.config import Settings
 
-from rag.embeddings import embed_texts, embed_one
+from rag.ann import open_collection, drop_collection
+from rag.bm25 import get_bm25_index, close_bm25
+from rag.embeddings import embed_texts, embed_one, aembed_one
+from rag.tracing import span
 
 load_dotenv()
 
@@ -22,32 +37,171 @@ load_dotenv()
 CHROMA_DIR = os.getenv("CHROMA_DIR", "./db")
 # Nome padrão da coleção
 DEFAULT_COLLECTION = "news"
+# engine vetorial: chroma | numpy | hnsw
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").strip().lower()
+# mantém o índice lexical (BM25) junto com o vetorial
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "1") not in ("0", "false", "False")
+
+
+# Registro do processo: um cliente e um handle por coleção, reutilizados
+# entre requisições (criar o cliente e buscar a coleção custa caro).
+_client: Optional[chromadb.ClientAPI] = None
+_collections: Dict[str, Any] = {}
+_registry_lock = threading.RLock()
+# marcador de versão por coleção, persistido em CHROMA_DIR (invalidação de caches):
+# nome -> (assinatura do arquivo, marcador lido)
+_versions: Dict[str, tuple] = {}
+_version_seq = itertools.count()
 
 
-def get_client() -> chromadb.Client:
+def _new_client() -> chromadb.ClientAPI:
     """
-    Cria um cliente Chroma com persistência em disco.
+    Constrói um cliente Chroma novo (sem passar pelo registro) que grava
+    de fato em CHROMA_DIR. Nas versões >= 0.4 o chromadb.Client(Settings(...))
+    é só em memória; por isso usamos o PersistentClient.
     """
+    if hasattr(chromadb, "PersistentClient"):
+        return chromadb.PersistentClient(
+            path=CHROMA_DIR,
+            settings=Settings(anonymized_telemetry=False),  # evita enviar métricas
+        )
+    # Chroma < 0.4: persistência via duckdb+parquet
     return chromadb.Client(
         Settings(
+            chroma_db_impl="duckdb+parquet",
             persist_directory=CHROMA_DIR,
-            anonymized_telemetry=False,  # evita enviar métricas
+            anonymized_telemetry=False,
         )
     )
 
 
+def get_client() -> chromadb.ClientAPI:
+    """
+    Retorna o cliente Chroma do processo (criado uma única vez).
+    """
+    global _client
+    if _client is None:
+        with _registry_lock:
+            if _client is None:
+                _client = _new_client()
+    return _client
+
+
 def get_collection(name: str = DEFAULT_COLLECTION):
     """
-    Obtém (ou cria) uma coleção persistida.
+    Obtém (ou cria) uma coleção persistida, guardando o handle no registro.
     Importante: usamos embeddings MANUAIS (embedding_function=None),
     porque geramos os vetores com o Ollama (rag/embeddings.py).
     """
-    client = get_client()
-    return client.get_or_create_collection(
-        name=name,
-        embedding_function=None,  # vamos passar embeddings prontos
-        metadata={"hnsw:space": "cosine"},  # métrica de similaridade
-    )
+    col = _collections.get(name)
+    if col is not None:
+        return col
+    with _registry_lock:
+        col = _collections.get(name)
+        if col is None:
+            if VECTOR_BACKEND != "chroma":
+                col = open_collection(name, VECTOR_BACKEND)
+            else:
+                col = get_client().get_or_create_collection(
+                    name=name,
+                    embedding_function=None,  # vamos passar embeddings prontos
+                    metadata={"hnsw:space": "cosine"},  # métrica de similaridade
+                )
+            _collections[name] = col
+    return col
+
+
+def warm_start(name: str = DEFAULT_COLLECTION) -> Dict[str, Any]:
+    """
+    Abre a coleção persistida e faz uma consulta de aquecimento com um
+    vetor já indexado, para que o índice seja carregado do disco agora
+    e não na primeira requisição do usuário.
+
+    Retorna {"collection", "count", "load_seconds", "persist_directory"}.
+    """
+    t0 = time.perf_counter()
+    col = get_collection(name)
+    count = col.count()
+    if count:
+        sample = col.peek(limit=1)
+        vecs = sample.get("embeddings")
+        if vecs is not None and len(vecs):
+            col.query(query_embeddings=[list(vecs[0])], n_results=1, include=[])
+    return {
+        "collection": name,
+        "count": count,
+        "load_seconds": round(time.perf_counter() - t0, 3),
+        "persist_directory": os.path.abspath(CHROMA_DIR),
+    }
+
+
+def _version_file(name: str) -> str:
+    return os.path.join(CHROMA_DIR, f"version_{name}")
+
+
+def _bump_version(name: str) -> None:
+    """Grava um marcador novo (toda escrita na coleção passa por aqui, inclusive as do ingest.py)."""
+    path = _version_file(name)
+    token = f"{time.time_ns()}-{os.getpid()}-{next(_version_seq)}"
+    os.makedirs(CHROMA_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(token)
+    os.replace(tmp, path)
+    with _registry_lock:
+        _versions.pop(name, None)
+
+
+def collection_version(name: str = DEFAULT_COLLECTION) -> str:
+    """
+    Assinatura barata do estado da coleção: o marcador persistido em
+    CHROMA_DIR/version_<coleção>, trocado a cada escrita por qualquer
+    processo. Custa um stat(); o arquivo só é relido quando muda. Permite
+    invalidar caches que dependem do índice (ex.: rag/verdict_cache.py).
+    """
+    path = _version_file(name)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return ""
+    sig = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _versions.get(name)
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        token = f.read().strip()
+    _versions[name] = (sig, token)
+    return token
+
+
+def init_vectordb(coll_names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Gancho de inicialização (ex.: startup do FastAPI): cria o cliente,
+    abre as coleções do disco e aquece os índices antes da primeira
+    requisição. Retorna o resumo de warm_start de cada coleção.
+    """
+    return [warm_start(name) for name in coll_names or [DEFAULT_COLLECTION]]
+
+
+def _close_handle(col) -> None:
+    """Fecha arquivos das coleções locais (rag/ann.py); handles do Chroma não têm close()."""
+    close = getattr(col, "close", None)
+    if close is not None:
+        close()
+
+
+def close_vectordb() -> None:
+    """
+    Gancho de encerramento (ex.: shutdown do FastAPI): descarta os handles.
+    A próxima chamada a get_client/get_collection recria tudo.
+    """
+    global _client
+    with _registry_lock:
+        for col in _collections.values():
+            _close_handle(col)
+        _collections.clear()
+        _client = None
+        close_bm25()
 
 
 def add_documents(
@@ -71,6 +225,58 @@ def add_documents(
     col = get_collection(coll_name)
     vectors = embed_texts(texts)  # gera embeddings no Ollama
     col.add(documents=texts, metadatas=metadatas, ids=ids, embeddings=vectors)
+    if LEXICAL_INDEX_ENABLED:
+        get_bm25_index(coll_name).upsert(ids, texts)
+    _bump_version(coll_name)
+
+
+def upsert_documents(
+    texts: List[str],
+    metadatas: List[Dict[str, Any]],
+    ids: List[str],
+    coll_name: str = DEFAULT_COLLECTION,
+    embeddings: Optional[List[List[float]]] = None,
+) -> None:
+    """
+    Igual a add_documents, mas sobrescreve IDs que já existem
+    (insere os novos e atualiza os alterados numa única chamada).
+    Se `embeddings` vier pronto (ex.: pipeline de ingestão), não chama o Ollama.
+    """
+    if not (len(texts) == len(metadatas) == len(ids)):
+        raise ValueError("texts, metadatas e ids precisam ter o mesmo tamanho.")
+    if not ids:
+        return
+
+    col = get_collection(coll_name)
+    vectors = embeddings if embeddings is not None else embed_texts(texts)
+    col.upsert(documents=texts, metadatas=metadatas, ids=ids, embeddings=vectors)
+    if LEXICAL_INDEX_ENABLED:
+        get_bm25_index(coll_name).upsert(ids, texts)
+    _bump_version(coll_name)
+
+
+def get_indexed_hashes(
+    coll_name: str = DEFAULT_COLLECTION,
+    hash_key: str = "content_hash",
+    page_size: int = 5000,
+) -> Dict[str, str]:
+    """
+    Lista o que já está indexado: {id: valor de metadata[hash_key]}.
+    Lê a coleção em páginas para não carregar tudo de uma vez.
+    IDs sem o campo de hash aparecem com valor "".
+    """
+    col = get_collection(coll_name)
+    out: Dict[str, str] = {}
+    offset = 0
+    while True:
+        page = col.get(include=["metadatas"], limit=page_size, offset=offset)
+        page_ids = page.get("ids") or []
+        if not page_ids:
+            break
+        for doc_id, meta in zip(page_ids, page.get("metadatas") or [{}] * len(page_ids)):
+            out[doc_id] = str((meta or {}).get(hash_key, ""))
+        offset += len(page_ids)
+    return out
 
 
 def query_similar(
@@ -86,12 +292,17 @@ def query_similar(
     """
     col = get_collection(coll_name)
     qvec = embed_one(query_text)
+    return _query_one(col, qvec, top_k, include_distances)
 
-    res = col.query(
-        query_embeddings=[qvec],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"] if include_distances else ["documents", "metadatas"],
-    )
+
+def _query_one(col, qvec: List[float], top_k: int, include_distances: bool) -> Dict[str, Any]:
+    with span("vector_query", queries=1, top_k=top_k) as s:
+        res = col.query(
+            query_embeddings=[qvec],
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"] if include_distances else ["documents", "metadatas"],
+        )
+        s.set(hits=len((res.get("ids") or [[]])[0]))
     # Normaliza ausência de resultados
     res.setdefault("documents", [[]])
     res.setdefault("metadatas", [[]])
@@ -100,6 +311,159 @@ def query_similar(
     return res
 
 
+async def aquery_similar(
+    query_text: str,
+    top_k: int = 6,
+    coll_name: str = DEFAULT_COLLECTION,
+    include_distances: bool = True,
+) -> Dict[str, Any]:
+    """
+    Versão assíncrona de query_similar: o embedding usa httpx e a consulta
+    ao índice (síncrona no Chroma) roda numa thread, sem travar o event loop.
+    """
+    col = get_collection(coll_name)
+    qvec = await aembed_one(query_text)
+    return await asyncio.to_thread(_query_one, col, qvec, top_k, include_distances)
+
+
+def query_similar_many(
+    query_texts: List[str],
+    top_k: int = 6,
+    coll_name: str = DEFAULT_COLLECTION,
+    include_distances: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Versão em lote de query_similar:
+    - Gera os embeddings de todos os textos numa chamada em lote
+    - Faz UMA consulta multi-vetor no Chroma
+    - Retorna uma lista com um resultado por texto, no mesmo formato de
+      query_similar (listas aninhadas [[...]]), na ordem da entrada.
+    """
+    if not query_texts:
+        return []
+    col = get_collection(coll_name)
+    qvecs = embed_texts(query_texts)
+
+    fields = ["documents", "metadatas", "distances"] if include_distances else ["documents", "metadatas"]
+    with span("vector_query", queries=len(qvecs), top_k=top_k):
+        res = col.query(query_embeddings=qvecs, n_results=top_k, include=fields)
+
+    out: List[Dict[str, Any]] = []
+    for i in range(len(query_texts)):
+        item: Dict[str, Any] = {"ids": [(res.get("ids") or [[]] * len(query_texts))[i]]}
+        for field in fields:
+            rows = res.get(field) or [[]] * len(query_texts)
+            item[field] = [rows[i]]
+        out.append(item)
+    return out
+
+
+def get_documents(ids: List[str], coll_name: str = DEFAULT_COLLECTION) -> Dict[str, Any]:
+    """
+    Documentos e metadados pelos IDs, na ordem pedida (IDs inexistentes
+    ficam de fora). Formato: {"ids", "documents", "metadatas"} (listas simples).
+    """
+    if not ids:
+        return {"ids": [], "documents": [], "metadatas": []}
+    res = get_collection(coll_name).get(ids=list(ids), include=["documents", "metadatas"])
+    found = {
+        i: (d, m)
+        for i, d, m in zip(res.get("ids") or [], res.get("documents") or [], res.get("metadatas") or [])
+    }
+    keep = [i for i in ids if i in found]
+    return {
+        "ids": keep,
+        "documents": [found[i][0] for i in keep],
+        "metadatas": [found[i][1] for i in keep],
+    }
+
+
+def query_lexical(
+    query_text: str,
+    top_k: int = 6,
+    coll_name: str = DEFAULT_COLLECTION,
+) -> Dict[str, Any]:
+    """
+    Busca lexical (BM25), sem embedding. Mesmo formato de query_similar,
+    com "scores" (BM25) no lugar das distâncias, que vêm como None.
+    """
+    with span("lexical_query", top_k=top_k) as s:
+        hits = get_bm25_index(coll_name).search(query_text, top_k) if LEXICAL_INDEX_ENABLED else []
+        got = get_documents([doc_id for doc_id, _ in hits], coll_name)
+        scores = dict(hits)
+        s.set(hits=len(got["ids"]))
+    return {
+        "ids": [got["ids"]],
+        "documents": [got["documents"]],
+        "metadatas": [got["metadatas"]],
+        "distances": [[None] * len(got["ids"])],
+        "scores": [[scores[i] for i in got["ids"]]],
+    }
+
+
+def query_lexical_many(
+    query_texts: List[str],
+    top_k: int = 6,
+    coll_name: str = DEFAULT_COLLECTION,
+) -> List[Dict[str, Any]]:
+    """
+    Versão em lote de query_lexical: uma pontuação BM25 para todas as
+    consultas e uma única leitura dos documentos acertados.
+    """
+    with span("lexical_query", top_k=top_k, queries=len(query_texts)) as s:
+        if LEXICAL_INDEX_ENABLED:
+            hits_many = get_bm25_index(coll_name).search_many(query_texts, top_k)
+        else:
+            hits_many = [[] for _ in query_texts]
+        wanted = list(dict.fromkeys(doc_id for hits in hits_many for doc_id, _ in hits))
+        got = get_documents(wanted, coll_name)
+        rows = {i: (d, m) for i, d, m in zip(got["ids"], got["documents"], got["metadatas"])}
+        s.set(hits=len(rows))
+    out = []
+    for hits in hits_many:
+        keep = [(doc_id, score) for doc_id, score in hits if doc_id in rows]
+        out.append({
+            "ids": [[doc_id for doc_id, _ in keep]],
+            "documents": [[rows[doc_id][0] for doc_id, _ in keep]],
+            "metadatas": [[rows[doc_id][1] for doc_id, _ in keep]],
+            "distances": [[None] * len(keep)],
+            "scores": [[score for _, score in keep]],
+        })
+    return out
+
+
+def sync_lexical_index(coll_name: str = DEFAULT_COLLECTION, page_size: int = 1000) -> Dict[str, int]:
+    """
+    Alinha o índice BM25 com a coleção: indexa o que falta (ex.: coleção
+    criada antes do índice lexical) e remove o que não existe mais.
+    Retorna {"added", "removed"}.
+    """
+    if not LEXICAL_INDEX_ENABLED:
+        return {"added": 0, "removed": 0}
+    index = get_bm25_index(coll_name)
+    col = get_collection(coll_name)
+    lexical = set(index.doc_ids())
+    present: set = set()
+    added = 0
+    offset = 0
+    while True:
+        page = col.get(include=[], limit=page_size, offset=offset)
+        page_ids = page.get("ids") or []
+        if not page_ids:
+            break
+        present.update(page_ids)
+        missing = [i for i in page_ids if i not in lexical]
+        if missing:
+            got = get_documents(missing, coll_name)
+            index.upsert(got["ids"], [d or "" for d in got["documents"]])
+            added += len(got["ids"])
+        offset += len(page_ids)
+    stale = [i for i in lexical if i not in present]
+    if stale:
+        index.delete(stale)
+    return {"added": added, "removed": len(stale)}
+
+
 def delete_by_ids(ids: List[str], coll_name: str = DEFAULT_COLLECTION) -> None:
     """
     Remove documentos específicos pelos seus IDs.
@@ -109,6 +473,9 @@ def delete_by_ids(ids: List[str], coll_name: str = DEFAULT_COLLECTION) -> None:
         return
     col = get_collection(coll_name)
     col.delete(ids=ids)
+    if LEXICAL_INDEX_ENABLED:
+        get_bm25_index(coll_name).delete(ids)
+    _bump_version(coll_name)
 
 
 def reset_collection(coll_name: str = DEFAULT_COLLECTION) -> None:
@@ -116,11 +483,20 @@ def reset_collection(coll_name: str = DEFAULT_COLLECTION) -> None:
     Limpa completamente a coleção (apaga todos os itens).
     Use com cuidado.
     """
-    client = get_client()
-    try:
-        client.delete_collection(coll_name)
-    except Exception:
-        # Se não existir, ignora
-        pass
-    # recria vazia
-    client.get_or_create_collection(name=coll_name, embedding_function=None, metadata={"hnsw:space": "cosine"})
+    with _registry_lock:
+        # o handle antigo aponta para a coleção apagada
+        _close_handle(_collections.pop(coll_name, None))
+        if VECTOR_BACKEND != "chroma":
+            drop_collection(coll_name)
+        else:
+            try:
+                get_client().delete_collection(coll_name)
+            except Exception:
+                # Se não existir, ignora
+                pass
+        # recria vazia (e registra o novo handle)
+        get_collection(coll_name)
+        if LEXICAL_INDEX_ENABLED:
+            get_bm25_index(coll_name).reset()
+        _bump_version(coll_name)
+
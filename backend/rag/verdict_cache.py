@@ -0,0 +1,212 @@
+# rag/verdict_cache.py
+"""
+Cache de veredictos na frente de classify_claim / classify_claim_with_web.
+
+Notícias virais chegam repetidas (ou com pequenas edições) centenas de vezes.
+- Acerto exato: mesmo texto normalizado -> resposta imediata
+- Acerto aproximado: similaridade de cosseno entre o embedding do enunciado
+  e o de um enunciado já verificado >= VERDICT_CACHE_SIM_THRESHOLD
+  -> devolve o veredicto guardado (com as mesmas used_sources)
+
+Cada entrada expira após VERDICT_CACHE_TTL segundos e é invalidada quando
+a coleção muda (marcador de versão persistido por rag/vectordb.py, que
+também vale para escritas de outro processo, como o ingest.py).
+Os modos (rag, web) ficam em espaços separados.
+"""
+
+from __future__ import annotations
+import os
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from rag.embeddings import normalize_text
+
+load_dotenv()
+
+VERDICT_CACHE_ENABLED = os.getenv("VERDICT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", "3600"))
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "5000"))
+VERDICT_CACHE_SIM_THRESHOLD = float(os.getenv("VERDICT_CACHE_SIM_THRESHOLD", "0.97"))
+
+
+def _exact_key(namespace: str, claim: str) -> str:
+    text = normalize_text(claim).casefold()
+    return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Cache em memória (LRU + TTL) com busca exata e por similaridade.
+
+    Os vetores ficam numa matriz pré-alocada (max_entries x dim), uma linha
+    por entrada, com lista de posições livres: a busca aproximada é um único
+    produto matriz-vetor, sem montar a matriz a cada consulta. Entradas
+    vencidas são descartadas de forma preguiçosa (quando encontradas ou
+    pelo LRU); uma versão nova da coleção esvazia o cache de uma vez.
+    """
+
+    def __init__(
+        self,
+        ttl: float = VERDICT_CACHE_TTL,
+        max_entries: int = VERDICT_CACHE_MAX_ENTRIES,
+        threshold: float = VERDICT_CACHE_SIM_THRESHOLD,
+    ):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.threshold = threshold
+        # chave -> (posição, veredicto, vence_em)
+        self._entries: "OrderedDict[str, Tuple[int, Dict[str, Any], float]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # alocada no primeiro vetor (dimensão)
+        self._has_vec = np.zeros(self.max_entries, dtype=bool)
+        self._namespace = np.full(self.max_entries, -1, dtype=np.int32)
+        self._expires = np.zeros(self.max_entries, dtype=np.float64)
+        self._reset_locked()
+        self._ns_ids: Dict[str, int] = {}
+        self._version: Any = None
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "invalidated": 0}
+
+    def _remove_locked(self, key: str) -> None:
+        slot = self._entries.pop(key)[0]
+        self._keys[slot] = None
+        self._has_vec[slot] = False
+        self._namespace[slot] = -1
+        self._free.append(slot)
+
+    def _reset_locked(self) -> None:
+        self._entries.clear()
+        self._free: List[int] = list(range(self.max_entries - 1, -1, -1))
+        self._keys: List[Optional[str]] = [None] * self.max_entries
+        self._has_vec[:] = False
+        self._namespace[:] = -1
+
+    def _check_version_locked(self, version: Any) -> None:
+        """Versão nova da coleção: nenhum veredicto guardado vale mais."""
+        if version == self._version:
+            return
+        self.stats["invalidated"] += len(self._entries)
+        self._reset_locked()
+        self._version = version
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        return vec / (np.linalg.norm(vec) or 1.0)
+
+    def get(
+        self,
+        namespace: str,
+        claim: str,
+        version: Any,
+        vector: Optional[List[float]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Procura um veredicto: primeiro pelo texto exato, depois (se `vector`
+        vier) pelo enunciado mais parecido. Retorna uma cópia com
+        debug["cache"] preenchido, ou None.
+        """
+        key = _exact_key(namespace, claim)
+        q = self._unit(vector) if vector is not None else None
+        now = time.time()
+        with self._lock:
+            self._check_version_locked(version)
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.stats["exact_hits"] += 1
+                    return self._hit(entry[1], "exact", 1.0)
+                self._remove_locked(key)
+                self.stats["invalidated"] += 1
+
+            ns_id = self._ns_ids.get(namespace)
+            if q is not None and ns_id is not None and self._matrix is not None and q.shape[0] == self._matrix.shape[1]:
+                sims = self._matrix @ q
+                valid = self._has_vec & (self._namespace == ns_id) & (self._expires > now)
+                sims[~valid] = -np.inf
+                best = int(np.argmax(sims))
+                if float(sims[best]) >= self.threshold:
+                    hit_key = self._keys[best]
+                    self._entries.move_to_end(hit_key)
+                    self.stats["near_hits"] += 1
+                    return self._hit(self._entries[hit_key][1], "near", float(sims[best]))
+
+            self.stats["misses"] += 1
+            return None
+
+    @staticmethod
+    def _hit(verdict: Dict[str, Any], kind: str, similarity: float) -> Dict[str, Any]:
+        out = copy.deepcopy(verdict)
+        out.setdefault("debug", {})
+        out["debug"]["cache"] = {"hit": kind, "similarity": round(similarity, 4)}
+        return out
+
+    def put(
+        self,
+        namespace: str,
+        claim: str,
+        version: Any,
+        verdict: Dict[str, Any],
+        vector: Optional[List[float]] = None,
+    ) -> None:
+        """Guarda um veredicto (respostas com erro não são guardadas)."""
+        if not isinstance(verdict, dict) or "error" in verdict:
+            return
+        vec = self._unit(vector) if vector is not None else None
+        key = _exact_key(namespace, claim)
+        verdict = copy.deepcopy(verdict)
+        with self._lock:
+            self._check_version_locked(version)
+            if key in self._entries:
+                self._remove_locked(key)
+            elif not self._free:
+                self._remove_locked(next(iter(self._entries)))
+            slot = self._free.pop()
+            ns_id = self._ns_ids.setdefault(namespace, len(self._ns_ids))
+
+            if vec is not None and self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vec.shape[0]), dtype=np.float32)
+            if vec is not None and vec.shape[0] == self._matrix.shape[1]:
+                self._matrix[slot] = vec
+                self._has_vec[slot] = True
+            self._namespace[slot] = ns_id
+            self._expires[slot] = time.time() + self.ttl
+            self._keys[slot] = key
+            self._entries[key] = (slot, verdict, self._expires[slot])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset_locked()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estatísticas para monitoramento (inclui a taxa de acerto)."""
+        with self._lock:
+            s = dict(self.stats)
+            s["entries"] = len(self._entries)
+        lookups = s["exact_hits"] + s["near_hits"] + s["misses"]
+        s["hit_rate"] = round((s["exact_hits"] + s["near_hits"]) / lookups, 4) if lookups else 0.0
+        return s
+
+
+_cache: Optional[VerdictCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_verdict_cache() -> Optional[VerdictCache]:
+    """Cache do processo (None se VERDICT_CACHE_ENABLED=0)."""
+    global _cache
+    if not VERDICT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = VerdictCache()
+    return _cache
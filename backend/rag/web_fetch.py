@@ -0,0 +1,286 @@
+# rag/web_fetch.py
+"""
+Enriquecimento das evidências da web: baixa as páginas dos primeiros
+resultados do DuckDuckGo e extrai o texto principal, para o LLM ver mais
+que o trecho curto da busca.
+
+- Downloads em paralelo (pool de threads + sessão HTTP com keep-alive)
+- Prazo rígido por rodada (WEB_FETCH_TIMEOUT): cada download conhece o
+  prazo final e desiste ao passar dele; o que nem começou é cancelado
+- O texto das páginas entra no prompt com orçamento de tokens
+  (WEB_FETCH_MAX_TOKENS, somado entre as páginas, na ordem da busca)
+- Extração rápida: só os <p> são analisados (SoupStrainer, lxml se houver)
+- Cache em disco (SQLite) por URL + ETag/Last-Modified: dentro de
+  WEB_FETCH_CACHE_TTL a página não é buscada de novo; depois disso, uma
+  requisição condicional (304) reaproveita o texto já extraído
+"""
+
+from __future__ import annotations
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+import contextvars
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+from dotenv import load_dotenv
+
+from rag.http_client import get_session
+from rag.tokens import count_tokens, truncate_to_tokens
+from rag.tracing import span
+
+load_dotenv()
+
+WEB_FETCH_ENABLED = os.getenv("WEB_FETCH_ENABLED", "1") not in ("0", "false", "False")
+# quantos resultados da busca têm a página baixada
+WEB_FETCH_MAX_PAGES = int(os.getenv("WEB_FETCH_MAX_PAGES", "3"))
+# prazo (s) para baixar as páginas de uma verificação
+WEB_FETCH_TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT", "4"))
+# caracteres de cada página que vão para o prompt
+WEB_FETCH_MAX_CHARS = int(os.getenv("WEB_FETCH_MAX_CHARS", "2000"))
+# tokens do texto das páginas (todas juntas) que vão para o prompt
+WEB_FETCH_MAX_TOKENS = int(os.getenv("WEB_FETCH_MAX_TOKENS", "900"))
+# páginas maiores que isso são cortadas (bytes)
+WEB_FETCH_MAX_BYTES = int(os.getenv("WEB_FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+WEB_FETCH_WORKERS = int(os.getenv("WEB_FETCH_WORKERS", "8"))
+# parágrafos mais curtos que isso costumam ser menu, rodapé, legenda...
+WEB_FETCH_MIN_PARAGRAPH = int(os.getenv("WEB_FETCH_MIN_PARAGRAPH", "40"))
+WEB_FETCH_CACHE_TTL = float(os.getenv("WEB_FETCH_CACHE_TTL", "86400"))
+WEB_FETCH_CACHE_PATH = os.getenv(
+    "WEB_FETCH_CACHE_PATH",
+    os.path.join(os.getenv("CHROMA_DIR", "./db"), "web_pages.sqlite"),
+)
+
+USER_AGENT = "Mozilla/5.0 (compatible; AletheIA/1.0; +https://github.com/DaviNeco11/AletheIA)"
+
+# lxml é bem mais rápido que o html.parser puro; usa se estiver instalado
+_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+_ONLY_P = SoupStrainer("p")
+
+
+def extract_main_text(html: str, max_chars: int = 8000, min_paragraph: int = WEB_FETCH_MIN_PARAGRAPH) -> str:
+    """
+    Texto dos parágrafos da página. Descarta parágrafos curtos (menus,
+    legendas); se não sobrar nada, usa todos.
+    """
+    soup = BeautifulSoup(html, _PARSER, parse_only=_ONLY_P)
+    paragraphs = [p.get_text(" ", strip=True) for p in soup.find_all("p")]
+    paragraphs = [p for p in paragraphs if p]
+    main = [p for p in paragraphs if len(p) >= min_paragraph] or paragraphs
+    return "\n".join(main).strip()[:max_chars]
+
+
+class PageCache:
+    """Texto extraído por URL, com ETag/Last-Modified para revalidação."""
+
+    def __init__(self, path: str = WEB_FETCH_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                text TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, text, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "text": row[2], "fetched_at": row[3]}
+
+    def put(self, url: str, text: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, text, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, text, time.time()),
+            )
+            self._conn.commit()
+
+    def touch(self, url: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[PageCache] = None
+_pool: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = PageCache()
+    return _cache
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=WEB_FETCH_WORKERS, thread_name_prefix="web-fetch")
+    return _pool
+
+
+def _time_left(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("Prazo para baixar a página esgotado.")
+    return left
+
+
+def fetch_page_text(
+    url: str,
+    timeout: float = WEB_FETCH_TIMEOUT,
+    max_chars: int = 8000,
+    use_cache: bool = True,
+    deadline: Optional[float] = None,
+) -> str:
+    """
+    Baixa a página e devolve o texto principal (cortado em max_chars).
+    Usa o cache em disco e revalida com If-None-Match / If-Modified-Since.
+    `deadline` (time.monotonic()) limita o download inteiro, não só cada
+    leitura do socket. Lança RuntimeError se a página não tiver texto útil.
+    """
+    _time_left(deadline)
+    cache = get_page_cache() if use_cache else None
+    entry = cache.get(url) if cache is not None else None
+    if entry is not None and time.time() - entry["fetched_at"] <= WEB_FETCH_CACHE_TTL:
+        return entry["text"][:max_chars]
+
+    headers = {"User-Agent": USER_AGENT}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    left = _time_left(deadline)
+    if left is not None:
+        timeout = min(timeout, left)
+    with get_session().get(url, headers=headers, timeout=timeout, stream=True) as resp:
+        if resp.status_code == 304 and entry is not None:
+            cache.touch(url)
+            return entry["text"][:max_chars]
+        resp.raise_for_status()
+        ctype = resp.headers.get("Content-Type", "")
+        if ctype and "html" not in ctype:
+            raise RuntimeError(f"Conteúdo não é HTML ({ctype}).")
+        chunks, size = [], 0
+        while size < WEB_FETCH_MAX_BYTES:
+            _time_left(deadline)
+            chunk = resp.raw.read(min(64 * 1024, WEB_FETCH_MAX_BYTES - size), decode_content=True)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        raw = b"".join(chunks)
+        # sem charset no cabeçalho o requests assume latin-1; a web hoje é quase toda utf-8
+        encoding = resp.encoding if "charset" in ctype.lower() else "utf-8"
+        html = raw.decode(encoding or "utf-8", errors="replace")
+        etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+    # guarda um pouco mais que o necessário: outros chamadores podem pedir max_chars maior
+    text = extract_main_text(html, max_chars=max(max_chars, 8000))
+    if not text:
+        raise RuntimeError("Não foi possível extrair texto útil da página.")
+    if cache is not None:
+        cache.put(url, text, etag, last_modified)
+    return text[:max_chars]
+
+
+def fetch_many(urls: List[str], timeout: float = WEB_FETCH_TIMEOUT, max_chars: int = WEB_FETCH_MAX_CHARS) -> Dict[str, str]:
+    """
+    Baixa várias páginas em paralelo. Retorna {url: texto} só das que
+    ficaram prontas dentro de `timeout` segundos; erros são ignorados.
+    Downloads que nem começaram são cancelados, e os em andamento param
+    sozinhos no prazo (não seguram o pool para a próxima verificação).
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return {}
+    with span("web_fetch", pages=len(urls)) as s:
+        pool = _get_pool()
+        deadline = time.monotonic() + timeout
+        futures = {
+            pool.submit(contextvars.copy_context().run, fetch_page_text, u, timeout, max_chars, True, deadline): u
+            for u in urls
+        }
+        done, late = wait(futures, timeout=timeout)
+        for fut in late:
+            fut.cancel()
+        out: Dict[str, str] = {}
+        for fut in done:
+            if fut.exception() is None:
+                out[futures[fut]] = fut.result()
+        s.set(fetched=len(out), chars=sum(len(t) for t in out.values()), late=len(late))
+    return out
+
+
+def enrich_web_results(
+    results: List[Dict[str, str]],
+    max_pages: int = WEB_FETCH_MAX_PAGES,
+    timeout: float = WEB_FETCH_TIMEOUT,
+    token_budget: Optional[int] = None,
+) -> List[Dict[str, str]]:
+    """
+    Acrescenta "content" (texto da página) aos primeiros `max_pages`
+    resultados. As páginas dividem `token_budget` tokens na ordem da busca:
+    cada uma recebe uma parte igual do que sobrou, e o que uma página curta
+    não usa passa para as seguintes.
+    """
+    if not WEB_FETCH_ENABLED or not results or max_pages <= 0:
+        return results
+    pages = fetch_many([r.get("url", "") for r in results[:max_pages]], timeout=timeout)
+    remaining = WEB_FETCH_MAX_TOKENS if token_budget is None else max(0, int(token_budget))
+    urls = [r.get("url", "") for r in results]
+    pending = sum(1 for u in dict.fromkeys(urls) if u in pages)
+    used = set()
+    out = []
+    for r, url in zip(results, urls):
+        text = pages.get(url) if url not in used else None
+        if text:
+            used.add(url)
+            text = truncate_to_tokens(text, remaining // pending)
+            pending -= 1
+            remaining -= count_tokens(text)
+        out.append({**r, "content": text} if text else r)
+    return out
+
+
+async def aenrich_web_results(
+    results: List[Dict[str, str]],
+    max_pages: int = WEB_FETCH_MAX_PAGES,
+    timeout: float = WEB_FETCH_TIMEOUT,
+    token_budget: Optional[int] = None,
+) -> List[Dict[str, str]]:
+    """Versão assíncrona de enrich_web_results (roda numa thread)."""
+    if not WEB_FETCH_ENABLED or not results or max_pages <= 0:
+        return results
+    return await asyncio.to_thread(enrich_web_results, results, max_pages, timeout, token_budget)
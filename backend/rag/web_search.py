@@ -1,13 +1,99 @@
 # rag/web_search.py
+"""
+Busca de evidências na web (DuckDuckGo).
+
+- Sessão DDGS reaproveitada (uma por thread) em vez de uma nova por busca
+- Cache em memória por consulta, com validade de WEB_CACHE_TTL segundos
+- start_search / aduckduckgo_search: a busca roda em segundo plano, em
+  paralelo com a recuperação local, e tem prazo (WEB_SEARCH_DEADLINE).
+  É tudo ou nada: o DDGS.text() devolve a lista inteira de uma vez, então
+  estourado o prazo segue-se sem resultados da web; a busca termina em
+  segundo plano e deixa o resultado no cache para a próxima verificação
+"""
+
 from __future__ import annotations
-from typing import List, Dict
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Dict, Optional, Tuple
+
 from ddgs import DDGS
+from dotenv import load_dotenv
 
+from rag.embeddings import normalize_text
+from rag.tracing import span
 
-def duckduckgo_search(query: str, max_results: int = 5) -> List[Dict[str, str]]:
-    results = []
-    with DDGS() as ddgs:
-        for r in ddgs.text(query, max_results=max_results):
+load_dotenv()
+
+WEB_CACHE_TTL = float(os.getenv("WEB_CACHE_TTL", "900"))
+WEB_CACHE_MAX_ENTRIES = int(os.getenv("WEB_CACHE_MAX_ENTRIES", "1000"))
+# tempo máximo (s) esperando a web antes de seguir sem ela
+WEB_SEARCH_DEADLINE = float(os.getenv("WEB_SEARCH_DEADLINE", "8"))
+WEB_SEARCH_WORKERS = int(os.getenv("WEB_SEARCH_WORKERS", "8"))
+
+_local = threading.local()
+
+_cache: "OrderedDict[Tuple[str, int], Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _session() -> DDGS:
+    """Sessão DDGS da thread atual (criada na primeira busca)."""
+    ddgs = getattr(_local, "ddgs", None)
+    if ddgs is None:
+        ddgs = DDGS()
+        _local.ddgs = ddgs
+    return ddgs
+
+
+def _cache_key(query: str, max_results: int) -> Tuple[str, int]:
+    return normalize_text(query).casefold(), max_results
+
+
+def _cache_get(key: Tuple[str, int]) -> Optional[List[Dict[str, str]]]:
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and time.time() - entry[0] <= WEB_CACHE_TTL:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return list(entry[1])
+        if entry is not None:
+            del _cache[key]
+        _cache_stats["misses"] += 1
+        return None
+
+
+def _cache_put(key: Tuple[str, int], results: List[Dict[str, str]]) -> None:
+    with _cache_lock:
+        _cache[key] = (time.time(), list(results))
+        _cache.move_to_end(key)
+        while len(_cache) > WEB_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def web_cache_stats() -> Dict[str, int]:
+    with _cache_lock:
+        return {**_cache_stats, "entries": len(_cache)}
+
+
+def clear_web_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def _search(query: str, max_results: int) -> List[Dict[str, str]]:
+    """Busca no DuckDuckGo (a lista chega inteira) e guarda no cache."""
+    results: List[Dict[str, str]] = []
+    with span("web_search", max_results=max_results) as s:
+        for r in _session().text(query, max_results=max_results) or []:
             title = r.get("title") or ""
             url = r.get("link") or r.get("href") or ""
             snippet = r.get("body") or ""
@@ -17,18 +103,98 @@ def duckduckgo_search(query: str, max_results: int = 5) -> List[Dict[str, str]]:
                     "url": url.strip(),
                     "snippet": snippet.strip(),
                 })
+        s.set(results=len(results))
+    _cache_put(_cache_key(query, max_results), results)
     return results
 
 
+def duckduckgo_search(query: str, max_results: int = 5) -> List[Dict[str, str]]:
+    cached = _cache_get(_cache_key(query, max_results))
+    if cached is not None:
+        return cached
+    return list(_search(query, max_results))
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=WEB_SEARCH_WORKERS, thread_name_prefix="ddgs")
+    return _pool
+
+
+class PendingSearch:
+    """Busca em andamento numa thread; result() espera até o prazo (tudo ou nada)."""
+
+    def __init__(self, query: str, max_results: int, deadline: float):
+        self.deadline = deadline
+        self.t0 = time.perf_counter()
+        self.future: Future
+        cached = _cache_get(_cache_key(query, max_results))
+        if cached is not None:
+            self.future = Future()
+            self.future.set_result(cached)
+        else:
+            # o contexto copiado leva o rastro atual (rag/tracing.py) para a thread
+            ctx = contextvars.copy_context()
+            self.future = _get_pool().submit(ctx.run, _search, query, max_results)
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - (time.perf_counter() - self.t0))
+
+    def _collect(self, timed_out: bool, error: Optional[BaseException] = None) -> List[Dict[str, str]]:
+        if error is not None:
+            print(f"⚠️ Busca na web falhou: {error}")
+        elif timed_out:
+            print(f"⚠️ Busca na web passou de {self.deadline:.1f} s; seguindo sem resultados da web.")
+        return []
+
+    def result(self) -> List[Dict[str, str]]:
+        try:
+            return list(self.future.result(timeout=self.remaining()))
+        except FutureTimeout:
+            return self._collect(timed_out=True)
+        except Exception as e:
+            return self._collect(timed_out=False, error=e)
+
+    async def aresult(self) -> List[Dict[str, str]]:
+        try:
+            # shield: o prazo não cancela a busca, que ainda alimenta o cache
+            return list(await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self.future)), self.remaining()))
+        except asyncio.TimeoutError:
+            return self._collect(timed_out=True)
+        except Exception as e:
+            return self._collect(timed_out=False, error=e)
+
+
+def start_search(query: str, max_results: int = 5, deadline: float = WEB_SEARCH_DEADLINE) -> PendingSearch:
+    """Dispara a busca em segundo plano (ou responde do cache) e retorna já."""
+    return PendingSearch(query, max_results, deadline)
+
+
+async def aduckduckgo_search(
+    query: str,
+    max_results: int = 5,
+    deadline: float = WEB_SEARCH_DEADLINE,
+) -> List[Dict[str, str]]:
+    """O cliente DDGS é síncrono; roda numa thread e respeita o prazo `deadline`."""
+    return await start_search(query, max_results, deadline).aresult()
+
+
 def format_web_results(results: List[Dict[str, str]]) -> str:
     if not results:
         return "Nenhuma evidência encontrada via DuckDuckGo.\n"
 
     out = ["Resultados da web (DuckDuckGo):"]
     for i, r in enumerate(results, start=1):
-        out.append(
+        block = (
             f"[W{i}] {r['title']}\n"
             f"URL: {r['url']}\n"
             f"Trecho: {r['snippet']}\n"
         )
+        # texto da página, quando rag/web_fetch.py conseguiu baixá-la
+        if r.get("content"):
+            block += f"Conteúdo da página: {r['content']}\n"
+        out.append(block)
     return "\n".join(out)
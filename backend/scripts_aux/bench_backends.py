@@ -0,0 +1,96 @@
+# scripts_aux/bench_backends.py
+"""
+Compara as engines vetoriais (VECTOR_BACKEND = chroma | numpy | hnsw):
+tempo de indexação, latência de consulta (p50/p95) e pico de memória (RSS).
+
+Cada engine roda num subprocesso próprio, com vetores aleatórios numa
+coleção temporária em um diretório temporário (não toca no índice real
+nem precisa do Ollama).
+
+Uso (a partir de backend/):
+    python -m scripts_aux.bench_backends --docs 20000 --queries 200
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+BENCH_COLLECTION = "bench_backends"
+
+
+def _run_one(docs: int, dim: int, queries: int) -> dict:
+    """Executado dentro do subprocesso (VECTOR_BACKEND já definido no ambiente)."""
+    import resource
+    import numpy as np
+    from rag import vectordb
+
+    rng = np.random.default_rng(42)
+    vecs = rng.standard_normal((docs, dim), dtype=np.float32)
+
+    vectordb.reset_collection(BENCH_COLLECTION)
+    col = vectordb.get_collection(BENCH_COLLECTION)
+    t0 = time.perf_counter()
+    step = 5000
+    for i in range(0, docs, step):
+        col.add(
+            ids=[f"b-{j}" for j in range(i, min(i + step, docs))],
+            documents=[f"doc {j}" for j in range(i, min(i + step, docs))],
+            embeddings=vecs[i : i + step].tolist(),
+        )
+    index_s = time.perf_counter() - t0
+
+    lat = []
+    for q in rng.standard_normal((queries, dim), dtype=np.float32):
+        t0 = time.perf_counter()
+        col.query(query_embeddings=[q.tolist()], n_results=6)
+        lat.append((time.perf_counter() - t0) * 1000)
+    lat.sort()
+
+    return {
+        "backend": vectordb.VECTOR_BACKEND,
+        "index_seconds": round(index_s, 3),
+        "query_p50_ms": round(lat[len(lat) // 2], 3),
+        "query_p95_ms": round(lat[int(0.95 * (len(lat) - 1))], 3),
+        # ru_maxrss vem em KiB no Linux
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark das engines vetoriais.")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--backends", default="chroma,numpy,hnsw")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_run_one(args.docs, args.dim, args.queries)))
+        return
+
+    for backend in args.backends.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, VECTOR_BACKEND=backend, CHROMA_DIR=tmp)
+            proc = subprocess.run(
+                [sys.executable, "-m", "scripts_aux.bench_backends", "--child",
+                 "--docs", str(args.docs), "--dim", str(args.dim), "--queries", str(args.queries)],
+                env=env, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f"{backend:<7} falhou: {proc.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(
+                f"{r['backend']:<7} indexação={r['index_seconds']:7.2f} s  "
+                f"p50={r['query_p50_ms']:7.3f} ms  p95={r['query_p95_ms']:7.3f} ms  "
+                f"RSS={r['max_rss_mb']:7.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
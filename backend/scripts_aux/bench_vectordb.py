@@ -0,0 +1,75 @@
+# scripts_aux/bench_vectordb.py
+"""
+Mede o custo por consulta do acesso ao Chroma:
+- antes: cliente + coleção criados a cada chamada (comportamento antigo)
+- depois: cliente + coleção vindos do registro do processo
+
+Usa vetores aleatórios numa coleção temporária, então não precisa do Ollama.
+
+Uso (a partir de backend/):
+    python -m scripts_aux.bench_vectordb --n 200
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from rag import vectordb
+
+BENCH_COLLECTION = "bench_registry"
+
+
+def _timeit(fn, n: int) -> list[float]:
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def _report(name: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(0.95 * (len(samples) - 1))]
+    print(f"{name:<28} média={statistics.mean(samples):8.3f} ms  p50={statistics.median(samples):8.3f} ms  p95={p95:8.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark do registro de clientes Chroma.")
+    parser.add_argument("--n", type=int, default=200, help="Consultas por cenário.")
+    parser.add_argument("--docs", type=int, default=500, help="Documentos na coleção temporária.")
+    parser.add_argument("--dim", type=int, default=768, help="Dimensão dos vetores.")
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    vecs = [[rnd.random() for _ in range(args.dim)] for _ in range(args.docs)]
+    vectordb.reset_collection(BENCH_COLLECTION)
+    col = vectordb.get_collection(BENCH_COLLECTION)
+    col.add(
+        ids=[f"b-{i}" for i in range(args.docs)],
+        documents=[f"doc {i}" for i in range(args.docs)],
+        embeddings=vecs,
+    )
+    qvec = vecs[0]
+
+    def before():
+        client = vectordb._new_client()
+        c = client.get_or_create_collection(
+            name=BENCH_COLLECTION, embedding_function=None, metadata={"hnsw:space": "cosine"}
+        )
+        c.query(query_embeddings=[qvec], n_results=6)
+
+    def after():
+        vectordb.get_collection(BENCH_COLLECTION).query(query_embeddings=[qvec], n_results=6)
+
+    try:
+        _report("antes (cliente por chamada)", _timeit(before, args.n))
+        _report("depois (registro)", _timeit(after, args.n))
+    finally:
+        vectordb.get_client().delete_collection(BENCH_COLLECTION)
+        vectordb.close_vectordb()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,65 @@
+# scripts_aux/pdfmaker.py
+"""
+Gera os PDFs do corpus de notícias (um PDF por notícia; no .txt de
+entrada as notícias são separadas por uma linha em branco).
+
+Sem argumentos, pergunta o tipo e o arquivo (modo interativo). Com
+argumentos, roda em lote: lista a pasta de saída uma vez só para achar o
+próximo número, numera tudo de antemão, gera os PDFs num pool de
+processos e grava um manifesto CSV (title,text,label,source) que o
+ingest.py lê direto, sem extrair texto dos PDFs. O manifesto fica fora
+das pastas rotuladas (padrão: Data/manifestos/<pasta do tipo>.csv); use-o
+com --no-pdf, senão as mesmas notícias entram pelo CSV e pelos PDFs.
+
+Uso (a partir de backend/):
+    python scripts_aux/pdfmaker.py
+    python scripts_aux/pdfmaker.py --tipo f noticias_falsas.txt
+    python scripts_aux/pdfmaker.py --tipo v a.txt b.txt --saida Data/noticias_verdadeiras --workers 8
+    SEED_CSV_PATH=Data/manifestos/noticias_verdadeiras.csv python ingest.py --no-pdf
+"""
+
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import mm
 import os
 import re
+import csv
+import sys
+import argparse
 import textwrap
+from concurrent.futures import ProcessPoolExecutor
+
+PASTA_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data")
+# tipo -> (pasta dentro de Data, prefixo do arquivo, rótulo)
+TIPOS = {
+    "f": ("noticias_falsas", "noticia_falsa_", "FALSA"),
+    "v": ("noticias_verdadeiras", "noticia_verdadeira_", "VERDADEIRA"),
+}
+# manifestos ficam fora de Data/noticias_* (que o ingest varre atrás de PDFs)
+PASTA_MANIFESTOS = os.path.join(PASTA_DATA, "manifestos")
+TITULO_MAX = 100
 
-def criar_pdf(texto, pasta_pdf, prefixo):
-    if not os.path.exists(pasta_pdf):
-        os.makedirs(pasta_pdf)
 
-    # Determina próximo número
-    arquivos = os.listdir(pasta_pdf)
+def proximo_numero(pasta_pdf, prefixo):
+    """Maior número já usado com esse prefixo na pasta + 1."""
+    if not os.path.isdir(pasta_pdf):
+        return 1
+    padrao = re.compile(rf"{re.escape(prefixo)}(\d+)\.pdf")
     numeros = []
-    for arquivo in arquivos:
-        match = re.match(rf"{prefixo}(\d+)\.pdf", arquivo)
+    for arquivo in os.listdir(pasta_pdf):
+        match = padrao.fullmatch(arquivo)
         if match:
             numeros.append(int(match.group(1)))
-    proximo_numero = max(numeros, default=0) + 1
+    return max(numeros, default=0) + 1
 
-    caminho_pdf = os.path.join(pasta_pdf, f"{prefixo}{proximo_numero}.pdf")
 
+def _render_pdf(caminho_pdf, texto):
     # Cria PDF
     largura, altura = A4
     pdf = canvas.Canvas(caminho_pdf, pagesize=A4)
 
     # Configuração
     margem = 20 * mm
-    largura_util = largura - 2 * margem
     altura_inicial = altura - margem
     espacamento_linha = 12
 
@@ -45,30 +78,126 @@ def criar_pdf(texto, pasta_pdf, prefixo):
         y -= espacamento_linha
 
     pdf.save()
+    return caminho_pdf
+
+
+def _render_tarefa(tarefa):
+    """Roda nos processos do pool: (caminho, texto) -> (caminho, erro)."""
+    caminho_pdf, texto = tarefa
+    try:
+        _render_pdf(caminho_pdf, texto)
+        return caminho_pdf, None
+    except Exception as e:
+        return caminho_pdf, f"{type(e).__name__}: {e}"
+
+
+def criar_pdf(texto, pasta_pdf, prefixo):
+    os.makedirs(pasta_pdf, exist_ok=True)
+    caminho_pdf = os.path.join(pasta_pdf, f"{prefixo}{proximo_numero(pasta_pdf, prefixo)}.pdf")
+    _render_pdf(caminho_pdf, texto)
     print(f"✅ PDF salvo em: '{caminho_pdf}'")
 
+
+def ler_noticias(arquivo_txt):
+    with open(arquivo_txt, "r", encoding="utf-8") as f:
+        conteudo = f.read()
+    return [n.strip() for n in conteudo.split("\n\n") if n.strip()]
+
+
+def _titulo(texto):
+    """Primeira frase (cortada), como o rag/pdf_corpus.py faz ao ler o PDF."""
+    texto = " ".join(texto.split())
+    primeira = texto.split(". ", 1)[0].strip()
+    if len(primeira) <= TITULO_MAX:
+        return primeira
+    return primeira[:TITULO_MAX].rsplit(" ", 1)[0] + "..."
+
+
+def gerar_pdfs_lote(arquivos_txt, tipo_noticia, pasta_pdf=None, workers=None, manifesto=None):
+    """
+    Gera um PDF por notícia de todos os arquivos, numerados a partir do
+    próximo número livre da pasta, e acrescenta uma linha por PDF gerado
+    ao manifesto CSV (criado com cabeçalho se ainda não existir).
+    Devolve o número de PDFs gerados.
+    """
+    pasta_tipo, prefixo, rotulo = TIPOS[tipo_noticia]
+    pasta_pdf = pasta_pdf or os.path.join(PASTA_DATA, pasta_tipo)
+    manifesto = manifesto or os.path.join(PASTA_MANIFESTOS, f"{pasta_tipo}.csv")
+    os.makedirs(pasta_pdf, exist_ok=True)
+
+    noticias = [n for arquivo in arquivos_txt for n in ler_noticias(arquivo)]
+    if not noticias:
+        print("⚠️ Nenhuma notícia encontrada.")
+        return 0
+
+    inicio = proximo_numero(pasta_pdf, prefixo)
+    tarefas = [
+        (os.path.join(pasta_pdf, f"{prefixo}{inicio + i}.pdf"), noticia)
+        for i, noticia in enumerate(noticias)
+    ]
+    textos = dict(tarefas)
+
+    workers = max(1, min(workers or os.cpu_count() or 2, len(tarefas)))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(_render_tarefa, tarefas, chunksize=max(1, len(tarefas) // (workers * 4))))
+    else:
+        resultados = [_render_tarefa(t) for t in tarefas]
+
+    # source relativo à pasta Data (a pai da pasta dos PDFs), como no ingest dos PDFs
+    base = os.path.dirname(os.path.abspath(pasta_pdf))
+    novo = not os.path.exists(manifesto) or os.path.getsize(manifesto) == 0
+    os.makedirs(os.path.dirname(os.path.abspath(manifesto)), exist_ok=True)
+    gerados = 0
+    with open(manifesto, "a", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        if novo:
+            writer.writerow(["title", "text", "label", "source"])
+        for caminho_pdf, erro in resultados:
+            if erro is not None:
+                print(f"⚠️ Falha ao gerar '{caminho_pdf}': {erro}")
+                continue
+            texto = " ".join(textos[caminho_pdf].split())
+            source = os.path.relpath(os.path.abspath(caminho_pdf), base).replace(os.sep, "/")
+            writer.writerow([_titulo(texto), texto, rotulo, source])
+            gerados += 1
+
+    fim = inicio + len(tarefas) - 1
+    print(f"✅ {gerados} PDFs salvos em '{pasta_pdf}' ({prefixo}{inicio} a {prefixo}{fim}).")
+    print(f"✅ Manifesto: '{manifesto}'")
+    return gerados
+
+
 # --- Função principal ---
 def gerar_pdfs_automatico(arquivo_txt, tipo_noticia):
-    if tipo_noticia == "f":
-        pasta_pdf = r"C:\Users\davin\Desktop\DevPast\AletheIA\Dataset\noticias_falsas"
-        prefixo = "noticia_falsa_"
-    elif tipo_noticia == "v":
-        pasta_pdf = r"C:\Users\davin\Desktop\DevPast\AletheIA\Dataset\noticias_verdadeiras"
-        prefixo = "noticia_verdadeira_"
-    else:
+    if tipo_noticia not in TIPOS:
         print("Opção inválida! Use 'f' ou 'v'.")
         return
 
-    with open(arquivo_txt, "r", encoding="utf-8") as f:
-        conteudo = f.read()
+    pasta_tipo, prefixo, _ = TIPOS[tipo_noticia]
+    pasta_pdf = os.path.join(PASTA_DATA, pasta_tipo)
 
-    noticias = [n.strip() for n in conteudo.split("\n\n") if n.strip()]
-
-    for noticia in noticias:
+    for noticia in ler_noticias(arquivo_txt):
         criar_pdf(noticia, pasta_pdf, prefixo)
 
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera PDFs de notícias em lote (um PDF por notícia).")
+    parser.add_argument("entrada", nargs="+", help="Arquivo(s) .txt com as notícias separadas por linha em branco.")
+    parser.add_argument("--tipo", choices=sorted(TIPOS), required=True, help="f = notícia falsa, v = verdadeira.")
+    parser.add_argument("--saida", default=None, help="Pasta dos PDFs (padrão: Data/noticias_falsas ou Data/noticias_verdadeiras).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Processos para gerar os PDFs.")
+    parser.add_argument("--manifesto", default=None, help="CSV de saída (padrão: Data/manifestos/noticias_falsas.csv ou noticias_verdadeiras.csv; acrescenta se existir).")
+    args = parser.parse_args(argv)
+
+    gerar_pdfs_lote(args.entrada, args.tipo, args.saida, args.workers, args.manifesto)
+
+
 # --- Entrada do usuário ---
 if __name__ == "__main__":
-    tipo = input("Digite 'f' para NOTÍCIA FALSA ou 'v' para NOTÍCIA VERDADEIRA:\n").lower()
-    arquivo_txt = input("Digite o caminho completo do arquivo .txt com as notícias:\n")
-    gerar_pdfs_automatico(arquivo_txt, tipo)
+    if len(sys.argv) > 1:
+        main()
+    else:
+        tipo = input("Digite 'f' para NOTÍCIA FALSA ou 'v' para NOTÍCIA VERDADEIRA:\n").lower()
+        arquivo_txt = input("Digite o caminho completo do arquivo .txt com as notícias:\n")
+        gerar_pdfs_automatico(arquivo_txt, tipo)
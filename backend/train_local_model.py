@@ -0,0 +1,83 @@
+# train_local_model.py
+"""
+Treina o classificador local (rag/local_model.py) com os mesmos dados
+que o ingest.py indexa: o CSV de seed (SEED_CSV_PATH), notícia inteira,
+com o rótulo da coluna 'label', e os PDFs rotulados pela pasta
+(rag/pdf_corpus.py).
+
+Os embeddings vêm do Ollama (EMBED_MODEL) e passam pelo cache de
+embeddings, então retreinar depois de uma ingestão quase não custa nada.
+O artefato é gravado em LOCAL_MODEL_PATH (joblib comprimido) e a API o
+carrega no startup.
+
+Uso:
+    python train_local_model.py
+    python train_local_model.py --out db/local_classifier.joblib --holdout 0.2
+    python train_local_model.py --no-pdf
+"""
+
+import os
+import json
+import argparse
+
+from dotenv import load_dotenv
+
+from ingest import CSV_PATH, iter_seed_csv, _clean
+from rag.local_model import LOCAL_MODEL_PATH, save_local_model, train_local_model
+from rag.pdf_corpus import PDF_DATA_DIR, PDF_WORKERS, extract_pdf_text, pdf_process_pool, scan_pdfs
+
+load_dotenv()
+
+
+def _pdf_text(path: str) -> str:
+    try:
+        return extract_pdf_text(path)
+    except Exception as e:
+        print(f"⚠️ PDF ignorado ({path}): {e}")
+        return ""
+
+
+def load_training_data(csv_path: str = CSV_PATH, pdf_root: str | None = PDF_DATA_DIR):
+    texts, labels = [], []
+    for df in iter_seed_csv(csv_path):
+        for row in df.to_dict("records"):
+            text = _clean(row["text"])
+            if text:
+                texts.append(text)
+                labels.append(_clean(row.get("label", "")))
+
+    files = scan_pdfs(pdf_root) if pdf_root else []
+    if files:
+        paths = [os.path.join(pdf_root, rel) for rel, _ in files]
+        with pdf_process_pool(max(1, min(PDF_WORKERS, len(paths)))) as pool:
+            for (_, label), text in zip(files, pool.map(_pdf_text, paths, chunksize=8)):
+                if text:
+                    texts.append(text)
+                    labels.append(label)
+    return texts, labels
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Treina o classificador local (TF-IDF + embeddings).")
+    parser.add_argument("--csv", default=CSV_PATH, help=f"CSV de treino (padrão: {CSV_PATH}).")
+    parser.add_argument("--pdf-dir", default=PDF_DATA_DIR, help=f"Pasta dos PDFs rotulados (padrão: {PDF_DATA_DIR}).")
+    parser.add_argument("--no-pdf", action="store_true", help="Treina só com o CSV.")
+    parser.add_argument("--out", default=LOCAL_MODEL_PATH, help=f"Arquivo do modelo (padrão: {LOCAL_MODEL_PATH}).")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fração separada para medir a acurácia.")
+    args = parser.parse_args(argv)
+
+    print(f"Lendo dados de treino de: {args.csv}")
+    texts, labels = load_training_data(args.csv, None if args.no_pdf else args.pdf_dir)
+    print(f"Exemplos: {len(texts)}")
+
+    artifact = train_local_model(texts, labels, holdout=args.holdout)
+    path = save_local_model(artifact, args.out)
+
+    if artifact["metrics"]:
+        print("Validação:", json.dumps(artifact["metrics"], ensure_ascii=False))
+    size_kb = os.path.getsize(path) / 1024
+    print(f"✅ Modelo salvo em {path} ({size_kb:.0f} KB, {artifact['n_train']} exemplos).")
+
+
+if __name__ == "__main__":
+    main()
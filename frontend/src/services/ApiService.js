@@ -15,10 +15,11 @@ export default {
   /**
    * Envia o texto da notícia para o backend para verificação.
    * @param {string} newsText - O texto a ser verificado.
+   * @param {string} mode - "rag" (base local, padrão), "web" (base local + busca na web) ou "llm" (só o LLM).
    * @returns {Promise<Object>} A resposta da API
    */
-  checkNews(newsText) {
-    return apiClient.post('/verify', { text: newsText });
+  checkNews(newsText, mode = 'rag') {
+    return apiClient.post('/verify', { text: newsText, mode });
   },
 
   /**